@@ -2,88 +2,285 @@
 
 import { useState, useRef, useEffect } from 'react'
 
+type Transcription = {
+  id: string
+  timestamp: string
+  rawText: string
+  cleanedText: string
+  source?: string
+}
+
+const DEMO_TRANSCRIPTION: Transcription = {
+  id: '1',
+  timestamp: '2:47 PM',
+  rawText: 'Click the microphone to start real transcription with Whisper',
+  cleanedText: 'Click the microphone to start real transcription with Whisper.',
+  source: 'demo'
+}
+
+type CaptureFormat = {
+  encoding: 'pcm' | 'opus'
+  sample_rate: number
+  bitrate?: number
+}
+
+// Used until GET /capture-format answers: 16 kHz mono PCM is what Whisper consumes
+const DEFAULT_CAPTURE_FORMAT: CaptureFormat = { encoding: 'pcm', sample_rate: 16000 }
+
+// Forwards raw microphone samples (Float32Array per 128-frame render quantum) to the page
+const PCM_CAPTURE_WORKLET = `
+class PcmCapture extends AudioWorkletProcessor {
+  process(inputs) {
+    const channel = inputs[0] && inputs[0][0]
+    if (channel) {
+      this.port.postMessage(channel.slice(0))
+    }
+    return true
+  }
+}
+registerProcessor('pcm-capture', PcmCapture)
+`
+
+const supportsPcmCapture = () =>
+  typeof AudioContext !== 'undefined' && typeof AudioWorkletNode !== 'undefined'
+
+const supportsOpusCapture = () =>
+  typeof MediaRecorder !== 'undefined' && MediaRecorder.isTypeSupported('audio/webm;codecs=opus')
+
+const HISTORY_LIMIT = 50
+const HISTORY_POLL_MS = 10000  // Fallback delta polling while the event stream is down
+
 export default function WisprInterface() {
   const [isRecording, setIsRecording] = useState(false)
   const [isProcessing, setIsProcessing] = useState(false)
   const [error, setError] = useState<string | null>(null)
-  const [transcriptions, setTranscriptions] = useState<Array<{
-    id: string
-    timestamp: string
-    rawText: string
-    cleanedText: string
-    source?: string
-  }>>([
-    {
-      id: '1',
-      timestamp: '2:47 PM',
-      rawText: 'Click the microphone to start real transcription with Whisper',
-      cleanedText: 'Click the microphone to start real transcription with Whisper.',
-      source: 'demo'
-    }
-  ])
+  const [transcriptions, setTranscriptions] = useState<Transcription[]>([DEMO_TRANSCRIPTION])
+  const [searchQuery, setSearchQuery] = useState('')
+  const [searchResults, setSearchResults] = useState<Transcription[] | null>(null)
+  const [searchNextBefore, setSearchNextBefore] = useState<string | null>(null)
 
-  const mediaRecorderRef = useRef<MediaRecorder | null>(null)
-  const audioChunksRef = useRef<Blob[]>([])
+  const captureFormatRef = useRef<CaptureFormat>(DEFAULT_CAPTURE_FORMAT)
+  const stopCaptureRef = useRef<(() => Promise<void>) | null>(null)
+  const streamSessionRef = useRef<string | null>(null)
+  const streamUploadRef = useRef<Promise<void>>(Promise.resolve())
+  const historyCursorRef = useRef<number | null>(null)
+  const historyEtagRef = useRef<string | null>(null)
+  const eventsConnectedRef = useRef(false)
+
+  // Pick the backend's preferred capture format, or its compressed alternative on a slow link
+  const negotiateCaptureFormat = async () => {
+    try {
+      const response = await fetch('http://localhost:5001/capture-format')
+      if (!response.ok) {
+        return
+      }
+      const result = await response.json()
+      const formats: CaptureFormat[] = [result.preferred, ...(result.alternatives || [])]
+      // Network Information API (Chromium only); downlink is in Mbps
+      const downlinkKbps = (navigator as any).connection?.downlink * 1000
+      const slowLink = downlinkKbps > 0 && downlinkKbps < result.slow_link_kbps
+      const usable = formats.filter(fmt => fmt.encoding === 'pcm' ? supportsPcmCapture() : supportsOpusCapture())
+      const chosen = slowLink
+        ? usable.find(fmt => fmt.encoding !== 'pcm') ?? usable[0]
+        : usable[0]
+      if (chosen) {
+        captureFormatRef.current = chosen
+      }
+    } catch (err) {
+      console.warn('Capture format negotiation failed, using defaults:', err)
+    }
+  }
 
   const startRecording = async () => {
     try {
       setError(null)
+      const format = captureFormatRef.current
       const stream = await navigator.mediaDevices.getUserMedia({ 
         audio: {
           echoCancellation: true,
           noiseSuppression: true,
-          sampleRate: 8000,  // Lower sample rate for faster processing
+          sampleRate: format.sample_rate,  // Negotiated with the backend (16 kHz for PCM)
           channelCount: 1,   // Mono audio
           autoGainControl: true
         } 
       })
       
-      const mediaRecorder = new MediaRecorder(stream, {
-        mimeType: 'audio/webm;codecs=opus'
-      })
+      if (format.encoding === 'pcm') {
+        try {
+          await startPcmRecording(stream, format.sample_rate)
+          setIsRecording(true)
+          return
+        } catch (err) {
+          // e.g. the browser can't resample the microphone to this rate
+          console.warn('PCM capture unavailable, falling back to opus:', err)
+        }
+      }
+      await startOpusRecording(stream)
+      setIsRecording(true)
       
-      mediaRecorderRef.current = mediaRecorder
-      audioChunksRef.current = []
+    } catch (err) {
+      console.error('Error starting recording:', err)
+      setError('Microphone access denied. Please allow microphone permissions.')
+    }
+  }
+
+  // Raw 16-bit PCM at the backend's rate: nothing for the server to decode or resample
+  const startPcmRecording = async (stream: MediaStream, sampleRate: number) => {
+    const context = new AudioContext({ sampleRate })
+    try {
+      const moduleUrl = URL.createObjectURL(new Blob([PCM_CAPTURE_WORKLET], { type: 'application/javascript' }))
+      await context.audioWorklet.addModule(moduleUrl)
+      URL.revokeObjectURL(moduleUrl)
+      const source = context.createMediaStreamSource(stream)
+      const node = new AudioWorkletNode(context, 'pcm-capture')
+      
+      const recorded: Int16Array[] = []
+      let pending: Int16Array[] = []
+      let pendingSamples = 0
+      streamSessionRef.current = await startStreamSession({ format: 'pcm', sample_rate: context.sampleRate })
+      streamUploadRef.current = Promise.resolve()
       
-      mediaRecorder.ondataavailable = (event) => {
-        if (event.data.size > 0) {
-          audioChunksRef.current.push(event.data)
+      const flush = () => {
+        if (pendingSamples === 0) {
+          return
         }
+        const chunk = new Blob(pending)
+        pending = []
+        pendingSamples = 0
+        // Upload chunks in order while the user is still speaking
+        streamUploadRef.current = streamUploadRef.current.then(() => sendStreamChunk(chunk))
       }
       
-      mediaRecorder.onstop = async () => {
-        const audioBlob = new Blob(audioChunksRef.current, { type: 'audio/webm' })
-        await sendAudioToBackend(audioBlob)
-        
-        // Clean up stream
-        stream.getTracks().forEach(track => track.stop())
+      node.port.onmessage = (event: MessageEvent<Float32Array>) => {
+        const samples = event.data
+        const pcm = new Int16Array(samples.length)
+        for (let i = 0; i < samples.length; i++) {
+          const s = Math.max(-1, Math.min(1, samples[i]))
+          pcm[i] = s < 0 ? s * 0x8000 : s * 0x7fff
+        }
+        recorded.push(pcm)
+        pending.push(pcm)
+        pendingSamples += pcm.length
+        // Same 500ms cadence as the MediaRecorder path
+        if (pendingSamples >= context.sampleRate / 2) {
+          flush()
+        }
       }
+      source.connect(node)
+      node.connect(context.destination)  // Keeps the node pulled; it outputs silence
       
-      mediaRecorder.start()
-      setIsRecording(true)
-      
+      stopCaptureRef.current = async () => {
+        source.disconnect()
+        node.disconnect()
+        flush()
+        await context.close()
+        stream.getTracks().forEach(track => track.stop())
+        
+        await streamUploadRef.current
+        if (streamSessionRef.current) {
+          await finishStreamSession(streamSessionRef.current)
+        } else {
+          await sendAudioToBackend(new Blob(recorded, { type: 'audio/pcm' }), context.sampleRate)
+        }
+      }
     } catch (err) {
-      console.error('Error starting recording:', err)
-      setError('Microphone access denied. Please allow microphone permissions.')
+      await context.close()
+      throw err
     }
   }
 
+  // Compressed opus in webm: smallest upload, but the backend has to decode it
+  const startOpusRecording = async (stream: MediaStream) => {
+    const mediaRecorder = new MediaRecorder(stream, {
+      mimeType: 'audio/webm;codecs=opus',
+      audioBitsPerSecond: captureFormatRef.current.bitrate
+    })
+    
+    const audioChunks: Blob[] = []
+    streamSessionRef.current = await startStreamSession({ format: 'webm' })
+    streamUploadRef.current = Promise.resolve()
+    
+    mediaRecorder.ondataavailable = (event) => {
+      if (event.data.size > 0) {
+        audioChunks.push(event.data)
+        // Upload chunks in order while the user is still speaking
+        const chunk = event.data
+        streamUploadRef.current = streamUploadRef.current.then(() => sendStreamChunk(chunk))
+      }
+    }
+    
+    const stopped = new Promise<void>(resolve => { mediaRecorder.onstop = () => resolve() })
+    stopCaptureRef.current = async () => {
+      mediaRecorder.stop()
+      await stopped
+      await streamUploadRef.current
+      if (streamSessionRef.current) {
+        await finishStreamSession(streamSessionRef.current)
+      } else {
+        const audioBlob = new Blob(audioChunks, { type: 'audio/webm' })
+        await sendAudioToBackend(audioBlob)
+      }
+      
+      // Clean up stream
+      stream.getTracks().forEach(track => track.stop())
+    }
+    
+    // Emit a chunk every 500ms so the backend can transcribe incrementally
+    mediaRecorder.start(500)
+  }
+
   const stopRecording = () => {
-    if (mediaRecorderRef.current && isRecording) {
-      mediaRecorderRef.current.stop()
+    if (stopCaptureRef.current && isRecording) {
+      const stopCapture = stopCaptureRef.current
+      stopCaptureRef.current = null
       setIsRecording(false)
       setIsProcessing(true)
+      stopCapture()
     }
   }
 
-  const sendAudioToBackend = async (audioBlob: Blob) => {
+  const startStreamSession = async (options: { format: string, sample_rate?: number }): Promise<string | null> => {
     try {
-      const formData = new FormData()
-      formData.append('audio', audioBlob, 'recording.webm')
-      
-      const response = await fetch('http://localhost:5001/transcribe', {
+      const response = await fetch('http://localhost:5001/transcribe/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(options),
+      })
+      if (!response.ok) {
+        return null
+      }
+      const result = await response.json()
+      return result.session_id || null
+    } catch (err) {
+      console.warn('Streaming unavailable, will upload on stop:', err)
+      return null
+    }
+  }
+
+  const sendStreamChunk = async (chunk: Blob) => {
+    const sessionId = streamSessionRef.current
+    if (!sessionId) {
+      return
+    }
+    try {
+      const response = await fetch(`http://localhost:5001/transcribe/stream/${sessionId}`, {
+        method: 'POST',
+        body: chunk,
+      })
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`)
+      }
+    } catch (err) {
+      // Fall back to uploading the full recording on stop
+      console.warn('Streaming chunk failed, will upload on stop:', err)
+      streamSessionRef.current = null
+    }
+  }
+
+  const finishStreamSession = async (sessionId: string) => {
+    try {
+      const response = await fetch(`http://localhost:5001/transcribe/stream/${sessionId}/finish`, {
         method: 'POST',
-        body: formData,
       })
       
       if (!response.ok) {
@@ -93,7 +290,45 @@ export default function WisprInterface() {
       const result = await response.json()
       
       if (result.success) {
-        // Transcription is now automatically stored in backend and will be fetched by polling
+        console.log('Transcription successful:', result.cleaned_text)
+        setTimeout(fetchTranscriptions, 500)
+      } else {
+        setError(result.error || 'Transcription failed')
+      }
+    } catch (err) {
+      console.error('Error finishing streamed transcription:', err)
+      setError('Failed to connect to transcription service. Make sure the backend is running.')
+    } finally {
+      setIsProcessing(false)
+    }
+  }
+
+  // Upload a whole recording: raw PCM in the body when sampleRate is given, else a webm file
+  const sendAudioToBackend = async (audioBlob: Blob, sampleRate?: number) => {
+    try {
+      let request: RequestInit
+      if (sampleRate) {
+        request = {
+          method: 'POST',
+          headers: { 'Content-Type': 'audio/pcm', 'X-Sample-Rate': String(sampleRate) },
+          body: audioBlob,
+        }
+      } else {
+        const formData = new FormData()
+        formData.append('audio', audioBlob, 'recording.webm')
+        request = { method: 'POST', body: formData }
+      }
+      
+      const response = await fetch('http://localhost:5001/transcribe', request)
+      
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`)
+      }
+      
+      const result = await response.json()
+      
+      if (result.success) {
+        // Transcription is now automatically stored in backend and pushed over the history event stream
         console.log('Transcription successful:', result.cleaned_text)
         // Immediately fetch updated transcriptions
         setTimeout(fetchTranscriptions, 500)
@@ -116,26 +351,42 @@ export default function WisprInterface() {
     }
   }
 
+  // Apply a history snapshot (reset) or a delta of added/changed entries
+  const applyTranscriptions = (incoming: Transcription[], reset: boolean) => {
+    setTranscriptions(prev => {
+      const byId = new Map<string, Transcription>()
+      if (!reset) {
+        prev.filter(t => t.source !== 'demo').forEach(t => byId.set(t.id, t))
+      }
+      incoming.forEach(t => byId.set(t.id, t))
+      const merged = Array.from(byId.values())
+        .sort((a, b) => Number(b.id) - Number(a.id))
+        .slice(0, HISTORY_LIMIT)
+      // Keep the demo transcription if no real ones exist
+      return merged.length > 0 ? merged : [DEMO_TRANSCRIPTION]
+    })
+  }
+
   const fetchTranscriptions = async () => {
     try {
-      const response = await fetch('http://localhost:5001/transcriptions')
+      const cursor = historyCursorRef.current
+      const url = cursor === null
+        ? `http://localhost:5001/transcriptions?limit=${HISTORY_LIMIT}`
+        : `http://localhost:5001/transcriptions?since=${cursor}&limit=${HISTORY_LIMIT}`
+      const headers: Record<string, string> = {}
+      if (historyEtagRef.current) {
+        headers['If-None-Match'] = historyEtagRef.current
+      }
+      const response = await fetch(url, { headers })
+      if (response.status === 304) {
+        return  // Nothing changed since the last sync
+      }
       if (response.ok) {
         const result = await response.json()
         if (result.success && result.transcriptions) {
-          // Filter out demo transcription and add it back if no real transcriptions exist
-          const realTranscriptions = result.transcriptions
-          if (realTranscriptions.length === 0) {
-            // Keep the demo transcription if no real ones exist
-            setTranscriptions([{
-              id: '1',
-              timestamp: '2:47 PM',
-              rawText: 'Click the microphone to start real transcription with Whisper',
-              cleanedText: 'Click the microphone to start real transcription with Whisper.',
-              source: 'demo'
-            }])
-          } else {
-            setTranscriptions(realTranscriptions)
-          }
+          applyTranscriptions(result.transcriptions, result.reset)
+          historyCursorRef.current = result.cursor
+          historyEtagRef.current = response.headers.get('ETag')
         }
       }
     } catch (err) {
@@ -143,6 +394,38 @@ export default function WisprInterface() {
     }
   }
 
+  // Server-side full-text search; `before` continues from the previous page
+  const searchTranscriptions = async (query: string, before: string | null = null) => {
+    try {
+      const params = new URLSearchParams({ q: query, limit: String(HISTORY_LIMIT) })
+      if (before) {
+        params.set('before', before)
+      }
+      const response = await fetch(`http://localhost:5001/transcriptions?${params}`)
+      if (response.ok) {
+        const result = await response.json()
+        if (result.success && result.transcriptions) {
+          setSearchResults(prev => before && prev ? [...prev, ...result.transcriptions] : result.transcriptions)
+          setSearchNextBefore(result.next_before)
+        }
+      }
+    } catch (err) {
+      console.error('Error searching transcriptions:', err)
+    }
+  }
+
+  // Debounce typing so each keystroke doesn't hit the server
+  useEffect(() => {
+    const query = searchQuery.trim()
+    if (!query) {
+      setSearchResults(null)
+      setSearchNextBefore(null)
+      return
+    }
+    const timeout = setTimeout(() => searchTranscriptions(query), 250)
+    return () => clearTimeout(timeout)
+  }, [searchQuery])
+
   const clearHistory = async () => {
     try {
       const response = await fetch('http://localhost:5001/clear-history', {
@@ -164,11 +447,53 @@ export default function WisprInterface() {
     }
   }
 
-  // Poll for new transcriptions every 2 seconds
   useEffect(() => {
-    fetchTranscriptions() // Initial fetch
-    const interval = setInterval(fetchTranscriptions, 2000)
-    return () => clearInterval(interval)
+    negotiateCaptureFormat()
+  }, [])
+
+  // Sync history: one snapshot, then pushed changes over SSE (delta polling as fallback)
+  useEffect(() => {
+    let events: EventSource | null = null
+    let cancelled = false
+
+    const onTranscription = (event: MessageEvent) => {
+      const data = JSON.parse(event.data)
+      applyTranscriptions([data.transcription], false)
+      historyCursorRef.current = data.cursor
+      historyEtagRef.current = null
+    }
+    const onReset = (event: MessageEvent) => {
+      const data = JSON.parse(event.data)
+      applyTranscriptions(data.transcriptions, true)
+      historyCursorRef.current = data.cursor
+      historyEtagRef.current = null
+    }
+
+    fetchTranscriptions().then(() => {
+      if (cancelled || typeof EventSource === 'undefined') {
+        return
+      }
+      const since = historyCursorRef.current ?? 0
+      events = new EventSource(`http://localhost:5001/transcriptions/events?since=${since}&limit=${HISTORY_LIMIT}`)
+      events.addEventListener('transcription', onTranscription as EventListener)
+      events.addEventListener('reset', onReset as EventListener)
+      events.onopen = () => { eventsConnectedRef.current = true }
+      // EventSource reconnects on its own (resuming from Last-Event-ID); poll meanwhile
+      events.onerror = () => { eventsConnectedRef.current = false }
+    })
+
+    const interval = setInterval(() => {
+      if (!eventsConnectedRef.current) {
+        fetchTranscriptions()
+      }
+    }, HISTORY_POLL_MS)
+
+    return () => {
+      cancelled = true
+      clearInterval(interval)
+      events?.close()
+      eventsConnectedRef.current = false
+    }
   }, [])
 
   return (
@@ -291,11 +616,21 @@ export default function WisprInterface() {
               )}
             </div>
             <p className="text-sm font-normal text-white/70">Live updates from web interface and system-wide hotkey</p>
+            <input
+              type="search"
+              value={searchQuery}
+              onChange={(e) => setSearchQuery(e.target.value)}
+              placeholder="Search history..."
+              className="mt-4 w-full rounded-lg bg-white/10 px-4 py-2 text-sm font-normal text-white placeholder-white/50 outline-none focus:bg-white/20"
+            />
           </div>
 
           {/* Transcriptions List */}
           <div className="space-y-4">
-            {transcriptions.map((entry) => (
+            {searchResults !== null && searchResults.length === 0 && (
+              <p className="text-sm font-normal text-white/70">No transcriptions match "{searchQuery.trim()}"</p>
+            )}
+            {(searchResults ?? transcriptions).map((entry) => (
               <div key={entry.id} className="relative overflow-hidden rounded-xl">
                 <div className="absolute z-0 inset-0 backdrop-blur-lg glass-filter"></div>
                 <div className="z-10 absolute inset-0 bg-white/10"></div>
@@ -357,6 +692,14 @@ export default function WisprInterface() {
                 </div>
               </div>
             ))}
+            {searchResults !== null && searchNextBefore && (
+              <button
+                onClick={() => searchTranscriptions(searchQuery.trim(), searchNextBefore)}
+                className="w-full rounded-lg bg-white/10 py-2 text-sm font-semibold text-white/80 hover:bg-white/20"
+              >
+                Load more
+              </button>
+            )}
           </div>
 
           {/* Footer */}
@@ -0,0 +1,238 @@
+"""
+Admission control in front of Whisper inference.
+
+Every request that needs the model takes a slot first. At most `concurrency`
+units of work run at once (a clip is one unit, a long recording split into
+chunks is one per chunk); the rest wait in a bounded queue ordered by
+priority, hotkey dictations ahead of web uploads ahead of bulk work, then by
+arrival. Keeping the inference runner's own queue this short is what lets a
+dictation arriving behind a burst of uploads start next.
+
+A request is turned away (AdmissionRejected, answered with 429 and
+Retry-After) when its estimated wait exceeds what it can afford, or when the
+queue is full and nothing of lower priority can be evicted to make room, or
+when its priority already has as many requests queued as `queue_limits`
+allows (so a flood claiming the top priority can't take the whole queue).
+The estimate is the work queued ahead of it times a moving average of how
+long a slot is held. Waiting requests are cancelled (AdmissionCancelled)
+once their deadline passes or their client disconnects, so they never reach
+the model. Background jobs wait as long as it takes and are never rejected.
+"""
+import math
+import select
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+PRIORITIES = ('hotkey', 'web', 'bulk')  # Highest first
+
+POLL_SECONDS = 0.25  # How often waiting requests check their deadline and connection
+SERVICE_TIME_SMOOTHING = 0.2  # Weight of the newest slot hold time in the moving average
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request can't be queued; retry_after is in seconds"""
+
+    def __init__(self, message, reason, retry_after):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionCancelled(Exception):
+    """Raised when a queued request's deadline passes or its client goes away"""
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+
+def client_disconnected(environ):
+    """Whether the client of a WSGI request has closed its connection (False if unknown).
+
+    Only meaningful once the request body has been read: the socket is then
+    readable only when the peer closed it (or pipelined another request,
+    which peeking leaves in place).
+    """
+    sock = environ.get('gunicorn.socket') or environ.get('werkzeug.socket')
+    if sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b''
+    except (OSError, ValueError):  # ValueError: closed socket, or TLS sockets that can't peek
+        return False
+
+
+class _Waiter:
+    __slots__ = ('order', 'priority', 'cost', 'evictable', 'evicted', 'queued_at')
+
+    def __init__(self, order, priority, cost, evictable):
+        self.order = order  # (priority rank, arrival number)
+        self.priority = priority
+        self.cost = cost
+        self.evictable = evictable
+        self.evicted = False
+        self.queued_at = time.monotonic()
+
+
+class AdmissionController:
+    """Bounded priority queue of requests waiting for inference capacity"""
+
+    def __init__(self, concurrency, max_queued=32, max_wait=30.0, initial_service_time=1.0, queue_limits=None,
+                 metrics=None):
+        self.concurrency = max(1, concurrency)
+        self.max_queued = max_queued
+        self.queue_limits = queue_limits or {}  # priority -> most rejectable requests queued at once
+        self.max_wait = max_wait  # Longest estimated wait a rejectable request accepts (None = any)
+        self.service_time = initial_service_time  # Moving average of seconds a slot is held
+        self.metrics = metrics
+
+        self.cond = threading.Condition()
+        self.waiting = []  # _Waiters sorted by order
+        self.arrivals = 0
+        self.in_flight = 0
+        self.admitted = {priority: 0 for priority in PRIORITIES}
+        self.rejected = {}   # (priority, reason) -> count
+        self.cancelled = {}  # (priority, reason) -> count
+
+    @contextmanager
+    def slot(self, priority, cost=1, deadline=None, disconnected=None, reject=True):
+        """Hold `cost` units of inference capacity for the body of a with block.
+
+        deadline is a time.monotonic() value; disconnected() is polled while
+        waiting. With reject=False the request always queues (and is never
+        evicted), for work that has nobody to send a 429 to.
+        """
+        cost = self._admit(priority, min(max(1, cost), self.concurrency), deadline, disconnected, reject)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            held = time.monotonic() - started
+            with self.cond:
+                self.in_flight -= cost
+                self.service_time += SERVICE_TIME_SMOOTHING * (held - self.service_time)
+                self.cond.notify_all()
+
+    def estimated_wait(self, priority, cost=1):
+        """Seconds a request of this priority arriving now would wait for a slot"""
+        with self.cond:
+            return self._estimate(PRIORITIES.index(priority), cost)
+
+    def stats(self):
+        with self.cond:
+            queued = {priority: 0 for priority in PRIORITIES}
+            for waiter in self.waiting:
+                queued[waiter.priority] += 1
+            return {
+                'concurrency': self.concurrency,
+                'in_flight': self.in_flight,
+                'queue_depth': len(self.waiting),
+                'queued': queued,
+                'max_queued': self.max_queued,
+                'queue_limits': dict(self.queue_limits),
+                'service_time_ms': round(self.service_time * 1000, 1),
+                'estimated_wait_ms': {priority: round(self._estimate(rank, 1) * 1000, 1)
+                                      for rank, priority in enumerate(PRIORITIES)},
+                'admitted': dict(self.admitted),
+                'rejected': self._totals(self.rejected),
+                'cancelled': self._totals(self.cancelled)
+            }
+
+    def queue_depths(self):
+        """Waiting requests per priority, as gauge labels"""
+        with self.cond:
+            return {(('priority', priority),): sum(1 for w in self.waiting if w.priority == priority)
+                    for priority in PRIORITIES}
+
+    # ------------------------------------------------------------- internals
+
+    def _estimate(self, rank, cost):
+        # Units running or queued ahead of (or level with) this priority, served `concurrency` at a time
+        ahead = self.in_flight + sum(w.cost for w in self.waiting if w.order[0] <= rank)
+        return self.service_time * max(0, ahead + cost - self.concurrency) / self.concurrency
+
+    def _drain_time(self):
+        queued = self.in_flight + sum(w.cost for w in self.waiting)
+        return self.service_time * queued / self.concurrency
+
+    @staticmethod
+    def _totals(counts):
+        totals = {}
+        for (_, reason), count in counts.items():
+            totals[reason] = totals.get(reason, 0) + count
+        return totals
+
+    def _count(self, counts, name, priority, reason):
+        counts[(priority, reason)] = counts.get((priority, reason), 0) + 1
+        if self.metrics is not None:
+            self.metrics.inc(name, priority=priority, reason=reason)
+
+    def _reject(self, priority, reason, message, retry_after):
+        self._count(self.rejected, 'whisper_admission_rejected_total', priority, reason)
+        raise AdmissionRejected(message, reason, max(1, math.ceil(retry_after)))
+
+    def _cancel(self, waiter, reason, message):
+        self.waiting.remove(waiter)
+        self.cond.notify_all()  # The head of the queue may have changed
+        self._count(self.cancelled, 'whisper_admission_cancelled_total', waiter.priority, reason)
+        raise AdmissionCancelled(message, reason)
+
+    def _admit(self, priority, cost, deadline, disconnected, reject):
+        rank = PRIORITIES.index(priority)
+        with self.cond:
+            if not self.waiting and self.in_flight + cost <= self.concurrency:
+                self.in_flight += cost
+                self.admitted[priority] += 1
+                return cost
+
+            if reject:
+                limit = self.queue_limits.get(priority)
+                if limit is not None and sum(1 for w in self.waiting if w.priority == priority) >= limit:
+                    self._reject(priority, 'queue_full', f'Too many {priority} requests queued', self._drain_time())
+                # Lower priorities don't count towards the estimate, so it holds whether or not one is evicted
+                wait = self._estimate(rank, cost)
+                limits = [limit for limit in (self.max_wait, deadline and deadline - time.monotonic())
+                          if limit is not None]
+                if limits and wait > min(limits):
+                    self._reject(priority, 'overloaded',
+                                 f'Server is busy (estimated wait {wait:.0f}s)', wait)
+                if len(self.waiting) >= self.max_queued:
+                    # Only now that this request will queue: make room by evicting the newest
+                    # request of the lowest priority below this one
+                    victim = next((w for w in reversed(self.waiting) if w.evictable and w.order[0] > rank), None)
+                    if victim is None:
+                        self._reject(priority, 'queue_full', 'Transcription queue is full', self._drain_time())
+                    self.waiting.remove(victim)
+                    victim.evicted = True
+                    self.cond.notify_all()
+
+            self.arrivals += 1
+            waiter = _Waiter((rank, self.arrivals), priority, cost, reject)
+            self.waiting.append(waiter)
+            self.waiting.sort(key=lambda w: w.order)
+
+            while True:
+                if waiter.evicted:
+                    self._reject(priority, 'evicted', 'Displaced from the transcription queue by more urgent requests',
+                                 self._drain_time())
+                if self.waiting[0] is waiter and self.in_flight + cost <= self.concurrency:
+                    self.waiting.pop(0)
+                    self.in_flight += cost
+                    self.admitted[priority] += 1
+                    if self.metrics is not None:
+                        self.metrics.observe('whisper_admission_wait_seconds', time.monotonic() - waiter.queued_at,
+                                             priority=priority)
+                    self.cond.notify_all()  # The next waiter may fit too
+                    return cost
+                timeout = POLL_SECONDS
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._cancel(waiter, 'deadline', 'Request deadline passed while queued')
+                    timeout = min(timeout, remaining)
+                if disconnected is not None and disconnected():
+                    self._cancel(waiter, 'disconnected', 'Client disconnected while queued')
+                self.cond.wait(timeout)
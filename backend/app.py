@@ -1,191 +1,1122 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
+from werkzeug.exceptions import RequestEntityTooLarge
 import whisper
-import tempfile
 import os
 import logging
-import requests
 import json
-import datetime
+import re
 import threading
+import time
+import uuid
+import hashlib
+import hmac
+import multiprocessing
+import datetime
+import math
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+
+from admission import AdmissionCancelled, AdmissionController, AdmissionRejected, client_disconnected
+from metrics import Metrics, RequestTimer
+from model_manager import ModelManager
+from cache import ResultCache, make_key
+from cleanup_client import CleanupClient
+from engines import available_engines
+from jobs import JobQueue, JobQueueFull, group_text
+from long_audio import Stitcher, split_at_pauses, transcribe_long
+from audio_io import (SAMPLE_RATE, PCM_CONTENT_TYPES, STREAM_CONTAINERS, StreamDecoder, UploadStats, container_format,
+                      decode_audio, pcm_to_audio)
+from streaming import StreamingSession
+from transcription_store import TranscriptionStore
+from vad import has_speech, trim_silence
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all domains
-
-# Shared transcription storage (in-memory for simplicity)
-transcriptions_storage = []
-storage_lock = threading.Lock()
-
-def store_transcription(raw_text, cleaned_text, source="web"):
-    """Store a transcription in shared storage"""
-    with storage_lock:
-        transcription = {
-            'id': str(len(transcriptions_storage) + 1),
-            'timestamp': datetime.datetime.now().strftime('%I:%M %p'),
-            'rawText': raw_text,
-            'cleanedText': cleaned_text,
-            'source': source,
-            'created_at': datetime.datetime.now().isoformat()
-        }
-        transcriptions_storage.insert(0, transcription)  # Add to beginning
-        # Keep only last 50 transcriptions
-        if len(transcriptions_storage) > 50:
-            transcriptions_storage.pop()
-        return transcription
-
-# Initialize Whisper model (using 'small' for better accuracy and reasonable speed)
-# Options: tiny (fastest), base (balanced), small, medium, large (most accurate)
-print("Loading Whisper model...")
-model = whisper.load_model("small")
-print("Whisper model loaded successfully!")
+CORS(app, expose_headers=["ETag", "X-Transcript-Cache", "Retry-After"])  # Enable CORS for all domains (ETag readable for history sync)
 
-# Novita API configuration for DeepSeek V3
-NOVITA_API_KEY = "sk_2pX7-h3PlLnBnXHseAoLJT6T3_bHX1Fz2kfl-b0UBX0"
-NOVITA_API_URL = "https://api.novita.ai/v3/openai/chat/completions"
+# Largest request body accepted (audio uploads); bigger requests get a 413
+MAX_UPLOAD_MB = float(os.environ.get('MAX_UPLOAD_MB', 50))
+app.config['MAX_CONTENT_LENGTH'] = int(MAX_UPLOAD_MB * 1024 * 1024)
+
+@app.before_request
+def reject_oversized_requests():
+    # Checked up front so a declared oversized body never reaches a handler's generic error path
+    if request.content_length is not None and request.content_length > app.config['MAX_CONTENT_LENGTH']:
+        raise RequestEntityTooLarge()
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    return jsonify({'error': f'Request body exceeds {MAX_UPLOAD_MB:g} MB'}), 413
+
+# Durable transcription history (SQLite, WAL mode)
+TRANSCRIPTION_DB_PATH = os.environ.get(
+    'TRANSCRIPTION_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'transcriptions.db')
+)
+transcription_store = TranscriptionStore(
+    TRANSCRIPTION_DB_PATH,
+    # Retention: drop entries older than N days and/or beyond the newest N entries (0 = keep all)
+    retention_days=float(os.environ.get('TRANSCRIPTION_RETENTION_DAYS', 0)) or None,
+    max_entries=int(os.environ.get('TRANSCRIPTION_MAX_ENTRIES', 0)) or None
+)
+
+def store_transcription(raw_text, cleaned_text, source="web", client_key=None):
+    """Store a transcription in shared storage (once per client_key)"""
+    return transcription_store.add(raw_text, cleaned_text, source, client_key)
+
+def update_transcription(transcription_id, cleaned_text):
+    """Replace the cleaned text of a stored transcription (e.g. when a late cleanup arrives)"""
+    transcription_store.update(transcription_id, cleaned_text)
+
+# Decode settings shared by every Whisper call
+WHISPER_OPTIONS = {
+    'fp16': False,  # Use float32 for better compatibility
+    'language': "en",  # Force English language
+    'task': "transcribe",
+    'verbose': False,  # Reduce logging overhead
+    'condition_on_previous_text': True,  # Use previous text for better context/accuracy
+    'temperature': 0.2  # Slightly higher for robustness
+    # Removed compression_ratio_threshold, logprob_threshold, no_speech_threshold for better accuracy
+}
+
+# Whisper configuration (environment overrides)
+# Models: tiny (fastest), base (balanced), small, medium, large (most accurate)
+WHISPER_MODEL = os.environ.get('WHISPER_MODEL', 'small')
+WHISPER_DEVICE = os.environ.get('WHISPER_DEVICE') or None  # e.g. cpu, cuda; default picks automatically
+WHISPER_THREADS = int(os.environ.get('WHISPER_THREADS', 0)) or None
+# Number of worker processes, each with its own model replica (0 = in-process batching scheduler)
+WHISPER_WORKERS = int(os.environ.get('WHISPER_WORKERS', 0))
+# Inference engine: whisper (float32 reference), int8 (quantized, CPU) or faster-whisper (see engines.py)
+WHISPER_ENGINE = os.environ.get('WHISPER_ENGINE', 'whisper')
 
-def cleanup_text_with_deepseek(raw_text):
-    """Clean up transcription using DeepSeek V3 via Novita"""
+model_manager = ModelManager(
+    WHISPER_OPTIONS,
+    model_name=WHISPER_MODEL,
+    device=WHISPER_DEVICE,
+    threads=WHISPER_THREADS,
+    workers=WHISPER_WORKERS,
+    threads_per_worker=int(os.environ.get('WHISPER_THREADS_PER_WORKER', 0)) or None,
+    max_batch_size=int(os.environ.get('WHISPER_MAX_BATCH_SIZE', 8)),
+    max_wait=float(os.environ.get('WHISPER_BATCH_WAIT_MS', 20)) / 1000,
+    engine=WHISPER_ENGINE
+)
+
+# Load in the background so the server binds immediately.
+# Pool workers re-import this module when spawned (as __mp_main__ under
+# `python app.py`): only the parent loads, and the stores and caches above
+# open their files on first use, so importing alone leaves the disk untouched.
+if multiprocessing.parent_process() is None:
+    model_manager.load()
+
+# Capture format clients should record in (GET /capture-format). 16 kHz mono PCM
+# is exactly what Whisper consumes, so it needs no decode and no resample; opus
+# is offered for slow links, where upload size matters more than decode cost.
+CAPTURE_FORMAT = os.environ.get('CAPTURE_FORMAT', 'pcm')  # pcm or opus
+CAPTURE_SAMPLE_RATE = int(os.environ.get('CAPTURE_SAMPLE_RATE', SAMPLE_RATE))
+CAPTURE_OPUS_BITRATE = int(os.environ.get('CAPTURE_OPUS_BITRATE', 24000))
+CAPTURE_SLOW_LINK_KBPS = int(os.environ.get('CAPTURE_SLOW_LINK_KBPS', 1000))  # Below this, prefer opus
+CAPTURE_FORMATS = {
+    'pcm': {
+        'encoding': 'pcm',
+        'sample_format': 's16le',
+        'sample_rate': CAPTURE_SAMPLE_RATE,
+        'channels': 1,
+        'content_type': 'audio/pcm',
+        'bitrate': CAPTURE_SAMPLE_RATE * 16
+    },
+    'opus': {
+        'encoding': 'opus',
+        'container': 'webm',
+        'sample_rate': 48000,
+        'channels': 1,
+        'content_type': 'audio/webm;codecs=opus',
+        'bitrate': CAPTURE_OPUS_BITRATE
+    }
+}
+upload_stats = UploadStats()  # Upload size and decode/resample cost per format
+
+# Per-stage request timings, aggregated for GET /metrics (Prometheus) and /health
+metrics = Metrics()
+metrics.gauge('whisper_model_ready', 'Whether a Whisper model is loaded', lambda: int(model_manager.ready))
+metrics.gauge('whisper_inference_queue_depth', 'Clips waiting for the Whisper worker',
+              lambda: (model_manager.stats()['inference'] or {}).get('queue_depth', 0))
+
+# Admission control in front of inference: a bounded queue served hotkey first, then web, then bulk
+# (priority by ?source=); requests that would wait too long get a 429 with Retry-After.
+# ?source= is only a hint: the hotkey class is kept for trusted clients, which present
+# ADMISSION_HOTKEY_TOKEN in X-Client-Token when it is set and are otherwise the ones on this
+# machine, and at most ADMISSION_MAX_QUEUED_HOTKEY of them queue at once.
+ADMISSION_PRIORITIES = {'voice_assistant': 'hotkey', 'bulk': 'bulk'}  # Any other source is web
+ADMISSION_HOTKEY_TOKEN = os.environ.get('ADMISSION_HOTKEY_TOKEN')
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+admission = AdmissionController(
+    # Clips in inference at once; default: one batch, or one per worker process
+    concurrency=int(os.environ.get('ADMISSION_CONCURRENCY', 0)) or WHISPER_WORKERS or model_manager.max_batch_size,
+    max_queued=int(os.environ.get('ADMISSION_MAX_QUEUED', 32)),
+    max_wait=float(os.environ.get('ADMISSION_MAX_WAIT', 30)) or None,
+    queue_limits={'hotkey': int(os.environ.get('ADMISSION_MAX_QUEUED_HOTKEY', 8))},
+    metrics=metrics
+)
+metrics.gauge('whisper_admission_queue_depth', 'Requests waiting for admission to inference, by priority',
+              admission.queue_depths)
+
+def hotkey_client():
+    """Whether this request may claim the hotkey admission class"""
+    if ADMISSION_HOTKEY_TOKEN:
+        token = request.headers.get('X-Client-Token', '')
+        return hmac.compare_digest(token.encode('utf-8'), ADMISSION_HOTKEY_TOKEN.encode('utf-8'))
+    return request.remote_addr in LOOPBACK_ADDRESSES
+
+def admission_request(source):
+    """Admission priority, deadline and disconnect check of this request.
+    
+    The priority follows ?source=, except that untrusted clients claiming
+    the hotkey class are served as web. An X-Request-Timeout header
+    (seconds) gives the client's deadline; a request still queued when it
+    passes is dropped.
+    """
+    timeout = request.headers.get('X-Request-Timeout')
     try:
-        headers = {
-            "Authorization": f"Bearer {NOVITA_API_KEY}",
-            "Content-Type": "application/json"
-        }
+        deadline = time.monotonic() + float(timeout) if timeout else None
+    except ValueError:
+        raise ValueError(f'Invalid X-Request-Timeout: {timeout!r}')
+    priority = ADMISSION_PRIORITIES.get(source, 'web')
+    if priority == 'hotkey' and not hotkey_client():
+        priority = 'web'
+    return {
+        'priority': priority,
+        'deadline': deadline,
+        'disconnected': partial(client_disconnected, request.environ)
+    }
+
+def admission_error_response(e):
+    """429 with Retry-After for a rejected request, 503 for one cancelled while queued"""
+    print(f"🚦 Admission: {e}")
+    if isinstance(e, AdmissionCancelled):
+        return jsonify({'error': str(e), 'reason': e.reason}), 503
+    response = jsonify({'error': str(e), 'reason': e.reason, 'retry_after': e.retry_after})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+def start_request_timer(endpoint):
+    """Time this request's stages; recorded when the response is sent (or the stream ends)"""
+    g.timer = RequestTimer(endpoint, metrics)
+    return g.timer
+
+@app.after_request
+def finish_request_timer(response):
+    timer = g.get('timer')
+    # Streamed two-phase responses finish their timer once the last event is built
+    if timer is not None and not response.is_streamed:
+        timer.finish(response.status_code)
+    return response
+
+# Voice-activity detection: trim silence before Whisper, skip silent clips entirely
+VAD_ENABLED = os.environ.get('VAD_ENABLED', '1') != '0'
+
+def run_whisper(audio, options=None):
+    """Transcribe a 16 kHz float32 array with the shared decode settings"""
+    return model_manager.submit(audio, options).result()
+
+# Clips longer than this are split at pauses and their chunks transcribed in parallel (0 = never)
+LONG_AUDIO_SECONDS = float(os.environ.get('LONG_AUDIO_SECONDS', 60))
+
+# Whisper results are cached on a hash of the decoded audio, so a re-sent clip skips inference
+# (its cleanup then hits the cleanup cache); set TRANSCRIPT_CACHE_PATH to persist across restarts
+transcript_cache = ResultCache(
+    max_entries=int(os.environ.get('TRANSCRIPT_CACHE_SIZE', 500)),
+    ttl=float(os.environ.get('TRANSCRIPT_CACHE_TTL', 24 * 3600)),
+    sqlite_path=os.environ.get('TRANSCRIPT_CACHE_PATH') or None,
+    table='transcript_cache'
+)
+
+def transcript_cache_key(audio):
+    """Key of a decoded clip: its samples plus everything else that decides Whisper's output"""
+    digest = hashlib.sha256(np.ascontiguousarray(audio, dtype=np.float32).tobytes()).hexdigest()
+    return make_key(digest, model_manager.model_name, model_manager.engine, WHISPER_OPTIONS,
+                    VAD_ENABLED, LONG_AUDIO_SECONDS)
+
+def transcribe_cached(audio, timer, audio_seconds, admission_args):
+    """Whisper text and language of a decoded clip, from the transcript cache when it was seen before.
+    
+    Returns (result, hit). Identical clips arriving together are transcribed
+    once, and only misses queue for admission (admission_args are the
+    slot's arguments). Admission failures belong to the caller that hit
+    them: requests coalesced onto it retry under their own deadline and
+    priority. A clip without speech gives empty text and `silent`.
+    """
+    def transcribe():
+        clip = audio
+        # Trim leading/trailing silence and long pauses before Whisper
+        if VAD_ENABLED:
+            with timer.span('vad'):
+                clip = trim_silence(clip)
+            if len(clip) == 0:
+                print(f"🔇 No speech in {audio_seconds:.1f}s clip, skipping Whisper")
+                return {'text': '', 'language': 'en', 'silent': True}
+            print(f"VAD trimmed {audio_seconds:.1f}s -> {len(clip) / SAMPLE_RATE:.1f}s")
         
-        prompt = f"""Clean up this speech transcription by removing filler words, adding proper punctuation, fixing grammar, and making it flow naturally. 
+        # Transcribe audio using Whisper with optimized settings for speed
+        long_audio = LONG_AUDIO_SECONDS and len(clip) > LONG_AUDIO_SECONDS * SAMPLE_RATE
+        cost = math.ceil(len(clip) / SAMPLE_RATE / 30) if long_audio else 1  # Roughly one unit per chunk
+        queued = time.perf_counter()
+        with admission.slot(cost=cost, **admission_args):
+            timer.add('admission', time.perf_counter() - queued)
+            print(f"Transcribing {len(clip) / SAMPLE_RATE:.1f}s of audio")
+            if long_audio:
+                result = transcribe_long(clip, model_manager.submit, drop_silence=VAD_ENABLED)
+                print(f"Long audio: transcribed {result['chunks']} chunks in parallel")
+            else:
+                result = run_whisper(clip)
+        timer.add_whisper(result, audio_seconds)
+        return {'text': result["text"].strip(), 'language': result.get("language", "unknown")}
+    
+    if not transcript_cache.enabled:
+        return transcribe(), False  # TRANSCRIPT_CACHE_SIZE=0: no caching, no coalescing
+    with timer.span('hash'):
+        key = transcript_cache_key(audio)
+    result, hit = transcript_cache.get_or_compute(key, transcribe,
+                                                  retry_on=(AdmissionRejected, AdmissionCancelled))
+    if hit:
+        print("⚡ Transcript cache hit")
+        timer.audio_seconds = audio_seconds
+    return result, hit
+
+def model_not_ready_response():
+    """503 returned while the Whisper model is still loading"""
+    response = jsonify({
+        'error': f'Whisper model is {model_manager.status}, please retry shortly',
+        'status': model_manager.status
+    })
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+# Novita API configuration for DeepSeek V3
+# (overridable, e.g. to point at a local stub server)
+NOVITA_API_KEY = os.environ.get('NOVITA_API_KEY', "sk_2pX7-h3PlLnBnXHseAoLJT6T3_bHX1Fz2kfl-b0UBX0")
+NOVITA_API_URL = os.environ.get('NOVITA_API_URL', "https://api.novita.ai/v3/openai/chat/completions")
+
+CLEANUP_MODEL = "deepseek/deepseek-v3-0324"
+CLEANUP_TEMPERATURE = 0.3
+CLEANUP_SYSTEM_PROMPT = "You are a helpful assistant that cleans up speech transcriptions."
+CLEANUP_PROMPT = """Clean up this speech transcription by removing filler words, adding proper punctuation, fixing grammar, and making it flow naturally. 
 
 Raw transcription: {raw_text}
 
 Return ONLY the cleaned text with no prefixes, quotes, or explanations. Do not add "Here's the cleaned-up transcription:" or any other introductory text."""
 
-        data = {
-            "model": "deepseek/deepseek-v3-0324",
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant that cleans up speech transcriptions."
-                },
-                {
-                    "role": "user", 
-                    "content": prompt
-                }
-            ],
-            "temperature": 0.3,
-            "max_tokens": 500,
-            "response_format": { "type": "text" }
-        }
-        
-        response = requests.post(NOVITA_API_URL, headers=headers, json=data, timeout=15)
-        
-        if response.status_code == 200:
-            result = response.json()
-            cleaned_text = result["choices"][0]["message"]["content"].strip()
-            
-            # Remove any unwanted prefixes or formatting that might slip through
-            unwanted_prefixes = [
-                "Here's the cleaned-up transcription:",
-                "Here is the cleaned-up transcription:",
-                "Cleaned transcription:",
-                "Here's the cleaned text:",
-                "Here is the cleaned text:",
-                "The cleaned text is:",
-                "Cleaned text:"
-            ]
+# Cleanup results are cached on normalized raw text; set CLEANUP_CACHE_PATH to persist across restarts
+cleanup_cache = ResultCache(
+    max_entries=int(os.environ.get('CLEANUP_CACHE_SIZE', 1000)),
+    ttl=float(os.environ.get('CLEANUP_CACHE_TTL', 7 * 24 * 3600)),
+    sqlite_path=os.environ.get('CLEANUP_CACHE_PATH') or None,
+    table='cleanup_cache'
+)
+# Inputs with at most this many words are cleaned locally instead of calling the LLM
+CLEANUP_LOCAL_MAX_WORDS = int(os.environ.get('CLEANUP_LOCAL_MAX_WORDS', 3))
+cleanup_stats = {'local': 0}
+cleanup_stats_lock = threading.Lock()  # Request threads and job runners clean up concurrently
+
+FILLER_WORDS = {'um', 'umm', 'uh', 'uhh', 'er', 'erm', 'ah', 'hmm', 'mm'}
+
+def normalize_transcription(raw_text):
+    """Cache key form of raw text: case, spacing and a trailing period or comma don't matter.
+
+    A closing ? or ! stays: "you're coming?" and "you're coming" clean up differently.
+    """
+    return re.sub(r'\s+', ' ', raw_text).strip().lower().rstrip('.,;: ')
+
+def content_words(raw_text):
+    """Words of raw text with filler words ("um", "uh") removed"""
+    return [w for w in raw_text.split() if w.lower().strip('.,!?') not in FILLER_WORDS]
+
+def local_cleanup(raw_text):
+    """Rule-based cleanup for short phrases ("yes", "on my way") that don't need an LLM"""
+    words = content_words(raw_text)
+    if not words:
+        return ''
+    words = ['I' if w == 'i' else w for w in words]
+    text = ' '.join(words).strip(' ,')
+    text = text[0].upper() + text[1:]
+    if text[-1] not in '.!?':
+        text += '.'
+    return text
+
+cleanup_client = CleanupClient(
+    NOVITA_API_URL,
+    NOVITA_API_KEY,
+    CLEANUP_MODEL,
+    CLEANUP_SYSTEM_PROMPT,
+    CLEANUP_PROMPT,
+    CLEANUP_TEMPERATURE,
+    # Past the budget the raw text is returned and the cleaned text patched into history later
+    budget=float(os.environ.get('CLEANUP_BUDGET_MS', 4000)) / 1000 or None,
+    # Send a second request if the first hasn't answered by then (0 = never)
+    hedge_after=float(os.environ.get('CLEANUP_HEDGE_MS', 0)) / 1000 or None,
+    pool_size=int(os.environ.get('CLEANUP_POOL_SIZE', 8))
+)
+
+def cleanup_text_with_deepseek(raw_text, budget=None):
+    """Clean up transcription using DeepSeek V3 via Novita, short-circuiting trivial and repeated inputs.
+    
+    Returns (cleaned_text, late_future). If the LLM misses its latency budget the raw
+    text is returned and late_future resolves to the cleaned text once it arrives.
+    """
+    if len(content_words(raw_text)) <= CLEANUP_LOCAL_MAX_WORDS:
+        with cleanup_stats_lock:
+            cleanup_stats['local'] += 1
+        return local_cleanup(raw_text), None
+    
+    key = make_key(normalize_transcription(raw_text), CLEANUP_MODEL, CLEANUP_PROMPT,
+                   CLEANUP_SYSTEM_PROMPT, CLEANUP_TEMPERATURE)
+    cached = cleanup_cache.get(key)
+    if cached is not None:
+        print("⚡ Cleanup cache hit")
+        return cached, None
+    
+    cleaned_text, late = cleanup_client.cleanup(raw_text, budget)
+    if late is not None:
+        print("⏱️ Cleanup over budget, using raw text for now")
+        on_late_cleanup(late, partial(cleanup_cache.put, key))
+        return raw_text, late
+    if cleaned_text is None:
+        return raw_text, None  # Return original if cleanup fails (and don't cache the failure)
+    cleanup_cache.put(key, cleaned_text)
+    return cleaned_text, None
+
+def on_late_cleanup(late, fn):
+    """Call fn(cleaned_text) once an over-budget cleanup arrives (not if it failed or came back empty)"""
+    def done(f):
+        if f.cancelled():
+            return
+        if f.exception() is not None:
+            print(f"Late cleanup failed: {str(f.exception())}")
+            return
+        if f.result() is not None:
+            fn(f.result())
+    late.add_done_callback(done)
+
+def empty_transcription(language="en"):
+    """Response for clips with no speech; nothing is cleaned up or stored"""
+    return {
+        'success': True,
+        'raw_text': '',
+        'cleaned_text': '',
+        'language': language,
+        'transcription': None
+    }
+
+def finalize_transcription(raw_text, language, source, timer, cleanup_budget=None, client_key=None):
+    """Clean up raw Whisper text, store it and build the response payload"""
+    if not raw_text:
+        return with_timings(empty_transcription(language), timer)
+    
+    # Clean up text using DeepSeek V3
+    print("Cleaning up transcription with DeepSeek V3...")
+    with timer.span('cleanup'):
+        cleaned_text, late_cleanup = cleanup_text_with_deepseek(raw_text, cleanup_budget)
+    print(f"Cleaned transcription: {cleaned_text}")
+    
+    # Store transcription in shared storage
+    with timer.span('store'):
+        stored_transcription = store_transcription(raw_text, cleaned_text, source, client_key)
+    
+    # Patch the history entry once an over-budget cleanup finally arrives
+    if late_cleanup is not None:
+        on_late_cleanup(late_cleanup, partial(update_transcription, stored_transcription['id']))
+    
+    return with_timings({
+        'success': True,
+        'raw_text': raw_text,
+        'cleaned_text': cleaned_text,
+        'cleanup_pending': late_cleanup is not None,
+        'language': language,
+        'transcription': stored_transcription
+    }, timer)
+
+def with_timings(payload, timer):
+    """Stop the request timer and attach its per-stage timings to a response payload"""
+    payload['timings'] = timer.finish()
+    return payload
+
+def client_request_info(default_source='web'):
+    """Source label (?source=, default web) and optional Idempotency-Key of a transcription request"""
+    source = request.args.get('source', default_source)
+    client_key = request.headers.get('Idempotency-Key') or None
+    if not re.fullmatch(r'[\w-]{1,32}', source):
+        raise ValueError(f'Invalid source: {source!r}')
+    if client_key is not None and len(client_key) > 128:
+        raise ValueError('Idempotency-Key is too long')
+    return source, client_key
+
+def replayed_transcription(client_key):
+    """Stored result for a retried request, or None if this key hasn't been stored yet"""
+    stored_transcription = transcription_store.get_by_client_key(client_key) if client_key else None
+    if stored_transcription is None:
+        return None
+    print(f"↩️ Replaying stored transcription for Idempotency-Key {client_key}")
+    return jsonify({
+        'success': True,
+        'raw_text': stored_transcription['rawText'],
+        'cleaned_text': stored_transcription['cleanedText'],
+        'cleanup_pending': False,
+        'language': None,  # Not kept in history
+        'transcription': stored_transcription,
+        'replayed': True
+    })
+
+TWO_PHASE_MIMETYPES = ('application/x-ndjson', 'text/event-stream')
+
+def transcription_response(raw_text, language, source, timer, client_key=None):
+    """Respond with the finished transcription, or in two phases if the client asked for it.
+    
+    With Accept: application/x-ndjson (JSON lines) or text/event-stream (SSE) a "raw"
+    event is sent as soon as Whisper is done, followed by a "cleaned" event once
+    cleanup and storage have finished. Both carry the request's stage timings
+    so far; the final ones are in "cleaned".
+    """
+    # Only an explicit Accept entry opts in; */* keeps the single JSON response
+    mimetype = next((value for value, quality in request.accept_mimetypes
+                     if value in TWO_PHASE_MIMETYPES and quality > 0), None)
+    if mimetype is None:
+        return jsonify(finalize_transcription(raw_text, language, source, timer, client_key=client_key))
+    
+    def format_event(event, payload):
+        data = json.dumps({'event': event, **payload})
+        if mimetype == 'text/event-stream':
+            return f"event: {event}\ndata: {data}\n\n"
+        return data + "\n"
+    
+    def generate():
+        yield format_event('raw', {'success': True, 'raw_text': raw_text, 'language': language,
+                                   'timings': timer.timings()})
+        try:
+            # The raw text is already out, so the cleanup can take as long as it needs
+            payload = finalize_transcription(raw_text, language, source, timer, cleanup_budget=0,
+                                             client_key=client_key)
+        except Exception as e:
+            print(f"Error finishing two-phase transcription: {str(e)}")
+            payload = {'success': False, 'error': f'Cleanup failed: {str(e)}', 'timings': timer.finish(500)}
+        yield format_event('cleaned', payload)
+    
+    return Response(generate(), mimetype=mimetype, headers={'X-Accel-Buffering': 'no'})
+
+@app.route('/transcribe', methods=['POST'])
+def transcribe_audio():
+    """Transcribe an upload, clean it up and store it.
+    
+    ?source= labels the history entry (default web). An Idempotency-Key header
+    makes retries safe: a key that was already stored returns that entry
+    instead of transcribing and storing again. The response's `timings` break
+    the request down by stage (also aggregated on GET /metrics). When
+    inference is overloaded the request is answered 429 with Retry-After.
+    """
+    try:
+        source, client_key = client_request_info()
+        admission_args = admission_request(source)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    replay = replayed_transcription(client_key)
+    if replay is not None:
+        return replay
+    
+    if not model_manager.ready:
+        return model_not_ready_response()
+    
+    timer = start_request_timer('transcribe')
+    try:
+        raw_body = request.mimetype in PCM_CONTENT_TYPES
+        if raw_body:
+            with timer.span('upload'):
+                data = request.get_data()
+            if not data:
+                return jsonify({'error': 'Audio upload is empty'}), 400
+            # A WAV/FLAC/webm file posted as application/octet-stream is decoded as what it is
+            raw_body = container_format(data) is None
+        if raw_body:
+            # Raw 16-bit PCM in the request body, sample rate in a header
+            decode_started = time.perf_counter()
+            try:
+                sample_rate = int(request.headers.get('X-Sample-Rate') or
+                                  request.mimetype_params.get('rate', SAMPLE_RATE))
+                audio = pcm_to_audio(data, sample_rate)
+            except ValueError as e:
+                return jsonify({'error': f'Invalid PCM upload: {e}'}), 400
+            upload_format = f"pcm/{sample_rate}"
+        elif request.mimetype in PCM_CONTENT_TYPES or request.mimetype.startswith('audio/'):
+            # Compressed audio (e.g. FLAC or Ogg/Opus from the hotkey client) in the request body
+            with timer.span('upload'):
+                data = request.get_data()
+            upload_format = container_format(data) if request.mimetype in PCM_CONTENT_TYPES else request.mimetype
+            decode_started = time.perf_counter()
+            audio = decode_audio(data, request.mimetype)
+        else:
+            # Check if audio file is present in request (parsing the form receives the upload)
+            with timer.span('upload'):
+                files = request.files
+            if 'audio' not in files:
+                return jsonify({'error': 'No audio file provided'}), 400
             
-            for prefix in unwanted_prefixes:
-                if cleaned_text.startswith(prefix):
-                    cleaned_text = cleaned_text[len(prefix):].strip()
+            audio_file = files['audio']
             
-            # Remove surrounding quotes if present
-            if (cleaned_text.startswith('"') and cleaned_text.endswith('"')) or \
-               (cleaned_text.startswith("'") and cleaned_text.endswith("'")):
-                cleaned_text = cleaned_text[1:-1].strip()
+            if audio_file.filename == '':
+                return jsonify({'error': 'No audio file selected'}), 400
             
-            return cleaned_text
+            # Decode in memory; ffmpeg is only used for compressed containers
+            data = audio_file.read()
+            upload_format = audio_file.mimetype or 'unknown'
+            decode_started = time.perf_counter()
+            audio = decode_audio(data, audio_file.mimetype, filename=audio_file.filename)
+        
+        # Upload size vs. decode/resample cost, per format (reported by /health)
+        decode_seconds = time.perf_counter() - decode_started
+        timer.add('decode', decode_seconds)
+        audio_seconds = len(audio) / SAMPLE_RATE
+        upload_stats.record(upload_format, len(data), audio_seconds, decode_seconds)
+        
+        if len(audio) == 0:
+            return jsonify({'error': 'Audio upload is empty'}), 400
+        
+        # VAD + Whisper, or the earlier result for the same audio
+        result, cache_hit = transcribe_cached(audio, timer, audio_seconds, admission_args)
+        if result.get('silent'):
+            timer.audio_seconds = audio_seconds
+            response = jsonify(with_timings(empty_transcription(), timer))
         else:
-            print(f"Novita API error: {response.status_code} - {response.text}")
-            return raw_text  # Return original if cleanup fails
-            
+            raw_text = result['text']
+            print(f"Raw Whisper transcription: {raw_text}")
+            response = transcription_response(raw_text, result['language'], source, timer, client_key)
+        response.headers['X-Transcript-Cache'] = 'hit' if cache_hit else 'miss'
+        return response
+    
+    except (AdmissionRejected, AdmissionCancelled) as e:
+        return admission_error_response(e)
     except Exception as e:
-        print(f"Error with Novita/DeepSeek cleanup: {str(e)}")
-        return raw_text  # Return original if cleanup fails
+        print(f"Error during transcription: {str(e)}")
+        return jsonify({'error': f'Transcription failed: {str(e)}'}), 500
 
-@app.route('/transcribe', methods=['POST'])
-def transcribe_audio():
+# Streaming sessions: audio chunks are posted while the user is still speaking
+STREAM_SESSION_TIMEOUT = float(os.environ.get('STREAM_SESSION_TIMEOUT', 120))  # Seconds before an idle session is dropped
+STREAM_MAX_SESSIONS = int(os.environ.get('STREAM_MAX_SESSIONS', 16))  # Open sessions per process
+STREAM_PASS_MAX_WAIT = 1.0  # Seconds a rolling-window pass may wait for admission before it's skipped
+streaming_sessions = {}
+streaming_lock = threading.Lock()
+streaming_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='stream')
+
+def _expire_streaming_sessions():
+    """Drop sessions idle for STREAM_SESSION_TIMEOUT (swept on every streaming request)"""
+    now = time.time()
+    with streaming_lock:
+        expired = [streaming_sessions.pop(sid) for sid, s in list(streaming_sessions.items())
+                   if now - s.last_activity > STREAM_SESSION_TIMEOUT]
+    for session in expired:
+        session.close()
+
+def stream_pass_whisper(priority, audio, options):
+    """Whisper for a rolling-window pass, admitted like any clip; None (pass skipped) when it can't run soon"""
     try:
-        # Check if audio file is present in request
-        if 'audio' not in request.files:
-            return jsonify({'error': 'No audio file provided'}), 400
+        with admission.slot(priority, deadline=time.monotonic() + STREAM_PASS_MAX_WAIT):
+            return run_whisper(audio, options)
+    except (AdmissionRejected, AdmissionCancelled) as e:
+        print(f"Streaming pass skipped: {e}")
+        return None
+
+@app.route('/transcribe/stream', methods=['POST'])
+def start_streaming_transcription():
+    """Open a streaming session; chunks are either raw 16-bit PCM or a compressed container.
+    
+    JSON body: {"format": "pcm", "sample_rate": N} or {"format": "webm" | "ogg"}.
+    Rolling-window passes are admitted at the priority of ?source= (like the
+    finish request) and skipped when inference is overloaded. At most
+    STREAM_MAX_SESSIONS are open at once; past that the answer is 429.
+    """
+    if not model_manager.ready:
+        return model_not_ready_response()
+    
+    try:
+        source, _ = client_request_info()
+        priority = admission_request(source)['priority']
+        data = request.get_json(silent=True) or {}
+        audio_format = data.get('format', 'pcm')
+        sample_rate = int(data.get('sample_rate', SAMPLE_RATE))
+        if audio_format != 'pcm' and audio_format not in STREAM_CONTAINERS:
+            raise ValueError(f'Unsupported streaming format: {audio_format!r}')
+        if sample_rate <= 0:
+            raise ValueError(f'Invalid PCM sample rate: {sample_rate}')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    _expire_streaming_sessions()
+    with streaming_lock:
+        if len(streaming_sessions) >= STREAM_MAX_SESSIONS:
+            response = jsonify({'error': 'Too many open streaming sessions; upload the recording instead'})
+            response.headers['Retry-After'] = '5'
+            return response, 429
+    
+    try:
+        session_id = str(uuid.uuid4())
+        transcribe_fn = partial(stream_pass_whisper, priority)
+        speech_fn = has_speech if VAD_ENABLED else None
+        if audio_format == 'pcm':
+            session = StreamingSession(session_id, transcribe_fn, input_sample_rate=sample_rate,
+                                       speech_fn=speech_fn, audio_format=f"pcm/{sample_rate} (stream)")
+        else:
+            session = StreamingSession(session_id, transcribe_fn, decoder=StreamDecoder(audio_format),
+                                       speech_fn=speech_fn, audio_format=f"{audio_format} (stream)")
         
-        audio_file = request.files['audio']
+        with streaming_lock:
+            streaming_sessions[session_id] = session
         
-        if audio_file.filename == '':
-            return jsonify({'error': 'No audio file selected'}), 400
+        print(f"Started streaming session {session_id} ({audio_format})")
+        return jsonify({'success': True, 'session_id': session_id})
+    
+    except Exception as e:
+        print(f"Error starting streaming session: {str(e)}")
+        return jsonify({'error': f'Failed to start stream: {str(e)}'}), 500
+
+def append_stream_chunk(session, chunk):
+    """Add an uploaded chunk to a session, counting its size and decode time"""
+    # A session may carry as much audio as a single upload
+    if session.upload_bytes + len(chunk) > app.config['MAX_CONTENT_LENGTH']:
+        raise RequestEntityTooLarge()
+    if session.decoder is None:
+        started = time.perf_counter()
+        audio = pcm_to_audio(chunk, session.input_sample_rate)
+        session.decode_seconds += time.perf_counter() - started
+        session.upload_bytes += len(chunk)
+        session.append_audio(audio)
+    else:
+        session.append_compressed(chunk)  # Decoded (and timed) by the session itself
+
+@app.route('/transcribe/stream/<session_id>', methods=['POST'])
+def append_streaming_audio(session_id):
+    """Append an audio chunk and kick off a rolling-window pass in the background"""
+    _expire_streaming_sessions()
+    with streaming_lock:
+        session = streaming_sessions.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Unknown or expired streaming session'}), 404
+    
+    try:
+        try:
+            append_stream_chunk(session, request.get_data())
+        except ValueError as e:
+            return jsonify({'error': f'Invalid audio chunk: {e}'}), 400
         
-        # Save uploaded file to temporary location
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
-            audio_file.save(temp_file.name)
-            temp_filename = temp_file.name
+        if session.needs_update():
+            streaming_executor.submit(session.process)
+        
+        return jsonify({
+            'success': True,
+            'committed_text': session.committed_text,
+            'pending_text': session.pending_text
+        })
+    
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        print(f"Error appending streaming audio: {str(e)}")
+        return jsonify({'error': f'Failed to append audio: {str(e)}'}), 500
+
+@app.route('/transcribe/stream/<session_id>/finish', methods=['POST'])
+def finish_streaming_transcription(session_id):
+    """Decode the unstable tail, then clean up and store like /transcribe.
+    
+    The session stays open until its final chunk (if any) has been accepted,
+    and again if the tail can't be admitted, so a retry can still finish it.
+    """
+    try:
+        source, client_key = client_request_info()
+        admission_args = admission_request(source)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    _expire_streaming_sessions()
+    replay = replayed_transcription(client_key)
+    if replay is not None:
+        with streaming_lock:
+            session = streaming_sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+        return replay
+    with streaming_lock:
+        session = streaming_sessions.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Unknown or expired streaming session'}), 404
+    
+    timer = start_request_timer('transcribe_stream')
+    try:
+        # A final chunk may ride along with the finish call
+        with timer.span('upload'):
+            chunk = request.get_data()
+        if chunk:
+            try:
+                append_stream_chunk(session, chunk)
+            except ValueError as e:
+                return jsonify({'error': f'Invalid audio chunk: {e}'}), 400
+        with streaming_lock:
+            if streaming_sessions.pop(session_id, None) is None:
+                return jsonify({'error': 'Streaming session is already finished'}), 404
+        
+        def transcribe_tail(audio, options):
+            queued = time.perf_counter()
+            with admission.slot(**admission_args):
+                timer.add('admission', time.perf_counter() - queued)
+                return run_whisper(audio, options)
         
         try:
-            # Transcribe audio using Whisper with optimized settings for speed
-            print(f"Transcribing audio file: {temp_filename}")
-            result = model.transcribe(
-                temp_filename,
-                fp16=False,  # Use float32 for better compatibility
-                language="en",  # Force English language
-                task="transcribe",
-                verbose=False,  # Reduce logging overhead
-                condition_on_previous_text=True,  # Use previous text for better context/accuracy
-                temperature=0.2  # Slightly higher for robustness
-                # Removed compression_ratio_threshold, logprob_threshold, no_speech_threshold for better accuracy
-            )
-            
-            # Extract raw text from Whisper
-            raw_text = result["text"].strip()
-            print(f"Raw Whisper transcription: {raw_text}")
-            
-            # Clean up text using DeepSeek V3
-            print("Cleaning up transcription with DeepSeek V3...")
-            cleaned_text = cleanup_text_with_deepseek(raw_text)
-            print(f"Cleaned transcription: {cleaned_text}")
-            
-            # Store transcription in shared storage
-            stored_transcription = store_transcription(raw_text, cleaned_text, "web")
-            
-            return jsonify({
-                'success': True,
-                'raw_text': raw_text,
-                'cleaned_text': cleaned_text,
-                'language': result.get("language", "unknown"),
-                'transcription': stored_transcription
-            })
-            
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_filename):
-                os.unlink(temp_filename)
+            result = session.finish(transcribe_tail)
+        except (AdmissionRejected, AdmissionCancelled):
+            with streaming_lock:
+                streaming_sessions.setdefault(session_id, session)
+            raise
+        audio_seconds = len(session.audio) / SAMPLE_RATE
+        # Only the unstable tail is decoded now (the rest ran while the user spoke), so no real-time factor
+        for stage, seconds in result['timings'].items():
+            timer.add(stage, seconds)
+        timer.audio_seconds = audio_seconds
+        upload_stats.record(session.audio_format, session.upload_bytes, audio_seconds, session.decode_seconds)
+        raw_text = result["text"]
+        print(f"Raw Whisper transcription (streamed): {raw_text}")
+        
+        return transcription_response(raw_text, result["language"], source, timer, client_key)
     
+    except (AdmissionRejected, AdmissionCancelled) as e:
+        return admission_error_response(e)
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
-        print(f"Error during transcription: {str(e)}")
+        print(f"Error finishing streaming session: {str(e)}")
         return jsonify({'error': f'Transcription failed: {str(e)}'}), 500
 
+# Background jobs for bulk uploads and long recordings (POST /jobs, GET /jobs/<id>).
+# Job state is in SQLite so any server process can report it; uploads wait on disk.
+JOBS_DB_PATH = os.environ.get('JOBS_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs.db'))
+JOBS_SPOOL_DIR = os.environ.get(
+    'JOBS_SPOOL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'job-uploads')
+)
+JOBS_CHUNK_SECONDS = float(os.environ.get('JOBS_CHUNK_SECONDS', 30))  # At most one Whisper window per chunk
+# Chunks of a job transcribed at once; 1 leaves the most room for interactive requests,
+# batch hosts raise it (up to WHISPER_WORKERS or the batch size) to use every core
+JOBS_PARALLEL_CHUNKS = max(1, int(os.environ.get('JOBS_PARALLEL_CHUNKS', 1)))
+JOBS_CLEANUP_WORDS = 250  # Long transcripts are cleaned up in passages of about this many words
+job_cleanup_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('JOBS_CLEANUP_CONCURRENCY', 4)),
+                                          thread_name_prefix='job-cleanup')
+
+def process_transcription_job(job, report):
+    """Transcribe a spooled upload in chunks cut at pauses, then clean it up and store it (runs on a job runner)"""
+    timer = RequestTimer('job', metrics)
+    with timer.span('decode'):
+        with open(job['spool_path'], 'rb') as f:
+            data = f.read()
+        mimetype, _, rate = (job['mimetype'] or '').partition(';rate=')
+        audio = decode_audio(data, mimetype, sample_rate=int(rate) if rate else None, filename=job['filename'])
+    del data
+    timer.audio_seconds = len(audio) / SAMPLE_RATE
+    report(job['processed_seconds'], [], timer.audio_seconds)
+    
+    # Resume after the last chunk reported before an interruption
+    resume_at = round(job['processed_seconds'] * SAMPLE_RATE)
+    done = job_queue.get(job['id'])['segments']
+    stitcher = Stitcher(done[-1]['text'] if done else '')
+    # Silent chunks (long pauses in a meeting) are skipped entirely
+    chunks = [chunk for chunk in split_at_pauses(audio, JOBS_CHUNK_SECONDS, drop_silence=VAD_ENABLED)
+              if chunk.end > resume_at]
+    whisper_started = time.perf_counter()
+    for i in range(0, len(chunks), JOBS_PARALLEL_CHUNKS):
+        group = chunks[i:i + JOBS_PARALLEL_CHUNKS]
+        # Bulk priority: interactive requests queued meanwhile go first, and jobs are never rejected
+        with admission.slot('bulk', cost=len(group), reject=False):
+            futures = [model_manager.submit(audio[chunk.start:chunk.end]) for chunk in group]
+            for chunk, future in zip(group, futures):
+                report(chunk.end / SAMPLE_RATE, stitcher.add(chunk, future.result()))
+    timer.add('whisper', time.perf_counter() - whisper_started)
+    report(timer.audio_seconds, [])
+    
+    texts = [segment['text'] for segment in job_queue.get(job['id'])['segments']]
+    raw_text = ' '.join(texts)
+    if not raw_text:
+        timer.finish()
+        return {'raw_text': '', 'cleaned_text': '', 'transcription': None}
+    
+    # The LLM answers in bounded length, so long transcripts are cleaned passage by passage
+    with timer.span('cleanup'):
+        futures = [job_cleanup_executor.submit(cleanup_text_with_deepseek, passage, 0)
+                   for passage in group_text(texts, JOBS_CLEANUP_WORDS)]
+        cleaned_text = '\n\n'.join(future.result()[0] for future in futures)
+    with timer.span('store'):
+        stored_transcription = store_transcription(raw_text, cleaned_text, job['source'], job['client_key'])
+    timer.finish()
+    return {'raw_text': raw_text, 'cleaned_text': cleaned_text, 'transcription': stored_transcription}
+
+job_queue = JobQueue(
+    JOBS_DB_PATH,
+    JOBS_SPOOL_DIR,
+    process_transcription_job,
+    workers=int(os.environ.get('JOBS_WORKERS', 1)),  # Runners per server process
+    max_queued=int(os.environ.get('JOBS_MAX_QUEUED', 100)),
+    retention_hours=float(os.environ.get('JOBS_RETENTION_HOURS', 7 * 24)) or None,
+    ready_fn=lambda: model_manager.ready
+)
+
+@app.route('/jobs', methods=['POST'])
+def submit_transcription_jobs():
+    """Queue uploads for background transcription; responds 202 with one job per file.
+    
+    Takes any number of multipart `audio` files, or one raw audio body like
+    /transcribe (?filename= names it). ?source= labels the history entries
+    (default bulk) and an Idempotency-Key header makes a resubmission return
+    the existing jobs. A full queue answers 429.
+    """
+    try:
+        source, client_key = client_request_info(default_source='bulk')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        if request.mimetype in PCM_CONTENT_TYPES:
+            sample_rate = int(request.headers.get('X-Sample-Rate') or
+                              request.mimetype_params.get('rate', SAMPLE_RATE))
+            uploads = [(request.args.get('filename', 'upload.pcm'), f"{request.mimetype};rate={sample_rate}",
+                        request.get_data())]
+        elif request.mimetype.startswith('audio/'):
+            uploads = [(request.args.get('filename', 'upload'), request.mimetype, request.get_data())]
+        else:
+            uploads = [(f.filename, f.mimetype, f.read()) for f in request.files.getlist('audio') if f.filename]
+        
+        if not uploads:
+            return jsonify({'error': 'No audio file provided'}), 400
+        if not all(data for _, _, data in uploads):
+            return jsonify({'error': 'Audio upload is empty'}), 400
+        
+        jobs = job_queue.submit(uploads, source, client_key)
+        print(f"📥 Queued {len(jobs)} transcription job(s)")
+        return jsonify({'success': True, 'jobs': jobs}), 202
+    
+    except JobQueueFull as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '60'
+        return response, 429
+    except Exception as e:
+        print(f"Error queueing transcription jobs: {str(e)}")
+        return jsonify({'error': f'Failed to queue jobs: {str(e)}'}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_transcription_job(job_id):
+    """Status, progress and decoded segments of a job (?since=N returns segments from index N on)"""
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'error': 'since must be an integer'}), 400
+    
+    job = job_queue.get(job_id, since)
+    if job is None:
+        return jsonify({'error': 'Unknown transcription job'}), 404
+    return jsonify({'success': True, 'job': job})
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'whisper_loaded': model is not None})
+    stats = model_manager.stats()
+    with cleanup_stats_lock:
+        local_cleanups = dict(cleanup_stats)
+    return jsonify({
+        **stats,
+        'whisper_loaded': model_manager.ready,
+        'uploads': upload_stats.stats(),
+        'cleanup': {**local_cleanups, **cleanup_client.stats(), 'cache': cleanup_cache.stats()},
+        'transcript_cache': transcript_cache.stats(),
+        'admission': admission.stats(),
+        'jobs': job_queue.stats(),
+        'latency_ms': metrics.percentiles('whisper_request_duration_seconds', 'stage', endpoint='transcribe')
+    })
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request stage latencies (p50/p95/p99), audio duration, real-time factor and model state"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/capture-format', methods=['GET'])
+def capture_format():
+    """Advertise the audio format clients should record and upload in.
+    
+    Clients use "preferred" unless their uplink is slower than slow_link_kbps,
+    in which case they pick the compressed alternative.
+    """
+    preferred = CAPTURE_FORMAT if CAPTURE_FORMAT in CAPTURE_FORMATS else 'pcm'
+    return jsonify({
+        'success': True,
+        'preferred': CAPTURE_FORMATS[preferred],
+        'alternatives': [fmt for name, fmt in CAPTURE_FORMATS.items() if name != preferred],
+        'slow_link_kbps': CAPTURE_SLOW_LINK_KBPS
+    })
+
+@app.route('/model', methods=['GET', 'POST'])
+def switch_model():
+    """Report the active Whisper model and engine, or hot-swap either without restarting"""
+    if request.method == 'GET':
+        return jsonify({
+            'success': True,
+            'available_models': whisper.available_models(),
+            'available_engines': available_engines(),
+            **model_manager.stats()
+        })
+    
+    try:
+        data = request.get_json(silent=True) or {}
+        if not data.get('model') and not data.get('engine'):
+            return jsonify({'error': 'No model or engine provided'}), 400
+        model_name = data.get('model') or model_manager.model_name
+        engine = data.get('engine') or model_manager.engine
+        
+        if not model_manager.load(model_name, engine=engine):
+            return jsonify({'error': f'Already loading {model_manager.loading_model}'}), 409
+        
+        print(f"🔄 Switching Whisper model to '{model_name}' ({engine} engine)")
+        return jsonify({'success': True, **model_manager.stats()}), 202
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error switching model: {str(e)}")
+        return jsonify({'error': f'Failed to switch model: {str(e)}'}), 500
+
+HISTORY_EVENTS_KEEPALIVE = 15  # Seconds between SSE keep-alive comments
+# Each open event stream holds a server thread for as long as it lasts; cap them so
+# dashboards can't take every thread away from transcription requests
+HISTORY_EVENTS_MAX_STREAMS = int(os.environ.get('HISTORY_EVENTS_MAX_STREAMS', 2))
+history_event_streams = threading.BoundedSemaphore(HISTORY_EVENTS_MAX_STREAMS)
+
+SPARE_REQUEST_THREADS = 8  # History, health and two-phase cleanups running alongside inference
+
+def request_threads_needed():
+    """Server threads per process that let every admitted, queued and streaming request hold one at once"""
+    return admission.concurrency + admission.max_queued + HISTORY_EVENTS_MAX_STREAMS + SPARE_REQUEST_THREADS
+
+def history_etag(revision):
+    return f'rev-{revision}'
+
+SEARCH_PARAMS = ('q', 'source', 'start', 'end', 'before')
+
+def parse_time_param(name):
+    """Optional ISO 8601 query parameter, normalized for comparison with created_at.
+    
+    created_at is naive local time, so a timestamp with an offset (or Z) is
+    converted to local time rather than having its offset dropped.
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.isoformat()
 
 @app.route('/transcriptions', methods=['GET'])
 def get_transcriptions():
-    """Get all stored transcriptions"""
+    """Get stored transcriptions.
+    
+    Without parameters the most recent entries are returned (?limit=N, default 50).
+    
+    Search: ?q= (words or word prefixes in the raw or cleaned text), ?source=,
+    ?start= / ?end= (ISO timestamps) filter the history newest first; pass the
+    returned next_before as ?before= to get the next page.
+    
+    Sync: with ?since=<cursor> only entries added or changed after that cursor
+    are returned; "reset": true means the cursor is stale (e.g. history was
+    cleared) and the list is a fresh snapshot instead. Every sync response
+    carries the new cursor and an ETag, so an unchanged history costs a 304.
+    """
     try:
-        with storage_lock:
+        limit = min(int(request.args.get('limit', 50)), 1000)
+        
+        if any(request.args.get(name) for name in SEARCH_PARAMS):
+            try:
+                start, end = parse_time_param('start'), parse_time_param('end')
+                before = request.args.get('before', type=int)
+            except ValueError as e:
+                return jsonify({'error': f'Invalid time range: {str(e)}'}), 400
+            transcriptions, next_before = transcription_store.search(
+                request.args.get('q'), request.args.get('source'), start, end, before, limit
+            )
             return jsonify({
                 'success': True,
-                'transcriptions': transcriptions_storage.copy()
+                'transcriptions': transcriptions,
+                'next_before': next_before
             })
+        
+        since = request.args.get('since', type=int)
+        
+        revision = transcription_store.revision()
+        etag = history_etag(revision)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        
+        if since is None:
+            transcriptions, reset = transcription_store.recent(limit), True
+        else:
+            transcriptions, revision, reset = transcription_store.changes_since(since, limit)
+            etag = history_etag(revision)
+        
+        response = jsonify({
+            'success': True,
+            'transcriptions': transcriptions,
+            'cursor': revision,
+            'reset': reset
+        })
+        response.set_etag(etag)
+        return response
     except Exception as e:
         print(f"Error getting transcriptions: {str(e)}")
         return jsonify({'error': f'Failed to get transcriptions: {str(e)}'}), 500
 
+@app.route('/transcriptions/events', methods=['GET'])
+def transcription_events():
+    """Push history changes as Server-Sent Events.
+    
+    Starts from ?since=<cursor> (or Last-Event-ID when the browser reconnects).
+    Emits "transcription" events with one entry each and "reset" events with a
+    fresh snapshot; the SSE id is the cursor, so reconnects resume in place.
+    
+    At most HISTORY_EVENTS_MAX_STREAMS streams are open per process; past that
+    the request gets a 503 and clients should poll ?since= instead.
+    """
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', transcription_store.revision(), type=int)
+    limit = min(int(request.args.get('limit', 50)), 1000)
+    
+    if not history_event_streams.acquire(blocking=False):
+        response = jsonify({'error': 'Too many open history event streams; poll /transcriptions?since= instead'})
+        response.headers['Retry-After'] = str(HISTORY_EVENTS_KEEPALIVE)
+        return response, 503
+    
+    def generate():
+        cursor = since
+        yield "retry: 3000\n\n"
+        while True:
+            # Woken by local commits; the timeout also picks up writes from other processes
+            transcription_store.wait_for_change(cursor, HISTORY_EVENTS_KEEPALIVE)
+            transcriptions, revision, reset = transcription_store.changes_since(cursor, limit)
+            if reset:
+                data = json.dumps({'transcriptions': transcriptions, 'cursor': revision})
+                yield f"id: {revision}\nevent: reset\ndata: {data}\n\n"
+            elif transcriptions:
+                for i, transcription in enumerate(transcriptions):
+                    data = json.dumps({'transcription': transcription, 'cursor': revision})
+                    # Only the last event of a batch advances the browser's Last-Event-ID
+                    event_id = f"id: {revision}\n" if i == len(transcriptions) - 1 else ""
+                    yield f"{event_id}event: transcription\ndata: {data}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            cursor = revision
+    
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(history_event_streams.release)
+    return response
+
 @app.route('/store-transcription', methods=['POST'])
 def store_voice_assistant_transcription():
     """Store a transcription from the voice assistant"""
@@ -200,8 +1131,9 @@ def store_voice_assistant_transcription():
         if not raw_text and not cleaned_text:
             return jsonify({'error': 'No text provided'}), 400
         
-        # Store transcription
-        stored_transcription = store_transcription(raw_text, cleaned_text, "voice_assistant")
+        # Store transcription (an Idempotency-Key header makes retries store it only once)
+        client_key = request.headers.get('Idempotency-Key') or None
+        stored_transcription = store_transcription(raw_text, cleaned_text, "voice_assistant", client_key)
         
         return jsonify({
             'success': True,
@@ -216,9 +1148,8 @@ def store_voice_assistant_transcription():
 def clear_transcription_history():
     """Clear all stored transcriptions"""
     try:
-        with storage_lock:
-            transcriptions_storage.clear()
-            print("🗑️ Transcription history cleared")
+        transcription_store.clear()
+        print("🗑️ Transcription history cleared")
         
         return jsonify({
             'success': True,
@@ -229,5 +1160,30 @@ def clear_transcription_history():
         print(f"Error clearing transcription history: {str(e)}")
         return jsonify({'error': f'Failed to clear history: {str(e)}'}), 500
 
+def drain():
+    """Let background work finish before the process exits.
+
+    Runs after in-flight requests are done (gunicorn's worker_exit hook, or
+    the dev server stopping): stops job runners after their current chunk
+    (the jobs resume later), waits for stream decodes and late cleanups,
+    which may still update history, then for queued history writes.
+    """
+    job_queue.shutdown()
+    job_cleanup_executor.shutdown(wait=True)
+    streaming_executor.shutdown(wait=True)
+    with streaming_lock:
+        sessions = list(streaming_sessions.values())
+        streaming_sessions.clear()
+    for session in sessions:
+        session.close()
+    cleanup_client.shutdown()
+    transcription_store.flush()
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001) 
\ No newline at end of file
+    # Development server; production runs under gunicorn (see gunicorn.conf.py).
+    # No reloader: it would import this module twice and load the model twice.
+    job_queue.start()
+    try:
+        app.run(debug=True, host='0.0.0.0', port=5001, use_reloader=False)
+    finally:
+        drain()
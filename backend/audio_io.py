@@ -0,0 +1,287 @@
+"""
+In-memory audio decoding for the transcription endpoints.
+
+Raw 16-bit PCM and WAV uploads are converted straight from the request body
+into a 16 kHz float32 NumPy array (what Whisper consumes) without touching
+the disk. FLAC and Ogg (Vorbis/Opus) uploads are decoded in-process with
+soundfile when it is installed. ffmpeg is only used as a fallback for other
+compressed containers such as the browser's webm/opus, and is fed through a
+pipe instead of a temp file. A body sent with a generic content type is
+only taken for raw PCM when it doesn't start with a container signature.
+Other sample rates are resampled with a windowed-sinc low-pass filter, so
+content above 8 kHz doesn't alias into the speech band.
+"""
+import functools
+import io
+import math
+import os
+import subprocess
+import tempfile
+import threading
+import wave
+
+import numpy as np
+
+try:
+    import soundfile
+except ImportError:  # Optional: FLAC/Ogg uploads then go through ffmpeg
+    soundfile = None
+
+SAMPLE_RATE = 16000  # Whisper's input rate
+
+# Content types treated as headerless little-endian 16-bit mono PCM
+PCM_CONTENT_TYPES = ('audio/pcm', 'audio/l16', 'audio/x-raw', 'application/octet-stream')
+
+# Container signatures soundfile (libsndfile) decodes without ffmpeg
+SOUNDFILE_SIGNATURES = (b'fLaC', b'OggS')
+# Leading bytes of containers that are never headerless PCM: (offset, signature, format)
+CONTAINER_SIGNATURES = (
+    (0, b'RIFF', 'wav'),
+    (0, b'fLaC', 'flac'),
+    (0, b'OggS', 'ogg'),
+    (0, b'\x1a\x45\xdf\xa3', 'webm'),  # EBML (webm/matroska)
+    (0, b'ID3', 'mp3'),
+    (4, b'ftyp', 'mp4')
+)
+
+RESAMPLE_ZERO_CROSSINGS = 16  # Filter half-length in zero crossings of the sinc; more = sharper cutoff
+RESAMPLE_KAISER_BETA = 8.6    # Window shape: about 80 dB stopband attenuation
+RESAMPLE_BLOCK = 16384        # Output samples filtered at a time, bounding the gathered windows
+CONTENT_TYPE_SUFFIXES = {'audio/flac': '.flac', 'audio/x-flac': '.flac', 'audio/ogg': '.ogg', 'audio/opus': '.ogg'}
+
+
+def pcm16_to_float32(data):
+    """View raw 16-bit PCM bytes as float32 samples in [-1, 1)"""
+    # frombuffer is a zero-copy view; the only copy is the float conversion
+    return np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def container_format(data):
+    """Format name of an audio container recognized by its leading bytes, or None (e.g. raw PCM)"""
+    for offset, signature, name in CONTAINER_SIGNATURES:
+        if data[offset:offset + len(signature)] == signature:
+            return name
+    return None
+
+
+@functools.lru_cache(maxsize=16)
+def _resample_filter(up, down):
+    """Per-phase taps of a Kaiser-windowed sinc low-pass for resampling by up/down.
+
+    Row p holds the taps for an output point p/up of an input sample past
+    the tap at offset 0; the cutoff is the lower of the two Nyquist rates.
+    """
+    cutoff = min(1.0, up / down)  # Relative to the input's Nyquist rate
+    half = math.ceil(RESAMPLE_ZERO_CROSSINGS / cutoff)
+    offsets = np.arange(-half + 1, half + 1)
+    t = np.arange(up)[:, None] / up - offsets[None, :]  # Input samples from each tap to the output point
+    window = np.i0(RESAMPLE_KAISER_BETA * np.sqrt(np.clip(1 - (t / half) ** 2, 0, None))) / np.i0(RESAMPLE_KAISER_BETA)
+    taps = np.sinc(cutoff * t) * window
+    taps /= taps.sum(axis=1, keepdims=True)  # Unity gain at DC for every phase
+    return offsets, taps.astype(np.float32)
+
+
+def resample(audio, orig_rate, target_rate=SAMPLE_RATE):
+    """Resample a float32 signal in-process with a polyphase windowed-sinc filter"""
+    if orig_rate == target_rate or len(audio) == 0:
+        return audio
+    divisor = math.gcd(orig_rate, target_rate)
+    up, down = target_rate // divisor, orig_rate // divisor
+    offsets, taps = _resample_filter(up, down)
+    padded = np.pad(np.asarray(audio, dtype=np.float32), (len(offsets), len(offsets)))
+    target_length = (len(audio) * up + down - 1) // down
+    out = np.empty(target_length, dtype=np.float32)
+    # Only the output points are computed: each is one input window weighted by its phase's taps
+    for start in range(0, target_length, RESAMPLE_BLOCK):
+        positions = np.arange(start, min(start + RESAMPLE_BLOCK, target_length)) * down
+        base, phase = np.divmod(positions, up)
+        windows = padded[base[:, None] + offsets[None, :] + len(offsets)]
+        out[start:start + len(positions)] = np.einsum('ij,ij->i', windows, taps[phase])
+    return out
+
+
+def pcm_to_audio(data, sample_rate):
+    """Convert raw mono 16-bit PCM bytes to a 16 kHz float32 array (ValueError if they can't be PCM)"""
+    if len(data) % 2:
+        raise ValueError(f"PCM body has an odd length ({len(data)} bytes); expected 16-bit samples")
+    if sample_rate <= 0:
+        raise ValueError(f"Invalid PCM sample rate: {sample_rate}")
+    return resample(pcm16_to_float32(data), sample_rate)
+
+
+def wav_to_audio(data):
+    """Parse a 16-bit PCM WAV held in memory"""
+    with wave.open(io.BytesIO(data), 'rb') as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"Unsupported WAV sample width: {wf.getsampwidth() * 8} bits")
+        channels = wf.getnchannels()
+        sample_rate = wf.getframerate()
+        frames = wf.readframes(wf.getnframes())
+    audio = pcm16_to_float32(frames)
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+    return resample(audio, sample_rate)
+
+
+def ffmpeg_to_audio(data, suffix='.webm'):
+    """Decode a compressed container with ffmpeg (fallback path)"""
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0",
+        "-i", "pipe:0",
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE),
+        "pipe:1"
+    ]
+    result = subprocess.run(cmd, input=data, capture_output=True)
+    if result.returncode == 0 and result.stdout:
+        return pcm16_to_float32(result.stdout)
+
+    # Some containers (e.g. mp4 with a trailing moov atom) need a seekable input
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+        temp_file.write(data)
+        temp_filename = temp_file.name
+    try:
+        cmd[cmd.index("pipe:0")] = temp_filename
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Failed to decode audio: {result.stderr.decode(errors='ignore')[-300:]}")
+        return pcm16_to_float32(result.stdout)
+    finally:
+        os.unlink(temp_filename)
+
+
+# Containers a streaming session can receive chunk by chunk, and ffmpeg's demuxer for each
+STREAM_CONTAINERS = {'webm': 'matroska', 'ogg': 'ogg'}
+
+
+class StreamDecoder:
+    """Decodes a container that arrives in chunks through one long-lived ffmpeg process.
+
+    Chunks of a MediaRecorder stream can't be decoded on their own, but fed in
+    order to the same demuxer every byte is decoded exactly once, instead of
+    re-decoding the whole growing container for each chunk. A reader thread
+    collects the PCM ffmpeg writes as it goes.
+    """
+
+    def __init__(self, container, command=None):
+        if container not in STREAM_CONTAINERS:
+            raise ValueError(f"Unsupported streaming format: {container!r}")
+        self.command = command or [
+            "ffmpeg", "-nostdin", "-loglevel", "error",
+            "-fflags", "+nobuffer", "-probesize", "32768", "-analyzeduration", "0",
+            "-f", STREAM_CONTAINERS[container], "-i", "pipe:0",
+            "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE),
+            "-flush_packets", "1", "pipe:1"
+        ]
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL)
+        self.lock = threading.Lock()
+        self.pcm = bytearray()  # Decoded bytes not read yet
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def _read(self):
+        while True:
+            data = self.process.stdout.read1(65536)  # Whatever is available, without waiting to fill
+            if not data:
+                return
+            with self.lock:
+                self.pcm.extend(data)
+
+    def feed(self, data):
+        """Pass the next chunk to ffmpeg (ValueError if it has given up on the stream)"""
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            raise ValueError(f"Audio stream could not be decoded (ffmpeg exited with {self.process.poll()})")
+
+    def read(self):
+        """Samples decoded since the last read, as 16 kHz float32"""
+        with self.lock:
+            usable = len(self.pcm) - len(self.pcm) % 2
+            data = bytes(self.pcm[:usable])
+            del self.pcm[:usable]
+        return pcm16_to_float32(data)
+
+    def close(self, timeout=10):
+        """End the stream and wait until ffmpeg has written its last samples"""
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.reader.join(timeout)
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.abort()
+
+    def abort(self):
+        """Stop decoding an abandoned stream"""
+        self.process.kill()
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.process.wait()
+
+
+def soundfile_to_audio(data):
+    """Decode FLAC/Ogg (or anything else libsndfile reads) in memory, mixing down to mono"""
+    audio, rate = soundfile.read(io.BytesIO(data), dtype='float32', always_2d=True)
+    return resample(audio.mean(axis=1).astype(np.float32), rate)
+
+
+def decode_audio(data, content_type=None, sample_rate=None, filename=None):
+    """Decode an upload of any supported format to a 16 kHz float32 array"""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in PCM_CONTENT_TYPES and sample_rate and container_format(data) is None:
+        return pcm_to_audio(data, sample_rate)
+    if data[:4] == b'RIFF' and data[8:12] == b'WAVE':
+        try:
+            return wav_to_audio(data)
+        except (ValueError, wave.Error) as e:
+            print(f"In-memory WAV decode failed, falling back to ffmpeg: {e}")
+    if soundfile is not None and data[:4] in SOUNDFILE_SIGNATURES:
+        try:
+            return soundfile_to_audio(data)
+        except Exception as e:  # e.g. an Ogg codec this libsndfile build lacks
+            print(f"In-memory decode failed, falling back to ffmpeg: {e}")
+    suffix = (os.path.splitext(filename or '')[1] or CONTENT_TYPE_SUFFIXES.get(content_type)
+              or f".{container_format(data) or 'webm'}")
+    return ffmpeg_to_audio(data, suffix)
+
+
+class UploadStats:
+    """Per-format totals of upload size and decode/resample cost.
+
+    Makes the capture-format tradeoff measurable: compressed uploads are
+    smaller but cost more to decode, PCM at the wrong rate costs a resample.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = {}  # format -> [requests, bytes, audio seconds, decode seconds]
+
+    def record(self, audio_format, upload_bytes, audio_seconds, decode_seconds):
+        print(f"Upload: {audio_format}, {upload_bytes} bytes for {audio_seconds:.1f}s of audio, "
+              f"decoded in {decode_seconds * 1000:.1f} ms")
+        with self.lock:
+            totals = self.totals.setdefault(audio_format, [0, 0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += upload_bytes
+            totals[2] += audio_seconds
+            totals[3] += decode_seconds
+
+    def stats(self):
+        with self.lock:
+            return {
+                audio_format: {
+                    'requests': requests,
+                    'bytes': upload_bytes,
+                    'audio_seconds': round(audio_seconds, 1),
+                    'bytes_per_audio_second': round(upload_bytes / audio_seconds) if audio_seconds else None,
+                    'decode_ms': round(decode_seconds * 1000, 1),
+                    'decode_ms_per_audio_second': round(decode_seconds * 1000 / audio_seconds, 2) if audio_seconds else None
+                }
+                for audio_format, (requests, upload_bytes, audio_seconds, decode_seconds) in self.totals.items()
+            }
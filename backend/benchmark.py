@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark of the end-to-end /transcribe pipeline.
+
+Replays a directory of WAV fixtures through transcribe_audio() with Flask's
+test client, so upload parsing, decode, VAD, Whisper, cleanup and the history
+write all run exactly as in production, minus the network. The Novita
+endpoint is replaced by a local stub that answers after a configurable
+latency, history goes to a throwaway database and the cleanup cache is off,
+so nothing leaves the machine and repeated fixtures aren't served from cache.
+
+Each combination of model, inference engine, clip duration and concurrency
+is one run; the report has client latency percentiles, throughput,
+real-time factor, the median of every stage the server timed (plus its total
+and whatever no stage covered), the model's weight size, the process RSS
+once it is loaded and the peak RSS during the run:
+
+    python benchmark.py fixtures/ --models tiny,base --engines whisper,int8 \\
+        --durations 5,15 --concurrency 1,4 --output bench.json --csv bench.csv
+
+Models replaced during a sweep aren't always returned to the OS right away,
+so for exact memory comparisons benchmark one engine per invocation.
+
+Use --generate-fixtures DIR to write synthetic speech-like clips (drop
+recorded WAVs next to them). Whisper checkpoints must already be in the
+local cache; the benchmark never downloads them. All of the app's state
+(history, job queue, spooled uploads) goes to a temporary directory, so the
+source tree is left untouched.
+"""
+import argparse
+import csv
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+# Checkpoint files of the model names that are aliases of another release
+CHECKPOINT_ALIASES = {'large': 'large-v3', 'turbo': 'large-v3-turbo'}
+
+
+class CleanupStub:
+    """Local stand-in for the chat-completions cleanup endpoint.
+
+    Echoes the raw transcription back as the "cleaned" text after
+    latency_ms (plus up to jitter_ms of uniform noise).
+    """
+
+    def __init__(self, latency_ms=300, jitter_ms=0):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.rng = np.random.default_rng(0)
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, like the real endpoint
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                stub.respond(self, body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/v1/chat/completions'
+
+    def respond(self, handler, body):
+        with self.lock:
+            self.requests += 1
+            delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0)
+        time.sleep(delay)
+
+        prompt = body.get('messages', [{}])[-1].get('content', '')
+        raw_text = prompt.split('Raw transcription:', 1)[-1].strip()
+        reply = json.dumps({'choices': [{'message': {'role': 'assistant', 'content': raw_text}}]}).encode()
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(reply)))
+        handler.end_headers()
+        handler.wfile.write(reply)
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='cleanup-stub', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class PeakRSS:
+    """Samples this process's resident set size in the background and keeps the maximum"""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = 0
+        self.stopping = threading.Event()
+        self.thread = None
+
+    @staticmethod
+    def current():
+        """Current RSS in bytes (VmRSS on Linux, the lifetime peak elsewhere)"""
+        try:
+            with open('/proc/self/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+    def _sample(self):
+        while not self.stopping.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def __enter__(self):
+        self.peak = self.current()
+        self.thread = threading.Thread(target=self._sample, name='rss-sampler', daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopping.set()
+        self.thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def read_wav(path):
+    """16 kHz mono float32 samples of a PCM WAV file"""
+    with wave.open(path, 'rb') as wav:
+        width, channels, rate = wav.getsampwidth(), wav.getnchannels(), wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+    if width != 2:
+        raise ValueError(f"{path}: only 16-bit PCM WAV fixtures are supported")
+    audio = np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    if rate != SAMPLE_RATE:
+        positions = np.arange(int(len(audio) * SAMPLE_RATE / rate)) * rate / SAMPLE_RATE
+        audio = np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+    return audio
+
+
+def wav_bytes(audio):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm_bytes(audio))
+    return buffer.getvalue()
+
+
+def pcm_bytes(audio):
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+
+
+def fit_duration(audio, seconds):
+    """Loop or crop a clip to exactly `seconds`"""
+    length = int(seconds * SAMPLE_RATE)
+    if len(audio) == 0:
+        return np.zeros(length, dtype=np.float32)
+    return np.resize(audio, length).astype(np.float32)
+
+
+def synthetic_speech(seconds, seed=0):
+    """Voiced, syllable-rate modulated tones with word pauses: a stand-in VAD treats as speech"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 110 + 30 * np.sin(2 * np.pi * 0.3 * t + rng.uniform(0, np.pi))
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    syllables = np.clip(np.sin(2 * np.pi * 4.0 * t), 0, None)
+    words = (np.sin(2 * np.pi * 0.4 * t + rng.uniform(0, np.pi)) > -0.6).astype(np.float32)
+    audio = 0.2 * voiced * syllables * words + 0.003 * rng.standard_normal(len(t))
+    # Leading and trailing silence, like a push-to-talk clip
+    pad = np.zeros(int(0.5 * SAMPLE_RATE))
+    audio = np.concatenate([pad, audio, pad]) + 0.001 * rng.standard_normal(len(t) + 2 * len(pad))
+    return audio.astype(np.float32)
+
+
+def generate_fixtures(directory, durations=(3, 10, 25)):
+    os.makedirs(directory, exist_ok=True)
+    for i, seconds in enumerate(durations):
+        path = os.path.join(directory, f'synthetic_{seconds:g}s.wav')
+        with open(path, 'wb') as f:
+            f.write(wav_bytes(synthetic_speech(seconds, seed=i)))
+        print(f"Wrote {path}")
+
+
+def load_fixtures(directory):
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                   if name.lower().endswith('.wav'))
+    if not paths:
+        raise SystemExit(f"No .wav fixtures in {directory} (create some with --generate-fixtures)")
+    return [(os.path.basename(path), read_wav(path)) for path in paths]
+
+
+def check_checkpoints(models):
+    """Fail early, with a clear message, if a model would need a download"""
+    import whisper
+    root = os.path.join(os.getenv('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'whisper')
+    missing = []
+    for name in models:
+        if name not in whisper.available_models():
+            raise SystemExit(f"Unknown Whisper model '{name}'")
+        if not os.path.exists(os.path.join(root, CHECKPOINT_ALIASES.get(name, name) + '.pt')):
+            missing.append(name)
+    if missing:
+        raise SystemExit(f"Whisper checkpoints not cached in {root}: {', '.join(missing)}. "
+                         f"Load them once on a machine with network access, e.g. "
+                         f"python -c \"import whisper; whisper.load_model('{missing[0]}')\"")
+
+
+def weights_mb(model):
+    """Size of a loaded whisper model's parameters and buffers, int8-packed Linear weights included"""
+    if model is None or not hasattr(model, 'state_dict'):
+        return None  # Worker pool, or an engine that isn't a torch module
+
+    def tensor_bytes(value):
+        if isinstance(value, (tuple, list)):
+            return sum(tensor_bytes(item) for item in value)
+        if hasattr(value, 'element_size'):
+            return value.element_size() * value.numel()
+        return 0
+
+    return round(sum(tensor_bytes(value) for value in model.state_dict().values()) / 2 ** 20, 1)
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 1) if values else None
+
+
+def stage_names(all_timings):
+    """Every stage the server timed across these requests, in the order it reports them"""
+    names = {}
+    for timings in all_timings:
+        for key in timings:
+            if key.endswith('_ms') and key != 'total_ms':
+                names.setdefault(key[:-len('_ms')], None)
+    return list(names)
+
+
+class Benchmark:
+    """Runs the sweep against the app module and collects one report row per run"""
+
+    def __init__(self, app_module, clips, upload='wav', requests_per_run=None, warmup=1):
+        self.app = app_module
+        self.clips = clips  # [(name, audio)]
+        self.upload = upload
+        self.requests_per_run = requests_per_run
+        self.warmup = warmup
+        self.local = threading.local()
+
+    def client(self):
+        # One test client per thread, like separate connections
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.app.test_client()
+        return client
+
+    def send(self, audio, name):
+        """One /transcribe round trip; returns (seconds, status, server timings)"""
+        if self.upload == 'pcm':
+            kwargs = {'data': pcm_bytes(audio), 'content_type': 'audio/pcm',
+                      'headers': {'X-Sample-Rate': str(SAMPLE_RATE)}}
+        else:
+            kwargs = {'data': {'audio': (io.BytesIO(wav_bytes(audio)), name, 'audio/wav')},
+                      'content_type': 'multipart/form-data'}
+        started = time.perf_counter()
+        response = self.client().post('/transcribe?source=benchmark', **kwargs)
+        seconds = time.perf_counter() - started
+        body = response.get_json(silent=True) or {}
+        return seconds, response.status_code, body.get('timings') or {}
+
+    def run(self, model, engine, duration, concurrency):
+        clips = [(name, fit_duration(audio, duration) if duration else audio) for name, audio in self.clips]
+        count = self.requests_per_run or max(len(clips), 4 * concurrency)
+        jobs = [clips[i % len(clips)] for i in range(count)]
+
+        for name, audio in clips[:self.warmup]:
+            self.send(audio, name)
+
+        with PeakRSS() as rss, ThreadPoolExecutor(max_workers=concurrency) as pool:
+            started = time.perf_counter()
+            results = list(pool.map(lambda job: self.send(job[1], job[0]), jobs))
+            elapsed = time.perf_counter() - started
+
+        ok = [(seconds, timings) for seconds, status, timings in results if status == 200]
+        latencies = [seconds * 1000 for seconds, _ in ok]
+        audio_total = sum(len(audio) for _, audio in jobs) / SAMPLE_RATE
+        rtfs = [timings['rtf'] for _, timings in ok if 'rtf' in timings]
+        row = {
+            'model': model,
+            'engine': engine,
+            'duration_s': duration or 'native',
+            'concurrency': concurrency,
+            'requests': len(results),
+            'errors': len(results) - len(ok),
+            'latency_p50_ms': percentile(latencies, 50),
+            'latency_p95_ms': percentile(latencies, 95),
+            'latency_p99_ms': percentile(latencies, 99),
+            'latency_mean_ms': round(float(np.mean(latencies)), 1) if latencies else None,
+            'throughput_rps': round(len(ok) / elapsed, 3),
+            'audio_seconds_per_second': round(audio_total / elapsed, 3),
+            'rtf_mean': round(float(np.mean(rtfs)), 4) if rtfs else None,
+            'rtf_p95': round(float(np.percentile(rtfs, 95)), 4) if rtfs else None,
+            'wall_rtf': round(elapsed / audio_total, 4) if audio_total else None,
+            'peak_rss_mb': round(rss.peak / 2 ** 20, 1),
+        }
+        stages = stage_names(timings for _, timings in ok)
+        for stage in stages:
+            values = [timings[f'{stage}_ms'] for _, timings in ok if f'{stage}_ms' in timings]
+            row[f'{stage}_p50_ms'] = percentile(values, 50)
+        # Server time outside every stage (routing, JSON); large values mean a stage isn't timed
+        totals = [timings for _, timings in ok if 'total_ms' in timings]
+        row['other_p50_ms'] = percentile(
+            [timings['total_ms'] - sum(timings.get(f'{stage}_ms', 0) for stage in stages) for timings in totals], 50)
+        row['total_p50_ms'] = percentile([timings['total_ms'] for timings in totals], 50)
+        return row
+
+
+def parse_list(value, cast=str):
+    return [cast(item) for item in value.split(',') if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip(),
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('fixtures', nargs='?', help='Directory of .wav fixtures')
+    parser.add_argument('--generate-fixtures', metavar='DIR', help='Write synthetic fixtures to DIR and exit')
+    parser.add_argument('--models', default='tiny', help='Comma-separated Whisper models (default: tiny)')
+    parser.add_argument('--engines', default='whisper',
+                        help='Comma-separated inference engines, see engines.py (default: whisper)')
+    parser.add_argument('--durations', default='',
+                        help='Comma-separated clip lengths in seconds; fixtures are looped or cropped '
+                             '(default: as recorded)')
+    parser.add_argument('--concurrency', default='1,4', help='Comma-separated client thread counts (default: 1,4)')
+    parser.add_argument('--requests', type=int, default=None,
+                        help='Requests per run (default: max(fixtures, 4 x concurrency))')
+    parser.add_argument('--warmup', type=int, default=1, help='Unmeasured requests before each run (default: 1)')
+    parser.add_argument('--upload', choices=('wav', 'pcm'), default='wav',
+                        help='Multipart WAV like the web app, or raw PCM like the hotkey client')
+    parser.add_argument('--cleanup-latency-ms', type=float, default=300, help='Stub cleanup latency (default: 300)')
+    parser.add_argument('--cleanup-jitter-ms', type=float, default=0, help='Extra uniform random stub latency')
+    parser.add_argument('--output', default='benchmark.json', help='JSON report path (default: benchmark.json)')
+    parser.add_argument('--csv', help='Also write the rows as CSV')
+    parser.add_argument('--verbose', action='store_true', help="Show the app's per-request logging")
+    args = parser.parse_args()
+
+    if args.generate_fixtures:
+        generate_fixtures(args.generate_fixtures)
+        return
+    if not args.fixtures:
+        parser.error('a fixtures directory is required')
+
+    models = parse_list(args.models)
+    engines = parse_list(args.engines)
+    durations = parse_list(args.durations, float) or [None]
+    concurrency = parse_list(args.concurrency, int)
+    clips = load_fixtures(args.fixtures)
+    if any(engine != 'faster-whisper' for engine in engines):
+        check_checkpoints(models)
+
+    # Configure the app before importing it: everything local and uncached
+    stub = CleanupStub(args.cleanup_latency_ms, args.cleanup_jitter_ms).start()
+    workdir = tempfile.mkdtemp(prefix='whisper-bench-')
+    os.environ['NOVITA_API_URL'] = stub.url
+    os.environ['TRANSCRIPTION_DB_PATH'] = os.path.join(workdir, 'transcriptions.db')
+    os.environ['JOBS_DB_PATH'] = os.path.join(workdir, 'jobs.db')
+    os.environ['JOBS_SPOOL_DIR'] = os.path.join(workdir, 'job-uploads')
+    os.environ['CLEANUP_CACHE_SIZE'] = '0'
+    os.environ['TRANSCRIPT_CACHE_SIZE'] = '0'
+    os.environ.pop('CLEANUP_CACHE_PATH', None)
+    os.environ.pop('TRANSCRIPT_CACHE_PATH', None)
+    os.environ['WHISPER_MODEL'] = models[0]
+    os.environ['WHISPER_ENGINE'] = engines[0]
+    os.environ.setdefault('WHISPER_DEVICE', 'cpu')
+
+    log = sys.stdout if args.verbose else open(os.devnull, 'w')
+    with redirect_stdout(log):
+        import app as app_module
+        app_module.model_manager.wait()
+
+    benchmark = Benchmark(app_module, clips, upload=args.upload,
+                          requests_per_run=args.requests, warmup=args.warmup)
+    rows = []
+    try:
+        for model in models:
+            for engine in engines:
+                manager = app_module.model_manager
+                with redirect_stdout(log):
+                    if (manager.model_name, manager.engine) != (model, engine):
+                        manager.load(model, wait=True, engine=engine)
+                if (manager.model_name, manager.engine) != (model, engine) or not manager.ready:
+                    raise SystemExit(f"Failed to load Whisper model '{model}' ({engine} engine): {manager.error}")
+                gc.collect()
+                loaded = {
+                    'weights_mb': weights_mb(getattr(manager.runner, 'model', None)),
+                    'loaded_rss_mb': round(PeakRSS.current() / 2 ** 20, 1)
+                }
+                for duration in durations:
+                    for threads in concurrency:
+                        with redirect_stdout(log):
+                            row = benchmark.run(model, engine, duration, threads)
+                        row.update(loaded)
+                        rows.append(row)
+                        print(f"{model:>8} {engine:>14} {str(row['duration_s']):>7}s x{threads:<3} "
+                              f"p50 {row['latency_p50_ms']} ms  p95 {row['latency_p95_ms']} ms  "
+                              f"{row['throughput_rps']} req/s  RTF {row['rtf_mean']}  "
+                              f"RSS {row['loaded_rss_mb']}/{row['peak_rss_mb']} MB  errors {row['errors']}",
+                              file=sys.stderr)
+    finally:
+        with redirect_stdout(log):
+            app_module.drain()
+        stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    import torch
+    report = {
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'torch': torch.__version__,
+            'torch_threads': torch.get_num_threads(),
+        },
+        'config': {
+            'fixtures': [name for name, _ in clips],
+            'upload': args.upload,
+            'warmup': args.warmup,
+            'cleanup_latency_ms': args.cleanup_latency_ms,
+            'cleanup_jitter_ms': args.cleanup_jitter_ms,
+            'cleanup_requests': stub.requests,
+            'vad_enabled': app_module.VAD_ENABLED,
+            'max_batch_size': app_module.model_manager.max_batch_size,
+            'whisper_workers': app_module.model_manager.workers,
+        },
+        'results': rows
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            # Runs can time different stages (e.g. only long clips are chunked)
+            fieldnames = list(dict.fromkeys(key for row in rows for key in row))
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Wrote {args.csv}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""
+Small LRU cache with TTL and optional SQLite persistence.
+
+Values must be JSON-serializable. Entries live in an in-memory OrderedDict;
+when a SQLite path is given every put is also written through to disk, so
+the cache survives restarts and memory misses fall back to the file. The
+connection is opened per process on first use, so forked server workers
+never share one.
+get_or_compute() also coalesces concurrent misses on the same key, so a burst
+of identical requests computes the value once.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def make_key(*parts):
+    """Stable hash of arbitrary JSON-serializable key parts"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Thread-safe LRU + TTL cache, optionally backed by a SQLite file.
+
+    max_entries=0 turns caching off altogether: nothing is kept in memory or
+    on disk, and get_or_compute() computes every call.
+    """
+
+    def __init__(self, max_entries=1000, ttl=None, sqlite_path=None, table='cache', max_disk_entries=None):
+        self.max_entries = max_entries
+        self.ttl = ttl  # seconds, None = never expire
+        self.table = table
+        self.enabled = max_entries > 0
+        self.max_disk_entries = max_entries * 10 if max_disk_entries is None else max_disk_entries
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.pending = {}  # key -> Future of a computation in progress
+        self.puts_since_prune = 0
+
+        self.sqlite_path = sqlite_path if self.enabled else None
+        self.connection = None
+        self.connection_pid = None
+
+    @property
+    def db(self):
+        """This process's connection, or None without persistence (SQLite connections can't cross fork).
+
+        The table is created on first use rather than in the constructor, so
+        importing a module that builds a cache (as spawned worker processes
+        do) doesn't touch the file.
+        """
+        if not self.sqlite_path:
+            return None
+        if self.connection is None or self.connection_pid != os.getpid():
+            self.connection = sqlite3.connect(self.sqlite_path, check_same_thread=False)
+            self.connection_pid = os.getpid()
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute(f'''CREATE TABLE IF NOT EXISTS {self.table} (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                stored_at REAL NOT NULL
+            )''')
+            self._prune_disk()
+        return self.connection
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None and self.db is not None:
+                row = self.db.execute(f'SELECT value, expires_at FROM {self.table} WHERE key = ?',
+                                      (key,)).fetchone()
+                if row is not None:
+                    entry = (row[1], json.loads(row[0]))
+                    self._remember(key, entry)
+            if entry is None or (entry[0] is not None and entry[0] < now):
+                if entry is not None:
+                    self._forget(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self.lock:
+            self._remember(key, (expires_at, value))
+            if self.db is not None:
+                self.db.execute(f'INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?)',
+                                (key, json.dumps(value), expires_at, time.time()))
+                self.db.commit()
+                self.puts_since_prune += 1
+                if self.puts_since_prune >= 100:
+                    self._prune_disk()
+
+    def get_or_compute(self, key, compute, retry_on=()):
+        """Cached value for key, or compute() it once however many threads ask at the same time.
+
+        Returns (value, hit); hit is also True for threads that waited on
+        another's computation. None results aren't cached, and if compute()
+        raises, the threads waiting on it raise the same exception, except
+        for the `retry_on` exception types: those are the failing caller's
+        own, so the waiters go back and compute the value themselves.
+        """
+        if not self.enabled:
+            return compute(), False
+        while True:
+            value = self.get(key)
+            if value is not None:
+                return value, True
+            with self.lock:
+                future = self.pending.get(key)
+                owner = future is None
+                if owner:
+                    future = self.pending[key] = Future()
+                else:
+                    self.coalesced += 1
+            if owner:
+                break
+            try:
+                return future.result(), True
+            except retry_on:
+                continue
+
+        try:
+            value = compute()
+            if value is not None:
+                self.put(key, value)
+            future.set_result(value)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+        return value, False
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            if self.db is not None:
+                self.db.execute(f'DELETE FROM {self.table}')
+                self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'coalesced': self.coalesced,
+                'persistent': bool(self.sqlite_path)
+            }
+
+    # Callers hold self.lock
+
+    def _remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _forget(self, key):
+        self.entries.pop(key, None)
+        if self.db is not None:
+            self.db.execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+            self.db.commit()
+
+    def _prune_disk(self):
+        self.puts_since_prune = 0
+        self.db.execute(f'DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at < ?',
+                        (time.time(),))
+        self.db.execute(f'''DELETE FROM {self.table} WHERE key NOT IN (
+            SELECT key FROM {self.table} ORDER BY stored_at DESC LIMIT ?
+        )''', (self.max_disk_entries,))
+        self.db.commit()
@@ -0,0 +1,164 @@
+"""
+Client for the OpenAI-compatible cleanup endpoint (DeepSeek V3 via Novita).
+
+Requests go through one requests.Session with a keep-alive connection pool,
+so each transcription reuses a warm TLS connection instead of handshaking
+again. cleanup() enforces a latency budget: if the LLM hasn't answered in
+time it returns None together with a Future that resolves once the cleaned
+text does arrive, so the caller can fall back to the raw text now and patch
+the result in later. Optionally a second, hedged request is fired when the
+first one is slow, and whichever answers first wins.
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Prefixes the model sometimes adds despite being told not to
+UNWANTED_PREFIXES = [
+    "Here's the cleaned-up transcription:",
+    "Here is the cleaned-up transcription:",
+    "Cleaned transcription:",
+    "Here's the cleaned text:",
+    "Here is the cleaned text:",
+    "The cleaned text is:",
+    "Cleaned text:"
+]
+
+
+def strip_cleanup_artifacts(cleaned_text):
+    """Remove introductory prefixes and surrounding quotes from a model reply"""
+    for prefix in UNWANTED_PREFIXES:
+        if cleaned_text.startswith(prefix):
+            cleaned_text = cleaned_text[len(prefix):].strip()
+
+    if (cleaned_text.startswith('"') and cleaned_text.endswith('"')) or \
+       (cleaned_text.startswith("'") and cleaned_text.endswith("'")):
+        cleaned_text = cleaned_text[1:-1].strip()
+    return cleaned_text
+
+
+class CleanupClient:
+    """Pooled, budgeted client for chat-completions style cleanup calls"""
+
+    def __init__(self, api_url, api_key, model, system_prompt, prompt, temperature,
+                 budget=None, hedge_after=None, timeout=15, pool_size=8):
+        self.api_url = api_url
+        self.model = model
+        self.system_prompt = system_prompt
+        self.prompt = prompt  # format string with a {raw_text} field
+        self.temperature = temperature
+        self.budget = budget            # seconds to wait before returning without a cleanup
+        self.hedge_after = hedge_after  # seconds before a second request is sent
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='cleanup')
+
+        self.lock = threading.Lock()
+        self.stats_counts = {'requests': 0, 'failures': 0, 'hedged': 0, 'over_budget': 0, 'late_results': 0}
+
+    def _count(self, name):
+        with self.lock:
+            self.stats_counts[name] += 1
+
+    def request(self, raw_text):
+        """One blocking cleanup call; returns None if it failed"""
+        data = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": self.prompt.format(raw_text=raw_text)}
+            ],
+            "temperature": self.temperature,
+            "max_tokens": 500,
+            "response_format": {"type": "text"}
+        }
+        self._count('requests')
+        try:
+            response = self.session.post(self.api_url, json=data, timeout=self.timeout)
+            if response.status_code == 200:
+                result = response.json()
+                return strip_cleanup_artifacts(result["choices"][0]["message"]["content"].strip())
+            print(f"Novita API error: {response.status_code} - {response.text}")
+        except Exception as e:
+            print(f"Error with Novita/DeepSeek cleanup: {str(e)}")
+        self._count('failures')
+        return None
+
+    def cleanup(self, raw_text, budget=None):
+        """Clean up text within the latency budget.
+
+        Returns (cleaned_text, late_future). cleaned_text is None if no request
+        succeeded in time; late_future is then a Future resolving to the
+        cleaned text (or None) once a request finishes, otherwise None.
+        """
+        budget = self.budget if budget is None else budget
+        deadline = time.monotonic() + budget if budget else None
+        pending = {self.executor.submit(self.request, raw_text)}
+
+        if self.hedge_after and (deadline is None or self.hedge_after < budget):
+            done, _ = wait(pending, timeout=self.hedge_after)
+            if not done:
+                self._count('hedged')
+                pending.add(self.executor.submit(self.request, raw_text))
+
+        while pending:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.result() is not None:
+                    return future.result(), None
+            if not done:
+                break  # Budget exhausted
+
+        if not pending:
+            return None, None
+
+        self._count('over_budget')
+        return None, self._first_success(pending)
+
+    def _first_success(self, futures):
+        """Future resolving to the first non-None result among futures"""
+        late = Future()
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def on_done(future):
+            failed = future.cancelled() or future.exception() is not None
+            result = None if failed else future.result()
+            with lock:
+                remaining[0] -= 1
+                if late.done():
+                    return
+                if result is not None:
+                    self._count('late_results')
+                    late.set_result(result)
+                elif remaining[0] == 0:
+                    late.set_result(None)
+
+        for future in futures:
+            future.add_done_callback(on_done)
+        return late
+
+    def shutdown(self):
+        """Wait for in-flight requests (and their late-result callbacks), then close the pool"""
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def stats(self):
+        with self.lock:
+            return {
+                **self.stats_counts,
+                'budget_ms': int(self.budget * 1000) if self.budget else None,
+                'hedge_after_ms': int(self.hedge_after * 1000) if self.hedge_after else None
+            }
@@ -0,0 +1,120 @@
+"""
+Inference engines: how a Whisper model is loaded and run.
+
+WHISPER_ENGINE selects one:
+
+- whisper: openai-whisper as published, float32 on CPU. The reference.
+- int8: the same model with its Linear layers (nearly all of the weights)
+  dynamically quantized to int8 with torch, CPU only. Weights take about a
+  quarter of the memory and the matmuls run on int8 kernels; activations,
+  convolutions and embeddings stay float32.
+- faster-whisper: CTranslate2 with int8 weights, when the optional
+  faster-whisper package is installed. It fetches its converted models from
+  the Hugging Face hub, so they must already be cached on offline hosts.
+
+Every engine's model has transcribe(audio, **options) returning
+openai-whisper's result dict. The whisper and int8 models are ordinary
+whisper models, so the scheduler batches them; faster-whisper clips are
+transcribed one at a time.
+"""
+import torch
+import whisper
+from torch import nn
+
+try:
+    import faster_whisper
+except ImportError:  # Optional engine
+    faster_whisper = None
+
+
+def quantize_int8(model):
+    """Dynamically quantize a Whisper model's Linear layers to int8, in place"""
+    # whisper.model.Linear only overrides forward() to cast weights to the input dtype,
+    # and quantize_dynamic matches exact module types, so turn them into plain nn.Linear first
+    for module in model.modules():
+        if type(module) is whisper.model.Linear:
+            module.__class__ = nn.Linear
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+class WhisperEngine:
+    """openai-whisper in full precision"""
+
+    name = 'whisper'
+    precision = 'float32'
+    batching = True  # Model works with the scheduler's batched encoder/decoder passes
+
+    def load(self, model_name, device=None):
+        return whisper.load_model(model_name, device=device)
+
+
+class Int8Engine(WhisperEngine):
+    """openai-whisper with int8 dynamically quantized Linear layers"""
+
+    name = 'int8'
+    precision = 'int8'
+
+    def load(self, model_name, device=None):
+        if device not in (None, 'cpu'):
+            raise ValueError("The int8 engine runs on CPU only")
+        model = whisper.load_model(model_name, device='cpu')
+        return quantize_int8(model.eval())
+
+
+class FasterWhisperModel:
+    """Adapts a faster_whisper.WhisperModel to openai-whisper's transcribe() interface"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def transcribe(self, audio, **options):
+        segments, info = self.model.transcribe(
+            audio,
+            language=options.get('language'),
+            task=options.get('task', 'transcribe'),
+            temperature=options.get('temperature', 0.0),
+            condition_on_previous_text=options.get('condition_on_previous_text', True),
+            initial_prompt=options.get('initial_prompt'),
+            word_timestamps=bool(options.get('word_timestamps')),
+            beam_size=1  # Greedy, like openai-whisper's defaults
+        )
+        result_segments = []
+        for segment in segments:
+            entry = {'start': segment.start, 'end': segment.end, 'text': segment.text}
+            if segment.words is not None:
+                entry['words'] = [{'start': w.start, 'end': w.end, 'word': w.word} for w in segment.words]
+            result_segments.append(entry)
+        return {
+            'text': ''.join(segment['text'] for segment in result_segments),
+            'language': info.language,
+            'segments': result_segments
+        }
+
+
+class FasterWhisperEngine:
+    """CTranslate2 runtime with int8 weights (optional dependency)"""
+
+    name = 'faster-whisper'
+    precision = 'int8'
+    batching = False
+
+    def load(self, model_name, device=None):
+        if faster_whisper is None:
+            raise ValueError("The faster-whisper engine needs the faster-whisper package")
+        model = faster_whisper.WhisperModel(model_name, device=device or 'cpu', compute_type='int8',
+                                            cpu_threads=torch.get_num_threads())
+        return FasterWhisperModel(model)
+
+
+ENGINES = {engine.name: engine for engine in (WhisperEngine(), Int8Engine(), FasterWhisperEngine())}
+
+
+def available_engines():
+    """Names of the engines usable in this environment"""
+    return [name for name in ENGINES if name != 'faster-whisper' or faster_whisper is not None]
+
+
+def get_engine(name):
+    if name not in ENGINES:
+        raise ValueError(f"Unknown inference engine '{name}' (choose from {', '.join(ENGINES)})")
+    return ENGINES[name]
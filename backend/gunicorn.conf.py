@@ -0,0 +1,89 @@
+"""
+Gunicorn settings for serving the backend (what start.sh runs):
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is preloaded in the master, which loads and warms the Whisper model
+once before forking, so workers share its weights copy-on-write instead of
+each loading a copy. Every worker runs its own inference thread and handles
+requests on a thread pool; background threads and SQLite connections are
+created per process on first use.
+
+The worker-pool mode (WHISPER_WORKERS > 0) owns child processes that can't be
+shared across fork, so it runs without preloading and each gunicorn worker
+loads its own pool.
+
+On SIGTERM workers stop accepting, finish in-flight requests (up to
+graceful_timeout), then drain late cleanups and queued history writes.
+Open history event streams are cut at the graceful timeout; browsers
+reconnect on their own.
+
+Run a single worker (the default) unless you know the deployment tolerates
+per-process state: live streaming sessions, the model picked through
+POST /model, history event wakeups and the admission queue all live in the
+worker that handled the request. With several workers a stream's finish can
+land on a worker that never saw it (404), a hot-swap only changes one
+worker, and each worker admits its own share of inference work. Each open
+history event stream holds one of the worker's threads, so they are capped
+at HISTORY_EVENTS_MAX_STREAMS per worker; clients past the cap fall back to
+polling.
+
+Requests waiting for admission to inference each hold a thread, so by default
+every worker gets enough threads for the whole admission queue plus the event
+streams (see admission_threads below). With fewer, the overflow waits in the
+accept backlog instead: first come first served, never prioritized and never
+answered 429. post_worker_init warns when GUNICORN_THREADS is set below that.
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))  # See the docstring before raising
+worker_class = 'gthread'
+
+# The app's defaults (see app.py): admission concurrency is one batch or one clip per worker process
+admission_concurrency = (int(os.environ.get('ADMISSION_CONCURRENCY', 0)) or int(os.environ.get('WHISPER_WORKERS', 0))
+                         or int(os.environ.get('WHISPER_MAX_BATCH_SIZE', 8)))
+admission_threads = (admission_concurrency + int(os.environ.get('ADMISSION_MAX_QUEUED', 32))
+                     + int(os.environ.get('HISTORY_EVENTS_MAX_STREAMS', 2)) + 8)  # 8 spare for history, health, cleanups
+threads = int(os.environ.get('GUNICORN_THREADS', 0)) or admission_threads  # Concurrent requests per worker
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))  # Long clips on CPU can take a while
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 60))
+keepalive = 5
+
+# Header limits; the body size limit is the app's MAX_UPLOAD_MB
+limit_request_line = 8190
+limit_request_fields = 100
+limit_request_field_size = 8190
+
+preload_app = int(os.environ.get('WHISPER_WORKERS', 0)) == 0
+
+# Split the cores between the workers' inference threads unless told otherwise
+if preload_app and not os.environ.get('WHISPER_THREADS'):
+    os.environ['WHISPER_THREADS'] = str(max(1, (os.cpu_count() or 1) // workers))
+
+
+def when_ready(server):
+    # Runs in the master before the first fork: wait for the model so workers inherit it loaded
+    if preload_app:
+        from app import model_manager
+        if not model_manager.wait():
+            server.log.warning("Whisper model not ready (%s); workers start without it", model_manager.status)
+
+
+def post_worker_init(worker):
+    # Starts this worker's inference thread and primes torch's thread pool before serving,
+    # then its job runners (which pick up jobs still queued from before a restart)
+    from app import job_queue, model_manager, request_threads_needed
+    needed = request_threads_needed()
+    if worker.cfg.threads < needed:
+        worker.log.warning("%d threads can't hold the %d requests admission control may keep (concurrency, "
+                           "queue and event streams); the rest wait unprioritized in the accept backlog",
+                           worker.cfg.threads, needed)
+    model_manager.warm_up()
+    job_queue.start()
+
+
+def worker_exit(server, worker):
+    from app import drain
+    drain()
@@ -0,0 +1,230 @@
+"""
+Batched Whisper inference.
+
+A single worker thread owns the model. Request handlers submit audio and get
+a Future back; the worker collects whatever arrives within a short window
+(up to max_batch_size clips) and runs the log-mel, encoder and decoder passes
+over the whole batch at once. Clips that can't share a batch (longer than one
+30 s window, or needing word timestamps / prompts) are transcribed one by one
+by the same worker, so the model is never used from two threads at a time.
+Models without whisper's encoder/decoder interface (batching=False, e.g. the
+faster-whisper engine) always take the one-by-one path.
+
+Each result carries a `timings` dict (seconds): time spent queued, then the
+encoder and decoder passes for batched clips, or the whole inference for
+clips transcribed one by one.
+
+The worker thread is started per process: a server that forks after loading
+(gunicorn with preload_app) shares the model copy-on-write, and each forked
+child starts its own worker on first use.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+import whisper
+from whisper.audio import HOP_LENGTH, N_FFT, N_SAMPLES, SAMPLE_RATE
+
+# Options that force the per-clip model.transcribe() path
+_UNBATCHABLE_OPTIONS = ('word_timestamps', 'initial_prompt', 'clip_timestamps')
+
+
+def batched_log_mel(audios, n_mels):
+    """Log-mel spectrogram of a list of clips, padded to 30 s and computed as one batch"""
+    batch = torch.stack([
+        torch.from_numpy(whisper.pad_or_trim(audio)) if not torch.is_tensor(audio)
+        else whisper.pad_or_trim(audio)
+        for audio in audios
+    ])
+    window = torch.hann_window(N_FFT)
+    stft = torch.stft(batch, N_FFT, HOP_LENGTH, window=window, return_complex=True)
+    magnitudes = stft[..., :-1].abs() ** 2
+
+    filters = whisper.audio.mel_filters(batch.device, n_mels)
+    log_spec = torch.clamp(filters @ magnitudes, min=1e-10).log10()
+    # Same dynamic-range clamp as whisper.log_mel_spectrogram, but per clip
+    log_spec = torch.maximum(log_spec, log_spec.amax(dim=(-2, -1), keepdim=True) - 8.0)
+    return (log_spec + 4.0) / 4.0
+
+
+class RunnerClosed(RuntimeError):
+    """Raised by submit() on a runner that has been shut down (e.g. replaced by a hot-swap)"""
+
+
+class _Job:
+    __slots__ = ('audio', 'options', 'future', 'queued_at')
+
+    def __init__(self, audio, options):
+        self.audio = audio
+        self.options = options
+        self.future = Future()
+        self.queued_at = time.perf_counter()
+
+
+class InferenceScheduler:
+    """Single-owner Whisper worker that batches concurrent requests"""
+
+    def __init__(self, model, options, max_batch_size=8, max_wait=0.02, batching=True):
+        self.model = model
+        self.options = options  # default model.transcribe() kwargs
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batching = batching
+
+        self.batches_run = 0
+        self.clips_batched = 0
+        self.clips_sequential = 0
+
+        self.pid = None  # Process the worker thread runs in
+        self.start_lock = threading.Lock()
+        self.closed = False
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        # Threads don't survive fork(), so a forked child starts its own worker
+        if self.pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.pid != os.getpid():
+                self.queue = queue.Queue()
+                self.worker = threading.Thread(target=self._run, name='whisper-scheduler', daemon=True)
+                self.worker.start()
+                self.pid = os.getpid()
+
+    def submit(self, audio, options=None):
+        """Queue a 16 kHz float32 clip; returns a Future resolving to a transcribe()-style dict"""
+        self._ensure_worker()
+        job = _Job(audio, options or {})
+        # Checked under the lock so no job can land behind the shutdown sentinel
+        with self.start_lock:
+            if self.closed:
+                raise RunnerClosed("Inference scheduler has been shut down")
+            self.queue.put(job)
+        return job.future
+
+    def shutdown(self):
+        """Finish the jobs already queued, then stop; later submits raise RunnerClosed"""
+        with self.start_lock:
+            self.closed = True
+            if self.pid != os.getpid():
+                return  # Worker belongs to the parent process; nothing queued here
+            self.queue.put(None)
+        self.worker.join()
+        # Fail anything the worker left behind rather than leave its caller waiting forever
+        while True:
+            try:
+                job = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None and job.future.set_running_or_notify_cancel():
+                job.future.set_exception(RunnerClosed("Inference scheduler shut down before the clip ran"))
+
+    def stats(self):
+        return {
+            'mode': 'batched' if self.batching else 'sequential',
+            'queue_depth': self.queue.qsize(),
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': int(self.max_wait * 1000),
+            'batches_run': self.batches_run,
+            'clips_batched': self.clips_batched,
+            'clips_sequential': self.clips_sequential
+        }
+
+    # ---------------------------------------------------------------- worker
+
+    def _batchable(self, job):
+        return (self.batching and len(job.audio) <= N_SAMPLES and
+                not any(job.options.get(key) for key in _UNBATCHABLE_OPTIONS))
+
+    def _collect(self, first):
+        """Gather jobs arriving within max_wait of the first one"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if job is None:
+                self.queue.put(None)  # Re-queue the shutdown sentinel
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            jobs = self._collect(job) if self._batchable(job) else [job]
+            # Skip anything cancelled while queued
+            jobs = [j for j in jobs if j.future.set_running_or_notify_cancel()]
+
+            batchable = [j for j in jobs if self._batchable(j)]
+            for j in jobs:
+                if j not in batchable:
+                    self._transcribe_one(j)
+            if len(batchable) == 1:
+                self._transcribe_one(batchable[0])
+            elif batchable:
+                self._decode_batch(batchable)
+
+    def _transcribe_one(self, job):
+        try:
+            started = time.perf_counter()
+            result = self.model.transcribe(job.audio, **{**self.options, **job.options})
+            result['timings'] = {'queue': started - job.queued_at, 'inference': time.perf_counter() - started}
+            self.clips_sequential += 1
+            job.future.set_result(result)
+        except Exception as e:
+            job.future.set_exception(e)
+
+    def _decode_batch(self, jobs):
+        started = time.perf_counter()
+        try:
+            with torch.no_grad():
+                mel = batched_log_mel([j.audio for j in jobs], self.model.dims.n_mels)
+                decode_options = whisper.DecodingOptions(
+                    task=self.options.get('task', 'transcribe'),
+                    language=self.options.get('language'),
+                    temperature=self.options.get('temperature', 0.0),
+                    fp16=self.options.get('fp16', False),
+                    without_timestamps=True
+                )
+                mel = mel.to(self.model.device)
+                # Encode separately (decode() skips the encoder when given features) to time both passes
+                audio_features = self.model.encoder(mel.half() if decode_options.fp16 else mel)
+                encoded = time.perf_counter()
+                results = whisper.decode(self.model, audio_features, decode_options)
+                decoded = time.perf_counter()
+        except Exception as e:
+            # Fall back to decoding clips one at a time
+            print(f"Batched decode failed ({e}), decoding {len(jobs)} clips sequentially")
+            for job in jobs:
+                self._transcribe_one(job)
+            return
+
+        self.batches_run += 1
+        self.clips_batched += len(jobs)
+        for job, result in zip(jobs, results):
+            text = result.text
+            # Same silence rule model.transcribe() applies per window
+            if result.no_speech_prob > 0.6 and result.avg_logprob < -1.0:
+                text = ""
+            duration = len(job.audio) / SAMPLE_RATE
+            job.future.set_result({
+                'text': text,
+                'language': result.language,
+                'segments': [{'start': 0.0, 'end': duration, 'text': text}] if text else [],
+                'timings': {
+                    'queue': started - job.queued_at,
+                    'encoder': encoded - started,
+                    'decoder': decoded - encoded
+                }
+            })
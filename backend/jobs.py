@@ -0,0 +1,407 @@
+"""
+Asynchronous transcription jobs for bulk uploads and long recordings.
+
+POST /jobs spools each upload to disk and records a queued job in SQLite;
+runner threads claim jobs one at a time and hand them to a processing
+function, which transcribes the audio chunk by chunk and reports progress
+and the segments decoded so far after every chunk. Because all state lives
+in the database, GET /jobs/<id> works from any server process, and queued
+jobs survive a restart.
+
+The queue is bounded: a submission that would leave more than max_queued
+jobs waiting is rejected as a whole. Each server process runs `workers`
+runners once start() is called, and a job is claimed with a single UPDATE,
+so gunicorn workers share the queue without ever running a job twice. Bulk
+work therefore holds at most a few Whisper chunks per runner, and
+interactive requests are interleaved between them. On shutdown a running job
+stops after its current chunk and goes back to the queue; it resumes from
+the last reported position.
+
+A claimed job carries a lease that its process renews while it runs. Jobs
+whose lease has run out (their process crashed, or the container restarted)
+are requeued the same way. PIDs can't decide this: a restarted container
+often hands the new server the very PID of the one that died.
+
+Nothing touches the disk until first use, so merely importing the app (as
+spawned pool workers and the benchmark do) creates no database or spool
+directory.
+"""
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        filename TEXT NOT NULL,
+        mimetype TEXT,
+        spool_path TEXT,
+        source TEXT NOT NULL,
+        client_key TEXT,
+        status TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        started_at TEXT,
+        finished_at TEXT,
+        worker_pid INTEGER,
+        owner TEXT,
+        lease_until REAL,
+        audio_seconds REAL,
+        processed_seconds REAL NOT NULL DEFAULT 0,
+        raw_text TEXT,
+        cleaned_text TEXT,
+        transcription TEXT,
+        error TEXT
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_client_key ON jobs(client_key) WHERE client_key IS NOT NULL',
+    '''CREATE TABLE IF NOT EXISTS job_segments (
+        job_id TEXT NOT NULL,
+        idx INTEGER NOT NULL,
+        start REAL NOT NULL,
+        end REAL NOT NULL,
+        text TEXT NOT NULL,
+        PRIMARY KEY (job_id, idx)
+    )''',
+]
+
+# Columns added after the first release: (name, ALTER TABLE statement)
+MIGRATIONS = [
+    ('owner', 'ALTER TABLE jobs ADD COLUMN owner TEXT'),
+    ('lease_until', 'ALTER TABLE jobs ADD COLUMN lease_until REAL'),
+]
+
+POLL_SECONDS = 1.0  # How often idle runners look for jobs queued by other processes
+LEASE_SECONDS = 60.0  # A running job whose lease isn't renewed for this long is requeued
+HEARTBEAT_SECONDS = 10.0  # How often a process renews the leases of the jobs it runs
+
+
+class JobQueueFull(Exception):
+    """Raised when a submission would exceed the queue's capacity"""
+
+
+class JobInterrupted(Exception):
+    """Raised from a progress report when the queue is shutting down"""
+
+
+def _now():
+    return datetime.datetime.now().isoformat()
+
+
+def group_text(texts, max_words=250):
+    """Join consecutive texts into passages of roughly max_words words"""
+    passages, current, words = [], [], 0
+    for text in texts:
+        current.append(text)
+        words += len(text.split())
+        if words >= max_words:
+            passages.append(' '.join(current))
+            current, words = [], 0
+    if current:
+        passages.append(' '.join(current))
+    return passages
+
+
+class JobQueue:
+    """Durable, bounded queue of transcription jobs with per-process runner threads.
+
+    process_fn(job, report) does the work: job is the stored row as a dict
+    (including processed_seconds, to resume from), report(processed_seconds,
+    segments, audio_seconds=None) persists progress and new segments, and the
+    return value is a dict of raw_text, cleaned_text and transcription.
+    """
+
+    def __init__(self, path, spool_dir, process_fn, workers=1, max_queued=100,
+                 retention_hours=None, ready_fn=None):
+        self.path = path
+        self.spool_dir = spool_dir
+        self.process_fn = process_fn
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retention_hours = retention_hours  # Finished jobs older than this are deleted
+        self.ready_fn = ready_fn  # Runners idle until this returns True (e.g. model loaded)
+        self.local = threading.local()
+        self.finished_count = 0
+        self.failed_count = 0
+        self.ready = False
+        self.setup_lock = threading.Lock()
+
+        self.owner = None  # Lease holder name of this process's runners, new with every start()
+        self.runner_pid = None  # Process the runner threads belong to
+        self.runner_lock = threading.Lock()
+        self.runners = []
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+
+    def _set_up(self):
+        if self.ready:
+            return
+        with self.setup_lock:
+            if not self.ready:
+                os.makedirs(self.spool_dir, exist_ok=True)
+                db = self._open()
+                db.execute('PRAGMA journal_mode=WAL')
+                for statement in SCHEMA:
+                    db.execute(statement)
+                existing = {row['name'] for row in db.execute('PRAGMA table_info(jobs)')}
+                for column, ddl in MIGRATIONS:
+                    if column not in existing:
+                        db.execute(ddl)
+                db.commit()
+                db.close()
+                self.ready = True
+
+    def _connect(self):
+        self._set_up()
+        return self._open()
+
+    def _open(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+    @property
+    def db(self):
+        """Connection for the calling thread, reopened after a fork"""
+        if getattr(self.local, 'db', None) is None or self.local.pid != os.getpid():
+            self.local.db = self._connect()
+            self.local.pid = os.getpid()
+        return self.local.db
+
+    def start(self):
+        """Start this process's runners (safe to call repeatedly and after fork).
+
+        Called by the server once it's ready to work; reading and submitting
+        jobs doesn't start anything, so other processes can share the queue.
+        """
+        if self.runner_pid == os.getpid() or self.workers <= 0:
+            return
+        with self.runner_lock:
+            if self.runner_pid != os.getpid():
+                self.owner = f'{os.getpid()}-{uuid.uuid4().hex}'
+                self.wakeup = threading.Event()
+                self.stopping = threading.Event()
+                self.runners = [threading.Thread(target=self._run, name=f'job-runner-{i}', daemon=True)
+                                for i in range(self.workers)]
+                self.runners.append(threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True))
+                for runner in self.runners:
+                    runner.start()
+                self.runner_pid = os.getpid()
+
+    def shutdown(self):
+        """Stop the runners; a running job is requeued after its current chunk"""
+        if self.runner_pid != os.getpid():
+            return
+        self.stopping.set()
+        self.wakeup.set()
+        for runner in self.runners:
+            runner.join()
+
+    # ---------------------------------------------------------------- submissions
+
+    def submit(self, uploads, source='bulk', client_key=None):
+        """Queue [(filename, mimetype, data)] as one job each; returns the jobs.
+
+        All or nothing: raises JobQueueFull if they don't fit. With a
+        client_key (suffixed with the file's position when there are several),
+        a file that was already submitted returns its existing job instead.
+        """
+        keys = [None] * len(uploads) if client_key is None else \
+            [client_key] if len(uploads) == 1 else [f'{client_key}-{i + 1}' for i in range(len(uploads))]
+
+        db = self.db
+        spooled = []
+        try:
+            with db:
+                db.execute('BEGIN IMMEDIATE')  # Count and insert atomically across processes
+                existing = {key: row['id'] for key in keys if key is not None
+                            for row in db.execute('SELECT id FROM jobs WHERE client_key = ?', (key,))}
+                new = sum(1 for key in keys if key not in existing)
+                queued = db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                if queued + new > self.max_queued:
+                    raise JobQueueFull(f'Job queue is full ({queued} of {self.max_queued} queued, {new} submitted)')
+
+                job_ids = []
+                for (filename, mimetype, data), key in zip(uploads, keys):
+                    if key in existing:
+                        job_ids.append(existing[key])
+                        continue
+                    job_id = uuid.uuid4().hex
+                    spool_path = os.path.join(self.spool_dir, job_id)
+                    with open(spool_path, 'wb') as f:
+                        f.write(data)
+                    spooled.append(spool_path)
+                    db.execute('''INSERT INTO jobs (id, filename, mimetype, spool_path, source, client_key,
+                                                    status, created_at)
+                                  VALUES (?, ?, ?, ?, ?, ?, 'queued', ?)''',
+                               (job_id, filename, mimetype, spool_path, source, key, _now()))
+                    job_ids.append(job_id)
+        except Exception:
+            for spool_path in spooled:
+                os.remove(spool_path)
+            raise
+
+        self.wakeup.set()
+        return [self.get(job_id, include_segments=False) for job_id in job_ids]
+
+    def get(self, job_id, since=0, include_segments=True):
+        """API representation of a job (segments from index `since`), or None"""
+        row = self.db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            'id': row['id'],
+            'filename': row['filename'],
+            'status': row['status'],
+            'source': row['source'],
+            'created_at': row['created_at'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at'],
+            'audio_seconds': row['audio_seconds'],
+            'processed_seconds': round(row['processed_seconds'], 2),
+            'progress': 1.0 if row['status'] == 'done' else
+                        round(min(1.0, row['processed_seconds'] / row['audio_seconds']), 3)
+                        if row['audio_seconds'] else 0.0,
+            'error': row['error'],
+            'raw_text': row['raw_text'],
+            'cleaned_text': row['cleaned_text'],
+            'transcription': json.loads(row['transcription']) if row['transcription'] else None
+        }
+        if row['status'] == 'queued':
+            job['queue_position'] = self.db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?", (row['created_at'],)
+            ).fetchone()[0]
+        if include_segments:
+            segments = self.db.execute(
+                'SELECT idx, start, end, text FROM job_segments WHERE job_id = ? AND idx >= ? ORDER BY idx',
+                (job_id, since)
+            ).fetchall()
+            job['segments'] = [{'index': s['idx'], 'start': s['start'], 'end': s['end'], 'text': s['text']}
+                               for s in segments]
+            job['segment_count'] = self.db.execute(
+                'SELECT COUNT(*) FROM job_segments WHERE job_id = ?', (job_id,)
+            ).fetchone()[0]
+        return job
+
+    def stats(self):
+        counts = {row['status']: row['n'] for row in
+                  self.db.execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status')}
+        return {
+            'queued': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'max_queued': self.max_queued,
+            'runners_per_process': self.workers,
+            'finished_here': self.finished_count,
+            'failed_here': self.failed_count
+        }
+
+    # ---------------------------------------------------------------- runners
+
+    def _run(self):
+        while not self.stopping.is_set():
+            job = None
+            if self.ready_fn is None or self.ready_fn():
+                try:
+                    job = self._claim()
+                except sqlite3.Error as e:
+                    print(f"Error claiming transcription job: {str(e)}")
+            if job is None:
+                self.wakeup.wait(POLL_SECONDS)
+                self.wakeup.clear()
+                continue
+            self._execute(job)
+
+    def _heartbeat(self):
+        while not self.stopping.wait(HEARTBEAT_SECONDS):
+            try:
+                with self.db as db:
+                    db.execute("UPDATE jobs SET lease_until = ? WHERE status = 'running' AND owner = ?",
+                               (time.time() + LEASE_SECONDS, self.owner))
+            except sqlite3.Error as e:
+                print(f"Error renewing transcription job leases: {str(e)}")
+
+    def _claim(self):
+        """Mark the oldest queued job as running in this process and return it"""
+        self._requeue_orphans()
+        with self.db as db:
+            row = db.execute('''UPDATE jobs SET status = 'running', worker_pid = ?, owner = ?, lease_until = ?,
+                                    started_at = IFNULL(started_at, ?)
+                                WHERE id = (SELECT id FROM jobs WHERE status = 'queued'
+                                            ORDER BY created_at LIMIT 1)
+                                RETURNING *''', (os.getpid(), self.owner, time.time() + LEASE_SECONDS,
+                                                   _now())).fetchone()
+        return dict(row) if row is not None else None
+
+    def _requeue_orphans(self):
+        # Running jobs from before leases existed have none; their process is long gone
+        with self.db as db:
+            rows = db.execute('''UPDATE jobs SET status = 'queued', owner = NULL, lease_until = NULL
+                                 WHERE status = 'running' AND IFNULL(lease_until, 0) < ?
+                                 RETURNING id, worker_pid''', (time.time(),)).fetchall()
+        for row in rows:
+            print(f"Requeued transcription job {row['id']}: its lease expired (process {row['worker_pid']})")
+        self._prune()
+
+    def _prune(self):
+        if not self.retention_hours:
+            return
+        cutoff = (datetime.datetime.now() - datetime.timedelta(hours=self.retention_hours)).isoformat()
+        with self.db as db:
+            db.execute('''DELETE FROM job_segments WHERE job_id IN
+                          (SELECT id FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?)''',
+                       (cutoff,))
+            db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+
+    def _report(self, job_id, processed_seconds, segments, audio_seconds=None):
+        with self.db as db:
+            next_index = db.execute('SELECT COUNT(*) FROM job_segments WHERE job_id = ?',
+                                    (job_id,)).fetchone()[0]
+            db.executemany('INSERT INTO job_segments VALUES (?, ?, ?, ?, ?)',
+                           [(job_id, next_index + i, round(s['start'], 2), round(s['end'], 2), s['text'])
+                            for i, s in enumerate(segments)])
+            db.execute('UPDATE jobs SET processed_seconds = ?, audio_seconds = IFNULL(?, audio_seconds), '
+                       'lease_until = ? WHERE id = ?',
+                       (processed_seconds, audio_seconds, time.time() + LEASE_SECONDS, job_id))
+        if self.stopping.is_set():
+            raise JobInterrupted()
+
+    def _execute(self, job):
+        job_id = job['id']
+        print(f"📼 Transcription job {job_id} ({job['filename']}) started")
+
+        def report(processed_seconds, segments, audio_seconds=None):
+            self._report(job_id, processed_seconds, segments, audio_seconds)
+
+        try:
+            result = self.process_fn(job, report)
+        except JobInterrupted:
+            print(f"Transcription job {job_id} interrupted, requeued")
+            with self.db as db:
+                db.execute("UPDATE jobs SET status = 'queued', owner = NULL, lease_until = NULL WHERE id = ?",
+                           (job_id,))
+            return
+        except Exception as e:
+            print(f"Transcription job {job_id} failed: {str(e)}")
+            self.failed_count += 1
+            self._finish(job, status='failed', error=str(e))
+            return
+
+        self.finished_count += 1
+        self._finish(job, status='done', **result)
+        print(f"✅ Transcription job {job_id} done")
+
+    def _finish(self, job, status, raw_text=None, cleaned_text=None, transcription=None, error=None):
+        with self.db as db:
+            db.execute('''UPDATE jobs SET status = ?, finished_at = ?, raw_text = ?, cleaned_text = ?,
+                                          transcription = ?, error = ?, spool_path = NULL
+                          WHERE id = ?''',
+                       (status, _now(), raw_text, cleaned_text,
+                        json.dumps(transcription) if transcription is not None else None, error, job['id']))
+        if job['spool_path'] and os.path.exists(job['spool_path']):
+            os.remove(job['spool_path'])
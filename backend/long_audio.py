@@ -0,0 +1,164 @@
+"""
+Parallel transcription of long recordings.
+
+model.transcribe() walks a long clip one 30 s window after another, each
+conditioned on the previous window's text, so an hour of audio runs
+serially. Here the recording is split at pauses found by the VAD into
+chunks of at most one Whisper window, all chunks are submitted to the
+inference runner at once (batched by the scheduler, or spread over the
+worker processes with WHISPER_WORKERS), and the results are stitched back
+together in order with segment times offset to the full recording.
+
+A chunk is only cut mid-speech when no pause falls inside the window; it
+then shares `overlap_seconds` of audio with the next chunk, and the words
+both chunks transcribed from that overlap are dropped from the second one.
+"""
+import re
+import time
+from collections import namedtuple
+
+from audio_io import SAMPLE_RATE
+from vad import detect_speech
+
+# Sample range of one chunk; overlap is how many samples it shares with the previous chunk
+Chunk = namedtuple('Chunk', 'start end overlap')
+
+PAUSE_PADDING_MS = 200  # Audio kept around the speech at either end of the recording
+MAX_MATCH_WORDS = 12    # Words compared across an overlapped boundary
+MAX_SKIPPED_WORDS = 2   # A chunk may open with a clipped word before the repeated ones
+
+
+def split_at_pauses(audio, max_seconds=30, overlap_seconds=1.0, drop_silence=True, sample_rate=SAMPLE_RATE):
+    """Cut a recording into Chunks of at most max_seconds, at pauses where possible.
+
+    Within each window the longest pause in its second half is preferred (any
+    pause if there is none there), which keeps chunks long and cuts where the
+    speaker stopped longest. With drop_silence, leading/trailing silence and
+    chunks without any speech are left out.
+    """
+    regions = detect_speech(audio, sample_rate)
+    if not regions:
+        return [] if drop_silence else [Chunk(0, len(audio), 0)]
+
+    max_length = int(max_seconds * sample_rate)
+    overlap = int(overlap_seconds * sample_rate)
+    if drop_silence:
+        padding = int(sample_rate * PAUSE_PADDING_MS / 1000)
+        start, end = max(0, regions[0][0] - padding), min(len(audio), regions[-1][1] + padding)
+    else:
+        start, end = 0, len(audio)
+    # Candidate cuts: the middle of each pause, with the pause's length
+    pauses = [((previous[1] + following[0]) // 2, following[0] - previous[1])
+              for previous, following in zip(regions, regions[1:])]
+
+    chunks = []
+    shared = 0
+    while end - start > max_length:
+        limit = start + max_length
+        candidates = [pause for pause in pauses if start < pause[0] <= limit]
+        if candidates:
+            late = [pause for pause in candidates if pause[0] >= start + max_length // 2] or candidates
+            cut = max(late, key=lambda pause: pause[1])[0]
+            chunks.append(Chunk(start, cut, shared))
+            start, shared = cut, 0
+        else:
+            # No pause in a whole window: cut mid-speech and overlap the next chunk
+            chunks.append(Chunk(start, limit, shared))
+            start, shared = limit - overlap, overlap
+    chunks.append(Chunk(start, end, shared))
+
+    if drop_silence:
+        chunks = [chunk for chunk in chunks
+                  if any(s < chunk.end and e > chunk.start for s, e in regions)]
+    return chunks
+
+
+def _normalize(word):
+    return re.sub(r'[^\w\']', '', word.lower())
+
+
+def repeated_word_count(tail, head):
+    """How many leading words of `head` repeat the end of `tail` (0 if they don't line up)"""
+    tail = [_normalize(word) for word in tail[-MAX_MATCH_WORDS:]]
+    head = [_normalize(word) for word in head[:MAX_MATCH_WORDS + MAX_SKIPPED_WORDS]]
+    best = (0, 0)  # (matched words, -skipped words): the longest match wins, then the fewest skipped
+    for skip in range(MAX_SKIPPED_WORDS + 1):
+        # A skipped (clipped) word is only believable if at least two words line up after it
+        for n in range(min(len(tail), len(head) - skip), 1 if skip else 0, -1):
+            if tail[-n:] == head[skip:skip + n]:
+                best = max(best, (n, -skip))
+                break
+    return best[0] - best[1]
+
+
+def _drop_leading_words(segments, count):
+    kept = []
+    for segment in segments:
+        words = segment['text'].split()
+        if count >= len(words):
+            count -= len(words)
+            continue
+        if count:
+            segment = {**segment, 'text': ' '.join(words[count:])}
+            count = 0
+        kept.append(segment)
+    return kept
+
+
+class Stitcher:
+    """Joins chunk results in order into one transcript.
+
+    previous_text seeds the comparison for the first chunk, e.g. when a job
+    resumes part-way through a recording.
+    """
+
+    def __init__(self, previous_text='', sample_rate=SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.tail = previous_text.split()
+
+    def add(self, chunk, result):
+        """Segments of one chunk's result with times offset to the recording and repeats removed"""
+        offset = chunk.start / self.sample_rate
+        segments = [{'start': round(offset + s['start'], 2), 'end': round(offset + s['end'], 2),
+                     'text': s['text'].strip()}
+                    for s in result.get('segments', []) if s['text'].strip()]
+        if chunk.overlap and segments:
+            head = ' '.join(segment['text'] for segment in segments).split()
+            segments = _drop_leading_words(segments, repeated_word_count(self.tail, head))
+            if segments:
+                overlap_end = round((chunk.start + chunk.overlap) / self.sample_rate, 2)
+                segments[0]['start'] = min(max(segments[0]['start'], overlap_end), segments[0]['end'])
+        self.tail = ' '.join(segment['text'] for segment in segments).split()
+        return segments
+
+
+def transcribe_long(audio, submit_fn, max_seconds=30, overlap_seconds=1.0, drop_silence=True):
+    """Transcribe a long 16 kHz clip as parallel chunks; returns a transcribe()-style dict.
+
+    submit_fn(audio) must return a Future (ModelManager.submit). The result's
+    `timings` are wall-clock: the time until the first chunk started, then
+    the time until the last one finished.
+    """
+    started = time.perf_counter()
+    chunks = split_at_pauses(audio, max_seconds, overlap_seconds, drop_silence)
+    futures = [submit_fn(audio[chunk.start:chunk.end]) for chunk in chunks]
+
+    stitcher = Stitcher()
+    segments = []
+    language = None
+    queued = []
+    for chunk, future in zip(chunks, futures):
+        result = future.result()
+        segments.extend(stitcher.add(chunk, result))
+        language = language or result.get('language')
+        queued.append((result.get('timings') or {}).get('queue', 0.0))
+
+    elapsed = time.perf_counter() - started
+    queue = min(queued, default=0.0)
+    return {
+        'text': ' '.join(segment['text'] for segment in segments),
+        'language': language or 'unknown',
+        'segments': segments,
+        'chunks': len(chunks),
+        'timings': {'queue': queue, 'inference': max(0.0, elapsed - queue)}
+    }
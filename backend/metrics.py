@@ -0,0 +1,203 @@
+"""
+Per-request timing spans and Prometheus-style metrics.
+
+A RequestTimer collects the duration of each stage of one request (upload,
+decode, vad, queue, Whisper encoder/decoder or inference, cleanup, store). finish()
+returns them in milliseconds for the response's `timings` field, together
+with the audio duration and real-time factor, and feeds them into the
+process-wide Metrics registry.
+
+The registry keeps a count, a sum and a window of recent samples per series,
+so p50/p95/p99 reflect current behaviour, and renders everything in the
+Prometheus text format for GET /metrics (as summaries, no client library
+needed). Under gunicorn each worker has its own registry, so a scrape
+reports the worker that served it.
+"""
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+HELP = {
+    'whisper_request_duration_seconds': 'Time spent per request stage',
+    'whisper_requests_total': 'Finished requests by endpoint and HTTP status',
+    'whisper_audio_duration_seconds': 'Duration of the audio transcribed per request',
+    'whisper_real_time_factor': 'Whisper processing time divided by audio duration',
+    'whisper_admission_wait_seconds': 'Time requests waited in the admission queue, by priority',
+    'whisper_admission_rejected_total': 'Requests turned away by admission control, by priority and reason',
+    'whisper_admission_cancelled_total': 'Queued requests cancelled before inference, by priority and reason',
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+class Summary:
+    """Count, sum and quantiles over the most recent `window` observations"""
+
+    def __init__(self, window=1024):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def quantiles(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: math.nan for q in QUANTILES}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+
+class Metrics:
+    """Thread-safe registry of summaries, counters and gauges"""
+
+    def __init__(self, window=1024):
+        self.window = window
+        self.lock = threading.Lock()
+        self.summaries = {}  # (name, labels) -> Summary
+        self.counters = {}   # (name, labels) -> value
+        self.gauges = {}     # name -> (help, fn returning a number or {labels: value})
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            summary = self.summaries.get(key)
+            if summary is None:
+                summary = self.summaries[key] = Summary(self.window)
+            summary.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, name, help_text, fn):
+        """Register a value read at scrape time (fn may return {labels tuple: value})"""
+        self.gauges[name] = (help_text, fn)
+
+    def percentiles(self, name, by, **match):
+        """p50/p95/p99 (in ms) and count of one summary per value of label `by`, for series matching `match`"""
+        report = {}
+        with self.lock:
+            for (series, labels), summary in sorted(self.summaries.items()):
+                labels = dict(labels)
+                if series != name or any(labels.get(k) != v for k, v in match.items()):
+                    continue
+                values = summary.quantiles()
+                report[labels.get(by, '')] = {
+                    **{f'p{int(q * 100)}': round(v * 1000, 1) for q, v in values.items()},
+                    'count': summary.count
+                }
+        return report
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        described = set()
+
+        def describe(name, kind, help_text=None):
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {name} {help_text or HELP.get(name, name)}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        with self.lock:
+            for (name, labels), summary in sorted(self.summaries.items()):
+                describe(name, 'summary')
+                for q, value in summary.quantiles().items():
+                    lines.append(f'{name}{_format_labels(labels + (("quantile", q),))} {value}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {summary.sum}')
+                lines.append(f'{name}_count{_format_labels(labels)} {summary.count}')
+            for (name, labels), value in sorted(self.counters.items()):
+                describe(name, 'counter')
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+
+        for name, (help_text, fn) in sorted(self.gauges.items()):
+            try:
+                value = fn()
+            except Exception as e:
+                print(f"Error reading gauge {name}: {e}")
+                continue
+            describe(name, 'gauge', help_text)
+            values = value if isinstance(value, dict) else {(): value}
+            for labels, v in sorted(values.items()):
+                lines.append(f'{name}{_format_labels(labels)} {float(v)}')
+        return '\n'.join(lines) + '\n'
+
+
+class RequestTimer:
+    """Named stage durations of a single request"""
+
+    def __init__(self, endpoint, metrics=None):
+        self.endpoint = endpoint
+        self.metrics = metrics
+        self.started = time.perf_counter()
+        self.stages = {}  # stage -> seconds, in the order they ran
+        self.audio_seconds = None
+        self.whisper_seconds = None
+        self.finished = None
+
+    @contextmanager
+    def span(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_whisper(self, result, audio_seconds):
+        """Record the scheduler's queue/encoder/decoder (or inference) split from a transcription result"""
+        self.audio_seconds = audio_seconds
+        whisper_timings = result.get('timings') or {}
+        for stage, seconds in whisper_timings.items():
+            self.add(stage, seconds)
+        self.whisper_seconds = sum(s for stage, s in whisper_timings.items() if stage != 'queue') or None
+
+    def timings(self):
+        """Stage durations so far, in ms, plus audio duration and real-time factor"""
+        total = (self.finished or time.perf_counter()) - self.started
+        report = {f'{stage}_ms': round(seconds * 1000, 1) for stage, seconds in self.stages.items()}
+        report['total_ms'] = round(total * 1000, 1)
+        if self.audio_seconds:
+            report['audio_seconds'] = round(self.audio_seconds, 2)
+            if self.whisper_seconds:
+                report['rtf'] = round(self.whisper_seconds / self.audio_seconds, 3)
+        return report
+
+    def finish(self, status=200):
+        """Stop the clock, record into the registry (once) and return timings()"""
+        if self.finished is None:
+            self.finished = time.perf_counter()
+            if self.metrics is not None:
+                self._record(status)
+        return self.timings()
+
+    def _record(self, status):
+        metrics = self.metrics
+        for stage, seconds in self.stages.items():
+            metrics.observe('whisper_request_duration_seconds', seconds, endpoint=self.endpoint, stage=stage)
+        metrics.observe('whisper_request_duration_seconds', self.finished - self.started,
+                        endpoint=self.endpoint, stage='total')
+        metrics.inc('whisper_requests_total', endpoint=self.endpoint, status=str(status))
+        if self.audio_seconds:
+            metrics.observe('whisper_audio_duration_seconds', self.audio_seconds, endpoint=self.endpoint)
+            if self.whisper_seconds:
+                metrics.observe('whisper_real_time_factor', self.whisper_seconds / self.audio_seconds,
+                                endpoint=self.endpoint)
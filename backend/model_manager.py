@@ -0,0 +1,172 @@
+"""
+Whisper model lifecycle: background loading, warm-up and hot-swapping.
+
+The HTTP server binds immediately while the model loads on a background
+thread. Before reporting ready, a synthetic clip is decoded so the first real
+request doesn't pay for allocator and kernel warm-up. Switching models builds
+and warms a complete new runner alongside the old one, then swaps them; the
+old runner drains its queue before shutting down. The inference engine
+(engines.py) can be swapped the same way.
+"""
+import threading
+import time
+
+import numpy as np
+import torch
+import whisper
+
+from audio_io import SAMPLE_RATE
+from engines import get_engine
+from inference import InferenceScheduler, RunnerClosed
+from worker_pool import WorkerPool
+
+
+class ModelNotReadyError(Exception):
+    """Raised when a transcription is requested before any model has loaded"""
+
+
+class ModelManager:
+    """Owns the active inference runner (batching scheduler or worker pool)"""
+
+    def __init__(self, options, model_name="small", device=None, threads=None,
+                 workers=0, threads_per_worker=None, max_batch_size=8, max_wait=0.02, engine='whisper'):
+        self.options = options
+        self.model_name = model_name
+        self.engine = get_engine(engine).name
+        self.device = device
+        self.threads = threads
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.status = 'idle'        # idle -> loading -> ready (or error)
+        self.loading_model = None   # model currently being loaded, if any
+        self.loading_engine = None  # ...and the engine it is loaded with
+        self.error = None
+        self.load_seconds = None
+        self.runner = None
+        self.loader = None          # Thread running the current/last load
+        self.lock = threading.Lock()
+
+        if threads:
+            torch.set_num_threads(threads)
+
+    @property
+    def ready(self):
+        return self.runner is not None
+
+    def load(self, model_name=None, wait=False, engine=None):
+        """Load (or swap to) a model and/or engine in the background; returns False if a load is already running"""
+        model_name = model_name or self.model_name
+        engine = get_engine(engine or self.engine).name
+        if model_name not in whisper.available_models():
+            raise ValueError(f"Unknown Whisper model '{model_name}'")
+
+        with self.lock:
+            if self.loading_model is not None:
+                return False
+            self.loading_model = model_name
+            self.loading_engine = engine
+            if self.runner is None:
+                self.status = 'loading'
+
+        thread = threading.Thread(target=self._load, args=(model_name, engine), name='whisper-loader', daemon=True)
+        self.loader = thread
+        thread.start()
+        if wait:
+            thread.join()
+        return True
+
+    def wait(self, timeout=None):
+        """Block until the running load (if any) finishes; returns whether a model is ready"""
+        loader = self.loader
+        if loader is not None:
+            loader.join(timeout)
+        return self.ready
+
+    def _build_runner(self, model_name, engine):
+        if self.workers > 0:
+            print(f"Starting {self.workers} Whisper worker processes ({model_name}, {engine})...")
+            return WorkerPool(model_name, self.options, self.workers,
+                              threads_per_worker=self.threads_per_worker, device=self.device or 'cpu',
+                              engine=engine)
+
+        print(f"Loading Whisper model '{model_name}' ({engine} engine)...")
+        engine = get_engine(engine)
+        model = engine.load(model_name, device=self.device)
+        # Single worker owns the model; concurrent requests are batched together
+        return InferenceScheduler(model, self.options, max_batch_size=self.max_batch_size,
+                                  max_wait=self.max_wait, batching=engine.batching)
+
+    def _warm_up(self, runner):
+        # Low-level noise rather than silence so the decoder actually runs
+        clip = (np.random.default_rng(0).standard_normal(SAMPLE_RATE) * 0.01).astype(np.float32)
+        count = self.workers if self.workers > 0 else 1
+        futures = [runner.submit(clip) for _ in range(count)]
+        for future in futures:
+            future.result()
+
+    def warm_up(self):
+        """Decode a synthetic clip on the active runner, e.g. in a freshly forked server worker"""
+        runner = self.runner
+        if runner is not None:
+            self._warm_up(runner)
+
+    def _load(self, model_name, engine):
+        started = time.time()
+        try:
+            runner = self._build_runner(model_name, engine)
+            self._warm_up(runner)
+        except Exception as e:
+            print(f"Failed to load Whisper model '{model_name}' ({engine} engine): {e}")
+            with self.lock:
+                self.loading_model = None
+                self.loading_engine = None
+                self.error = str(e)
+                if self.runner is None:
+                    self.status = 'error'
+            return
+
+        with self.lock:
+            previous = self.runner
+            self.runner = runner
+            self.model_name = model_name
+            self.engine = engine
+            self.loading_model = None
+            self.loading_engine = None
+            self.error = None
+            self.status = 'ready'
+            self.load_seconds = round(time.time() - started, 2)
+        print(f"Whisper model '{model_name}' ({engine} engine) ready in {self.load_seconds}s")
+
+        # Let requests already queued on the old runner finish
+        if previous is not None:
+            previous.shutdown()
+
+    def submit(self, audio, options=None):
+        while True:
+            runner = self.runner
+            if runner is None:
+                raise ModelNotReadyError(f"Whisper model is {self.status}")
+            try:
+                return runner.submit(audio, options)
+            except RunnerClosed:
+                # Raced a hot-swap: the old runner is draining, so use the one that replaced it
+                if self.runner is runner:
+                    raise
+
+    def stats(self):
+        runner = self.runner
+        return {
+            'status': self.status,
+            'model': self.model_name,
+            'engine': self.engine,
+            'precision': get_engine(self.engine).precision,
+            'device': self.device or 'auto',
+            'loading_model': self.loading_model,
+            'loading_engine': self.loading_engine,
+            'load_seconds': self.load_seconds,
+            'error': self.error,
+            'inference': runner.stats() if runner is not None else None
+        }
@@ -9,5 +9,15 @@ fi
 echo "Activating virtual environment..."
 source venv/bin/activate
 
-echo "Starting Whisper backend..."
-python3 app.py 
\ No newline at end of file
+# Production server by default; pass --dev for the Flask development server
+if [ "$1" = "--dev" ]; then
+    echo "Starting Whisper backend (development server)..."
+    python3 app.py
+elif ! command -v gunicorn > /dev/null; then
+    echo "gunicorn not found. Run 'pip install -r requirements.txt', or pass --dev for the development server." >&2
+    exit 1
+else
+    echo "Starting Whisper backend (gunicorn)..."
+    exec gunicorn -c gunicorn.conf.py app:app
+fi
+ 
\ No newline at end of file
@@ -0,0 +1,185 @@
+"""
+Incremental (streaming) transcription sessions.
+
+Audio arrives in small chunks while the user is still speaking. Each session
+re-runs Whisper on a rolling window of not-yet-committed audio and commits
+the words that two consecutive hypotheses agree on ("local agreement").
+Committed audio is dropped from the window, so when the user releases the
+key only the short unstable tail still has to be decoded. Compressed streams
+are fed to a StreamDecoder as they arrive, which decodes each chunk once.
+"""
+import re
+import threading
+import time
+
+import numpy as np
+
+from audio_io import SAMPLE_RATE
+
+
+def _normalize_word(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+class StreamingSession:
+    """Rolling-window transcription state for a single dictation"""
+
+    def __init__(self, session_id, transcribe_fn, decoder=None, input_sample_rate=SAMPLE_RATE,
+                 speech_fn=None, min_step_seconds=1.0, max_window_seconds=25.0, audio_format='pcm'):
+        self.session_id = session_id
+        self.audio_format = audio_format            # label of the uploaded format, for stats
+        self.input_sample_rate = input_sample_rate  # rate of incoming PCM chunks
+        self.transcribe_fn = transcribe_fn  # (audio, options) -> whisper result dict, or None to skip a pass
+        self.decoder = decoder              # StreamDecoder of a compressed stream
+        self.speech_fn = speech_fn          # (audio) -> bool, lets silent windows skip Whisper
+        self.min_step_seconds = min_step_seconds
+        self.max_window_seconds = max_window_seconds
+
+        self.buffer = np.zeros(SAMPLE_RATE * 10, dtype=np.float32)  # grows by doubling; audio is its prefix
+        self.length = 0                 # samples of buffer in use
+        self.committed_words = []       # [(start, end, word)] in absolute seconds
+        self.committed_until = 0.0      # seconds of audio covered by committed words
+        self.hypothesis = []            # unconfirmed words from the last pass
+        self.decoded_samples = 0        # audio length at the last pass
+        self.language = "en"
+        self.upload_bytes = 0           # bytes received from the client
+        self.decode_seconds = 0.0       # time spent decoding/resampling uploads (waiting on the decoder)
+
+        self.lock = threading.Lock()         # guards buffers
+        self.decode_lock = threading.Lock()  # one Whisper pass at a time
+        self.last_activity = time.time()
+
+    # ------------------------------------------------------------------ input
+
+    @property
+    def audio(self):
+        """All audio received so far (a view; later appends never change samples already in it)"""
+        return self.buffer[:self.length]
+
+    def append_audio(self, samples):
+        """Append decoded float32 samples at 16 kHz"""
+        with self.lock:
+            end = self.length + len(samples)
+            if end > len(self.buffer):
+                # Amortized O(1) per sample; views handed out earlier keep the old buffer alive
+                grown = np.zeros(max(end, 2 * len(self.buffer)), dtype=np.float32)
+                grown[:self.length] = self.buffer[:self.length]
+                self.buffer = grown
+            self.buffer[self.length:end] = samples
+            self.length = end
+            self.last_activity = time.time()
+
+    def append_compressed(self, data):
+        """Append a chunk of a compressed container (e.g. a MediaRecorder webm chunk)"""
+        with self.lock:
+            started = time.perf_counter()
+            self.decoder.feed(data)
+            self.decode_seconds += time.perf_counter() - started
+            self.upload_bytes += len(data)
+            self.last_activity = time.time()
+        self._drain_decoder()
+
+    def _drain_decoder(self):
+        # Move whatever the decoder has produced so far into the audio buffer
+        if self.decoder is not None:
+            samples = self.decoder.read()
+            if len(samples):
+                self.append_audio(samples)
+
+    def close(self):
+        """Release an abandoned session's decoder"""
+        if self.decoder is not None:
+            self.decoder.abort()
+
+    # --------------------------------------------------------------- decoding
+
+    @property
+    def committed_text(self):
+        return "".join(word for _, _, word in self.committed_words).strip()
+
+    @property
+    def pending_text(self):
+        return "".join(word for _, _, word in self.hypothesis).strip()
+
+    def needs_update(self):
+        """True if enough new audio arrived since the last pass"""
+        self._drain_decoder()
+        new_samples = len(self.audio) - self.decoded_samples
+        return new_samples >= self.min_step_seconds * SAMPLE_RATE and not self.decode_lock.locked()
+
+    def _window(self):
+        with self.lock:
+            start = int(self.committed_until * SAMPLE_RATE)
+            return self.audio[start:], self.committed_until, len(self.audio)
+
+    def process(self):
+        """Run one rolling-window pass and commit the stable prefix"""
+        if not self.decode_lock.acquire(blocking=False):
+            return
+        try:
+            self._drain_decoder()
+            window, offset, total = self._window()
+            if total - self.decoded_samples < self.min_step_seconds * SAMPLE_RATE:
+                return
+            self.decoded_samples = total
+            if self.speech_fn is not None and not self.speech_fn(window):
+                return
+
+            result = self.transcribe_fn(window, {
+                "word_timestamps": True,
+                "initial_prompt": self.committed_text[-200:] or None,
+            })
+            if result is None:
+                return  # Skipped (e.g. inference is overloaded); the next step tries again
+            self.language = result.get("language", self.language)
+            words = [
+                (offset + w["start"], offset + w["end"], w["word"])
+                for segment in result.get("segments", [])
+                for w in segment.get("words", [])
+            ]
+
+            # Commit the longest prefix both passes agree on
+            agreed = 0
+            for new, old in zip(words, self.hypothesis):
+                if _normalize_word(new[2]) != _normalize_word(old[2]):
+                    break
+                agreed += 1
+
+            # Never let the window grow past what Whisper handles in one pass
+            if len(window) / SAMPLE_RATE > self.max_window_seconds:
+                horizon = offset + len(window) / SAMPLE_RATE - 5.0
+                while agreed < len(words) and words[agreed][1] <= horizon:
+                    agreed += 1
+
+            if agreed:
+                self.committed_words.extend(words[:agreed])
+                self.committed_until = words[agreed - 1][1]
+            self.hypothesis = words[agreed:]
+        finally:
+            self.decode_lock.release()
+
+    def finish(self, transcribe_fn=None):
+        """Decode the remaining tail and return the full transcript.
+
+        transcribe_fn, if given, replaces the session's for the tail (e.g. to
+        admit it under the finishing request's deadline).
+        """
+        with self.decode_lock:
+            if self.decoder is not None:
+                started = time.perf_counter()
+                self.decoder.close()
+                self.decode_seconds += time.perf_counter() - started
+                self._drain_decoder()
+            window, _, _ = self._window()
+            tail = ""
+            timings = {}
+            if len(window) > 0 and (self.speech_fn is None or self.speech_fn(window)):
+                result = (transcribe_fn or self.transcribe_fn)(window, {
+                    "initial_prompt": self.committed_text[-200:] or None,
+                })
+                self.language = result.get("language", self.language)
+                tail = result["text"].strip()
+                timings = result.get("timings", {})
+
+        text = f"{self.committed_text} {tail}".strip()
+        return {"text": text, "language": self.language, "timings": timings}
@@ -0,0 +1,165 @@
+"""AdmissionController: priorities, limits and cancellation, and a flood served by a gunicorn-sized thread pool"""
+import os
+import runpy
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from admission import AdmissionCancelled, AdmissionController, AdmissionRejected
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def gunicorn_conf(monkeypatch):
+    """gunicorn.conf.py's settings with every tuning variable at its default"""
+    for name in ('GUNICORN_THREADS', 'ADMISSION_CONCURRENCY', 'ADMISSION_MAX_QUEUED', 'WHISPER_WORKERS',
+                 'WHISPER_MAX_BATCH_SIZE', 'HISTORY_EVENTS_MAX_STREAMS'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('WHISPER_THREADS', '1')  # Otherwise the config exports one
+    return runpy.run_path(os.path.join(BACKEND_DIR, 'gunicorn.conf.py'))
+
+
+class Server:
+    """Stands in for a gthread worker: `threads` handlers, the rest wait in the backlog"""
+
+    def __init__(self, admission, threads):
+        self.admission = admission
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        self.release = threading.Event()
+        self.order = []  # Priorities in the order they were admitted
+
+    def handle(self, priority):
+        try:
+            with self.admission.slot(priority):
+                self.order.append(priority)
+                self.release.wait(10)
+            return 200
+        except AdmissionRejected as e:
+            assert e.retry_after >= 1
+            return 429
+
+    def request(self, priority):
+        return self.pool.submit(self.handle, priority)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_default_threads_hold_the_whole_admission_queue(gunicorn_conf):
+    admission = AdmissionController(gunicorn_conf['admission_concurrency'], max_queued=32)
+    assert gunicorn_conf['threads'] >= admission.concurrency + admission.max_queued + 2
+
+
+def test_flood_gets_429s_and_hotkey_jumps_the_queue(gunicorn_conf):
+    admission = AdmissionController(gunicorn_conf['admission_concurrency'], max_queued=32, max_wait=None)
+    server = Server(admission, gunicorn_conf['threads'])
+    capacity = admission.concurrency + admission.max_queued
+
+    # More web uploads than can run or queue: the rest are turned away, not left in the backlog
+    flood = [server.request('web') for _ in range(capacity + 10)]
+    wait_for(lambda: sum(f.done() for f in flood) == 10)
+    assert [f.result() for f in flood if f.done()] == [429] * 10
+    assert admission.stats()['queue_depth'] == admission.max_queued
+
+    # A dictation arriving behind the flood displaces the newest upload and runs next
+    hotkey = server.request('hotkey')
+    wait_for(lambda: sum(f.done() for f in flood) == 11)
+    server.release.set()
+    assert hotkey.result(timeout=10) == 200
+    assert server.order[admission.concurrency] == 'hotkey'
+    assert sorted(f.result(timeout=10) for f in flood) == [200] * (capacity - 1) + [429] * 11
+    server.pool.shutdown()
+
+
+def test_short_thread_pool_leaves_hotkey_in_the_backlog(gunicorn_conf):
+    # What the old 8-thread default did: nothing queued, nothing rejected, no priority
+    admission = AdmissionController(gunicorn_conf['admission_concurrency'], max_queued=32, max_wait=None)
+    server = Server(admission, threads=admission.concurrency)
+    flood = [server.request('web') for _ in range(admission.concurrency + 10)]
+    hotkey = server.request('hotkey')
+    time.sleep(0.2)
+    assert admission.stats()['queue_depth'] == 0 and not any(f.done() for f in flood)
+    server.release.set()
+    assert hotkey.result(timeout=10) == 200
+    assert server.order.index('hotkey') == len(flood)
+    server.pool.shutdown()
+
+
+def test_full_queue_evicts_only_for_a_request_that_will_queue():
+    admission = AdmissionController(1, max_queued=2, max_wait=None, initial_service_time=10)
+    server = Server(admission, threads=8)
+    running = server.request('web')
+    queued = [server.request('bulk'), server.request('bulk')]
+    wait_for(lambda: admission.stats()['queue_depth'] == 2)
+
+    # Estimated to wait longer than its deadline: rejected without displacing anyone
+    with pytest.raises(AdmissionRejected) as rejected:
+        with admission.slot('hotkey', deadline=time.monotonic() + 5):
+            pass
+    assert rejected.value.reason == 'overloaded'
+    assert admission.stats()['queue_depth'] == 2 and not any(f.done() for f in queued)
+
+    # One that can afford the wait takes the newest bulk request's place
+    hotkey = server.request('hotkey')
+    assert queued[1].result(timeout=5) == 429
+    server.release.set()
+    assert [f.result(timeout=10) for f in (running, hotkey, queued[0])] == [200, 200, 200]
+    assert server.order == ['web', 'hotkey', 'bulk']
+    server.pool.shutdown()
+
+
+def test_queue_limit_caps_one_priority():
+    admission = AdmissionController(1, max_queued=8, max_wait=None, queue_limits={'hotkey': 1})
+    server = Server(admission, threads=8)
+    running = server.request('web')
+    wait_for(lambda: admission.stats()['in_flight'] == 1)
+    queued = server.request('hotkey')
+    wait_for(lambda: admission.stats()['queue_depth'] == 1)
+    with pytest.raises(AdmissionRejected) as rejected:
+        with admission.slot('hotkey'):
+            pass
+    assert rejected.value.reason == 'queue_full'
+    server.release.set()
+    assert [f.result(timeout=10) for f in (running, queued)] == [200, 200]
+    server.pool.shutdown()
+
+
+def test_queued_requests_are_cancelled_at_their_deadline_or_disconnect():
+    admission = AdmissionController(1, max_wait=None, initial_service_time=0.01)
+    with admission.slot('web'):
+        with pytest.raises(AdmissionCancelled) as cancelled:
+            with admission.slot('web', deadline=time.monotonic() + 0.1):
+                pass
+        assert cancelled.value.reason == 'deadline'
+        with pytest.raises(AdmissionCancelled) as cancelled:
+            with admission.slot('web', disconnected=lambda: True):
+                pass
+        assert cancelled.value.reason == 'disconnected'
+    assert admission.stats()['cancelled'] == {'deadline': 1, 'disconnected': 1}
+    assert admission.stats()['queue_depth'] == 0
+
+
+def test_background_work_is_never_rejected():
+    admission = AdmissionController(1, max_queued=1, max_wait=0.001, initial_service_time=60)
+    server = Server(admission, threads=8)
+    running = server.request('web')
+    wait_for(lambda: admission.stats()['in_flight'] == 1)
+
+    def background_job():
+        with admission.slot('bulk', reject=False):
+            pass
+
+    background = server.pool.submit(background_job)
+    wait_for(lambda: admission.stats()['queue_depth'] == 1)
+    assert server.request('web').result(timeout=5) == 429  # Would wait a minute
+    server.release.set()
+    assert running.result(timeout=10) == 200
+    background.result(timeout=10)
+    server.pool.shutdown()
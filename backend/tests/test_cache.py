@@ -0,0 +1,103 @@
+"""ResultCache: LRU and TTL, the SQLite tier, coalescing and the disabled cache"""
+import threading
+import time
+
+import pytest
+
+from cache import ResultCache, make_key
+
+
+def test_lru_evicts_the_least_recently_used():
+    cache = ResultCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+
+
+def test_expired_entries_are_misses(monkeypatch):
+    cache = ResultCache(ttl=10)
+    cache.put('a', 1)
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 11)
+    assert cache.get('a') is None
+
+
+def test_sqlite_tier_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    ResultCache(sqlite_path=path).put(make_key('clip', 'small'), {'text': 'hi'})
+    assert ResultCache(sqlite_path=path).get(make_key('clip', 'small')) == {'text': 'hi'}
+
+
+def test_disk_tier_is_pruned_to_its_limit(tmp_path):
+    cache = ResultCache(max_entries=1, sqlite_path=str(tmp_path / 'cache.db'), max_disk_entries=3)
+    for i in range(5):
+        cache.put(str(i), i)
+    cache._prune_disk()
+    assert cache.db.execute('SELECT COUNT(*) FROM cache').fetchone()[0] == 3
+
+
+def test_size_zero_disables_memory_and_disk(tmp_path):
+    # Pruning to max_entries * 10 = 0 rows used to wipe the file on every prune
+    path = tmp_path / 'cache.db'
+    cache = ResultCache(max_entries=0, sqlite_path=str(path))
+    cache.put('a', 1)
+    assert cache.get('a') is None
+    assert not path.exists()
+    calls = []
+    assert cache.get_or_compute('a', lambda: calls.append(1) or 'v') == ('v', False)
+    assert cache.get_or_compute('a', lambda: calls.append(1) or 'v') == ('v', False)
+    assert len(calls) == 2
+
+
+def test_concurrent_misses_compute_once():
+    cache = ResultCache()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return 'value'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('k', compute)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()['coalesced'] < 3:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(results) == [('value', False)] + [('value', True)] * 3
+
+
+def test_waiters_retry_after_the_owners_own_failure():
+    cache = ResultCache()
+    started, release = threading.Event(), threading.Event()
+
+    class Cancelled(Exception):
+        pass
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise Cancelled()
+
+    waiter_result = []
+    owner = threading.Thread(target=lambda: pytest.raises(Cancelled, cache.get_or_compute, 'k', failing,
+                                                          retry_on=(Cancelled,)))
+    owner.start()
+    assert started.wait(5)
+    waiter = threading.Thread(target=lambda: waiter_result.append(
+        cache.get_or_compute('k', lambda: 'mine', retry_on=(Cancelled,))))
+    waiter.start()
+    while cache.stats()['coalesced'] < 1:
+        time.sleep(0.01)
+    release.set()
+    owner.join()
+    waiter.join()
+    assert waiter_result == [('mine', False)]
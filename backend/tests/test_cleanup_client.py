@@ -0,0 +1,110 @@
+"""CleanupClient's budget, hedging and fallback paths against a local stub endpoint"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from cleanup_client import CleanupClient
+
+
+class StubEndpoint:
+    """Chat-completions stub; each request pops its (delay seconds, HTTP status) from `plan`"""
+
+    def __init__(self):
+        self.plan = []
+        self.received = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with stub.lock:
+                    stub.received += 1
+                    delay, status = stub.plan.pop(0) if stub.plan else (0, 200)
+                time.sleep(delay)
+                raw = body['messages'][1]['content']
+                reply = {'choices': [{'message': {'content': f'Cleaned text: {raw.upper()}'}}]}
+                data = json.dumps(reply if status == 200 else {'error': 'boom'}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def endpoint():
+    stub = StubEndpoint()
+    yield stub
+    stub.close()
+
+
+def make_client(endpoint, **kwargs):
+    return CleanupClient(endpoint.url, 'test-key', 'test-model', 'system', '{raw_text}', 0.3, **kwargs)
+
+
+def test_fast_reply_is_returned_without_prefix(endpoint):
+    client = make_client(endpoint, budget=2.0)
+    cleaned, late = client.cleanup('hello there')
+    assert cleaned == 'HELLO THERE'
+    assert late is None
+    client.shutdown()
+
+
+def test_over_budget_returns_late_future(endpoint):
+    endpoint.plan = [(0.5, 200)]
+    client = make_client(endpoint, budget=0.1)
+    started = time.monotonic()
+    cleaned, late = client.cleanup('slow one')
+    assert time.monotonic() - started < 0.4
+    assert cleaned is None
+    assert late.result(timeout=2) == 'SLOW ONE'
+    assert client.stats()['over_budget'] == 1
+    assert client.stats()['late_results'] == 1
+    client.shutdown()
+
+
+def test_hedged_request_wins_over_slow_first_attempt(endpoint):
+    endpoint.plan = [(1.0, 200), (0, 200)]
+    client = make_client(endpoint, budget=0.8, hedge_after=0.1)
+    started = time.monotonic()
+    cleaned, late = client.cleanup('hedge me')
+    assert cleaned == 'HEDGE ME'
+    assert late is None
+    assert time.monotonic() - started < 0.8
+    assert client.stats()['hedged'] == 1
+    assert endpoint.received == 2
+    client.shutdown()
+
+
+def test_failed_request_falls_back_to_none(endpoint):
+    endpoint.plan = [(0, 500)]
+    client = make_client(endpoint, budget=1.0)
+    assert client.cleanup('broken') == (None, None)
+    assert client.stats()['failures'] == 1
+    client.shutdown()
+
+
+def test_late_future_resolves_to_none_when_every_attempt_fails(endpoint):
+    endpoint.plan = [(0.3, 500)]
+    client = make_client(endpoint, budget=0.05)
+    cleaned, late = client.cleanup('doomed')
+    assert cleaned is None
+    assert late.result(timeout=2) is None
+    client.shutdown()
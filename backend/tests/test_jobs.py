@@ -0,0 +1,75 @@
+"""Durable job queue: lazy setup, explicit start and lease-based orphan recovery"""
+import threading
+import time
+
+import pytest
+
+from jobs import JobQueue
+
+
+def finish(job, report):
+    report(1.0, [{'start': 0.0, 'end': 1.0, 'text': 'hello'}], audio_seconds=1.0)
+    return {'raw_text': 'hello', 'cleaned_text': 'Hello.', 'transcription': None}
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make(process_fn=finish, **kwargs):
+        queue = JobQueue(str(tmp_path / 'jobs.db'), str(tmp_path / 'spool'), process_fn, **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.shutdown()
+
+
+def test_constructing_a_queue_touches_no_files(tmp_path, make_queue):
+    make_queue()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_submitting_and_reading_dont_start_runners(make_queue):
+    queue = make_queue(process_fn=lambda job, report: pytest.fail('runner started'))
+    job, = queue.submit([('a.wav', 'audio/wav', b'RIFF')])
+    assert queue.get(job['id'])['status'] == 'queued'
+    assert queue.runners == []
+
+
+def test_expired_lease_is_requeued_even_from_the_same_pid(make_queue):
+    # A restarted container often gets the PID of the server that died
+    crashed = make_queue()
+    crashed.owner = 'crashed-server'
+    job, = crashed.submit([('a.wav', 'audio/wav', b'RIFF')])
+    crashed._claim()
+    with crashed.db as db:
+        db.execute('UPDATE jobs SET lease_until = 0')
+
+    restarted = make_queue()
+    restarted.start()
+    deadline = time.monotonic() + 10
+    while restarted.get(job['id'])['status'] != 'done':
+        assert time.monotonic() < deadline, 'orphaned job never ran'
+        time.sleep(0.05)
+
+
+def test_live_lease_is_left_alone(make_queue):
+    running = threading.Event()
+    release = threading.Event()
+
+    def slow(job, report):
+        running.set()
+        release.wait(10)
+        return finish(job, report)
+
+    owner = make_queue(process_fn=slow)
+    job, = owner.submit([('a.wav', 'audio/wav', b'RIFF')])
+    owner.start()
+    assert running.wait(10)
+
+    other = make_queue()
+    other._requeue_orphans()
+    assert other.get(job['id'])['status'] == 'running'
+    release.set()
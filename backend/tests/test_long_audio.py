@@ -0,0 +1,82 @@
+"""Splitting long recordings at pauses and stitching the chunk transcripts back together"""
+from concurrent.futures import Future
+
+import numpy as np
+
+from audio_io import SAMPLE_RATE
+from long_audio import Chunk, Stitcher, repeated_word_count, split_at_pauses, transcribe_long
+
+
+def voice(seconds):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (0.1 * np.sin(2 * np.pi * 220 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))).astype(np.float32)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+
+def test_short_clip_is_one_chunk_trimmed_to_its_speech():
+    audio = np.concatenate([silence(2), voice(5), silence(2)])
+    chunk, = split_at_pauses(audio)
+    assert chunk.overlap == 0
+    assert 1.7 * SAMPLE_RATE <= chunk.start < 2 * SAMPLE_RATE
+    assert 7 * SAMPLE_RATE < chunk.end <= 7.3 * SAMPLE_RATE
+
+
+def test_long_clip_is_cut_in_its_pauses():
+    # Speech in 12 s phrases with 1 s pauses: cuts must land in pauses, inside 30 s windows
+    audio = np.concatenate([part for _ in range(6) for part in (voice(12), silence(1))])
+    chunks = split_at_pauses(audio)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.end - chunk.start <= 30 * SAMPLE_RATE
+        assert chunk.overlap == 0
+    for chunk in chunks[:-1]:
+        assert (chunk.end / SAMPLE_RATE) % 13 > 12  # Inside a pause
+    assert all(a.end == b.start for a, b in zip(chunks, chunks[1:]))
+
+
+def test_speech_without_pauses_is_overlapped():
+    chunks = split_at_pauses(voice(70), overlap_seconds=1.0)
+    assert [chunk.overlap for chunk in chunks] == [0] + [SAMPLE_RATE] * (len(chunks) - 1)
+    assert all(b.start == a.end - SAMPLE_RATE for a, b in zip(chunks, chunks[1:]))
+
+
+def test_silence_only_gives_no_chunks():
+    assert split_at_pauses(silence(40)) == []
+    assert split_at_pauses(silence(40), drop_silence=False) == [Chunk(0, 40 * SAMPLE_RATE, 0)]
+
+
+def test_repeated_words_are_found_after_a_clipped_word():
+    tail = 'we will meet at the station tomorrow'.split()
+    assert repeated_word_count(tail, 'station tomorrow morning'.split()) == 2
+    assert repeated_word_count(tail, 'ion station tomorrow morning'.split()) == 3
+    assert repeated_word_count(tail, 'something else entirely'.split()) == 0
+
+
+def test_stitcher_offsets_times_and_drops_overlapped_words():
+    stitcher = Stitcher()
+    first = stitcher.add(Chunk(0, 30 * SAMPLE_RATE, 0),
+                         {'segments': [{'start': 0.0, 'end': 29.5, 'text': ' meet at the station tomorrow'}]})
+    second = stitcher.add(Chunk(29 * SAMPLE_RATE, 50 * SAMPLE_RATE, SAMPLE_RATE),
+                          {'segments': [{'start': 0.2, 'end': 3.0, 'text': ' station tomorrow at noon'}]})
+    assert first == [{'start': 0.0, 'end': 29.5, 'text': 'meet at the station tomorrow'}]
+    assert second == [{'start': 30.0, 'end': 32.0, 'text': 'at noon'}]
+
+
+def test_transcribe_long_submits_every_chunk_at_once():
+    audio = np.concatenate([part for _ in range(6) for part in (voice(12), silence(1))])
+    submitted = []
+
+    def submit(clip):
+        submitted.append(len(clip))
+        future = Future()
+        future.set_result({'text': f' part {len(submitted)}', 'language': 'en',
+                           'segments': [{'start': 0.0, 'end': 1.0, 'text': f' part {len(submitted)}'}]})
+        return future
+
+    result = transcribe_long(audio, submit)
+    assert result['chunks'] == len(submitted) > 1
+    assert result['text'] == ' '.join(f'part {i + 1}' for i in range(len(submitted)))
+    assert result['language'] == 'en'
@@ -0,0 +1,56 @@
+"""Request timers, the metrics registry and its Prometheus rendering"""
+import math
+
+from metrics import Metrics, RequestTimer, Summary
+
+
+def test_summary_keeps_a_window_but_counts_everything():
+    summary = Summary(window=10)
+    for value in range(100):
+        summary.observe(value)
+    assert summary.count == 100 and summary.sum == sum(range(100))
+    assert summary.quantiles() == {0.5: 95, 0.95: 99, 0.99: 99}
+    assert all(math.isnan(v) for v in Summary().quantiles().values())
+
+
+def test_timer_reports_stages_total_and_real_time_factor():
+    metrics = Metrics()
+    timer = RequestTimer('transcribe', metrics)
+    timer.add('decode', 0.010)
+    timer.add('decode', 0.005)  # Repeated stages add up
+    timer.add_whisper({'timings': {'queue': 0.1, 'encoder': 0.2, 'decoder': 0.3}}, audio_seconds=5.0)
+    timings = timer.finish()
+    assert timings['decode_ms'] == 15.0
+    assert timings['queue_ms'] == 100.0 and timings['encoder_ms'] == 200.0
+    assert timings['rtf'] == 0.1  # Queueing isn't processing time
+    assert timings['audio_seconds'] == 5.0
+    assert timings['total_ms'] >= 0
+    assert timer.finish() == timings  # Recorded once; the clock stays stopped
+
+    assert metrics.percentiles('whisper_request_duration_seconds', by='stage', endpoint='transcribe')['decode'] == \
+        {'p50': 15.0, 'p95': 15.0, 'p99': 15.0, 'count': 1}
+    assert metrics.counters[('whisper_requests_total', (('endpoint', 'transcribe'), ('status', '200')))] == 1
+
+
+def test_render_is_prometheus_text():
+    metrics = Metrics()
+    metrics.observe('whisper_audio_duration_seconds', 2.0, endpoint='transcribe')
+    metrics.inc('whisper_admission_rejected_total', priority='web', reason='queue_full')
+    metrics.gauge('whisper_model_ready', 'Whether a Whisper model is loaded', lambda: 1)
+    metrics.gauge('whisper_admission_queue_depth', 'Queued requests',
+                  lambda: {(('priority', 'hotkey'),): 0, (('priority', 'web'),): 3})
+    metrics.gauge('broken', 'Raises', lambda: 1 / 0)
+    text = metrics.render()
+    assert '# TYPE whisper_audio_duration_seconds summary' in text
+    assert 'whisper_audio_duration_seconds{endpoint="transcribe",quantile="0.5"} 2.0' in text
+    assert 'whisper_audio_duration_seconds_count{endpoint="transcribe"} 1' in text
+    assert 'whisper_admission_rejected_total{priority="web",reason="queue_full"} 1' in text
+    assert 'whisper_model_ready 1.0' in text
+    assert 'whisper_admission_queue_depth{priority="web"} 3.0' in text
+    assert 'broken' not in text  # A failing gauge is skipped, not fatal
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics()
+    metrics.inc('errors_total', message='bad "quote"\nnewline')
+    assert 'errors_total{message="bad \\"quote\\"\\nnewline"} 1' in metrics.render()
@@ -0,0 +1,101 @@
+"""Rolling-window streaming sessions and the chunk-by-chunk stream decoder"""
+import sys
+
+import numpy as np
+import pytest
+
+from audio_io import SAMPLE_RATE, StreamDecoder
+from streaming import StreamingSession
+
+# Stands in for ffmpeg: copies raw s16le from stdin to stdout as it arrives
+PASSTHROUGH = [sys.executable, '-c', (
+    'import sys\n'
+    'while True:\n'
+    '    data = sys.stdin.buffer.read1(65536)\n'
+    '    if not data: break\n'
+    '    sys.stdout.buffer.write(data); sys.stdout.buffer.flush()\n'
+)]
+
+
+class FakeWhisper:
+    """One word per second of audio, at its position in the window"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, audio, options):
+        self.calls.append((len(audio), options))
+        n = int(len(audio) / SAMPLE_RATE)
+        words = [{'start': float(i), 'end': i + 0.9, 'word': f' w{i}'} for i in range(n)]
+        return {'text': ''.join(w['word'] for w in words), 'language': 'en',
+                'segments': [{'words': words}]}
+
+
+def seconds(n):
+    return np.full(int(n * SAMPLE_RATE), 0.1, dtype=np.float32)
+
+
+def test_agreeing_passes_commit_and_finish_decodes_only_the_tail():
+    whisper = FakeWhisper()
+    session = StreamingSession('s', whisper)
+    session.append_audio(seconds(2))
+    session.process()
+    assert session.committed_text == '' and session.pending_text == 'w0 w1'
+
+    session.append_audio(seconds(1))
+    session.process()
+    assert session.committed_text == 'w0 w1'
+
+    result = session.finish()
+    assert result['text'] == 'w0 w1 w0'  # The fake numbers words from the window's start
+    assert whisper.calls[-1][0] < 3 * SAMPLE_RATE
+
+
+def test_growing_buffer_keeps_every_sample():
+    session = StreamingSession('s', FakeWhisper())
+    chunks = [np.arange(i * 7000, (i + 1) * 7000, dtype=np.float32) for i in range(40)]
+    for chunk in chunks:
+        session.append_audio(chunk)
+    assert np.array_equal(session.audio, np.concatenate(chunks))
+
+
+def test_skipped_pass_waits_for_the_next_step():
+    calls = []
+    session = StreamingSession('s', lambda audio, options: calls.append(len(audio)))
+    session.append_audio(seconds(2))
+    session.process()
+    assert calls and session.pending_text == '' and not session.needs_update()
+    session.append_audio(seconds(1))
+    assert session.needs_update()
+
+
+def test_finish_can_use_its_own_transcribe_fn():
+    session = StreamingSession('s', lambda audio, options: pytest.fail('pass function used for the tail'))
+    session.append_audio(seconds(1))
+    assert session.finish(FakeWhisper())['text'] == 'w0'
+
+
+def test_stream_decoder_decodes_chunks_as_they_arrive():
+    samples = (np.sin(np.arange(SAMPLE_RATE * 2) / 10) * 10000).astype('<i2')
+    data = samples.tobytes()
+    decoder = StreamDecoder('webm', command=PASSTHROUGH)
+    session = StreamingSession('s', FakeWhisper(), decoder=decoder)
+    for start in range(0, len(data), 3001):  # Odd-sized chunks split samples in two
+        session.append_compressed(data[start:start + 3001])
+    session.finish()
+    assert session.upload_bytes == len(data)
+    assert np.allclose(session.audio, samples / 32768.0)
+
+
+def test_stream_decoder_rejects_unknown_containers():
+    with pytest.raises(ValueError):
+        StreamDecoder('mp3; rm -rf /')
+
+
+def test_closed_session_stops_its_decoder():
+    decoder = StreamDecoder('ogg', command=PASSTHROUGH)
+    session = StreamingSession('s', FakeWhisper(), decoder=decoder)
+    session.close()
+    assert decoder.process.poll() is not None
+    with pytest.raises(ValueError):
+        session.append_compressed(b'\x00\x00')
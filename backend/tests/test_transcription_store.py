@@ -0,0 +1,118 @@
+"""SQLite transcription history: idempotent inserts, the batched writer, sync and search"""
+import threading
+
+import pytest
+
+from transcription_store import TranscriptionStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TranscriptionStore(str(tmp_path / 'transcriptions.db'))
+
+
+def test_client_key_makes_add_idempotent(store):
+    first = store.add('raw', 'Cleaned.', client_key='k')
+    assert store.add('raw again', 'Other.', client_key='k') == first
+    assert store.count() == 1
+
+
+def test_key_stored_by_another_process_mid_insert_returns_its_row(tmp_path, monkeypatch):
+    path = str(tmp_path / 'transcriptions.db')
+    other = TranscriptionStore(path).add('raw', 'Cleaned.', client_key='k')
+    store = TranscriptionStore(path)
+    # The other process commits between this one's lookup and its insert
+    lookups = []
+    real_find = TranscriptionStore._find_client_key
+
+    def find(db, key):
+        lookups.append(key)
+        return real_find(db, key) if len(lookups) > 1 else None
+
+    monkeypatch.setattr(TranscriptionStore, '_find_client_key', staticmethod(find))
+    assert store.add('raw', 'Cleaned.', client_key='k') == other
+    assert len(lookups) == 2 and store.count() == 1
+
+
+def test_failed_batch_counts_each_insert_once(store):
+    started, release = threading.Event(), threading.Event()
+
+    def block(db):
+        started.set()
+        release.wait(10)
+
+    def fail(db):
+        raise ValueError('bad write')
+
+    # Hold the writer so the next two ops are committed as one batch
+    blocker = store._submit(block)
+    assert started.wait(10)
+    insert = store._submit(store._insert, 'raw', 'Cleaned.', 'web', '2026-01-01T00:00:00')
+    failing = store._submit(fail)
+    release.set()
+    blocker.result(10)
+    assert insert.result(10)['rawText'] == 'raw'
+    with pytest.raises(ValueError):
+        failing.result(10)
+    assert store.inserts_since_prune == 1
+
+
+def test_changes_since_returns_inserts_and_updates_in_revision_order(store):
+    first = store.add('one', 'One.')
+    cursor = store.revision()
+    second = store.add('two', 'Two.')
+    store.update(first['id'], 'One!')
+    store.flush()
+    entries, cursor, reset = store.changes_since(cursor)
+    assert not reset
+    assert [(e['id'], e['cleanedText']) for e in entries] == [(second['id'], 'Two.'), (first['id'], 'One!')]
+    assert store.changes_since(cursor) == ([], cursor, False)
+
+
+def test_changes_since_pages_through_long_deltas(store):
+    for i in range(5):
+        store.add(f'raw {i}', f'Cleaned {i}.')
+    entries, cursor, _ = store.changes_since(0, limit=3)
+    rest, _, _ = store.changes_since(cursor, limit=3)
+    assert [e['rawText'] for e in entries + rest] == [f'raw {i}' for i in range(5)]
+
+
+def test_clear_resets_older_cursors(store):
+    store.add('one', 'One.')
+    cursor = store.revision()
+    store.clear()
+    store.add('two', 'Two.')
+    entries, _, reset = store.changes_since(cursor)
+    assert reset and [e['rawText'] for e in entries] == ['two']
+    assert int(entries[0]['id']) > 1  # IDs are never reused
+
+
+def test_search_matches_word_prefixes_and_filters(store):
+    store.add('meeting at noon', 'Meeting at noon.', source='web')
+    store.add('call the dentist', 'Call the dentist.', source='voice_assistant')
+    store.add('meet me at the station', 'Meet me at the station.', source='voice_assistant')
+    entries, _ = store.search('meet')
+    assert [e['rawText'] for e in entries] == ['meet me at the station', 'meeting at noon']
+    entries, _ = store.search('meet', source='web')
+    assert [e['rawText'] for e in entries] == ['meeting at noon']
+    assert store.search('100%')[0] == []  # Punctuation isn't query syntax
+
+
+def test_search_pages_with_before(store):
+    for i in range(5):
+        store.add(f'note {i}', f'Note {i}.')
+    page, next_before = store.search('note', limit=2)
+    assert [e['rawText'] for e in page] == ['note 4', 'note 3']
+    page, next_before = store.search('note', limit=2, before=next_before)
+    assert [e['rawText'] for e in page] == ['note 2', 'note 1']
+    page, next_before = store.search('note', limit=2, before=next_before)
+    assert [e['rawText'] for e in page] == ['note 0'] and next_before is None
+
+
+def test_retention_keeps_the_newest_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr('transcription_store.PRUNE_EVERY', 3)
+    store = TranscriptionStore(str(tmp_path / 'transcriptions.db'), max_entries=2)
+    for i in range(3):
+        store.add(f'raw {i}', f'Cleaned {i}.')
+    store.flush()
+    assert [e['rawText'] for e in store.recent()] == ['raw 2', 'raw 1']
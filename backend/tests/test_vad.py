@@ -0,0 +1,56 @@
+"""Speech detection and silence trimming on synthetic clips"""
+import numpy as np
+
+from audio_io import SAMPLE_RATE
+from vad import has_speech, trim_silence
+
+
+def noise(seconds, level_db, seed=0):
+    """White noise with an RMS level of level_db dBFS"""
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal(int(seconds * SAMPLE_RATE)) * 10 ** (level_db / 20)).astype(np.float32)
+
+
+def voice(seconds, level_db=-20):
+    """A syllable-rate modulated tone standing in for speech, RMS level_db dBFS"""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    signal = np.sin(2 * np.pi * 220 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))
+    return (signal / np.sqrt(np.mean(signal ** 2)) * 10 ** (level_db / 20)).astype(np.float32)
+
+
+def test_digital_silence_is_not_speech():
+    clip = np.zeros(2 * SAMPLE_RATE, dtype=np.float32)
+    assert not has_speech(clip)
+    assert len(trim_silence(clip)) == 0
+
+
+def test_noisy_silence_is_not_speech():
+    # An accidental hotkey tap in a noisy room
+    clip = noise(3, -45)
+    assert not has_speech(clip)
+    assert len(trim_silence(clip)) == 0
+
+
+def test_peak_a_few_db_above_the_noise_is_not_speech():
+    clip = noise(3, -45)
+    clip[SAMPLE_RATE:2 * SAMPLE_RATE] += voice(1, -42)
+    assert not has_speech(clip)
+
+
+def test_speech_is_trimmed_to_its_padding():
+    clip = np.concatenate([noise(1, -45), voice(2), noise(3, -45, seed=1)])
+    trimmed = trim_silence(clip)
+    # 2 s of speech plus up to 200 ms of padding each side (and frame rounding)
+    assert 2.0 <= len(trimmed) / SAMPLE_RATE <= 2.5
+
+
+def test_speech_in_a_quiet_room_is_kept_whole():
+    clip = np.concatenate([noise(0.5, -70), voice(1.5, -35), noise(0.5, -70, seed=1)])
+    assert has_speech(clip)
+    assert 1.5 <= len(trim_silence(clip)) / SAMPLE_RATE <= 1.95
+
+
+def test_long_pauses_are_shortened():
+    clip = np.concatenate([voice(1), noise(4, -45), voice(1)])
+    trimmed = trim_silence(clip, max_pause_ms=1000)
+    assert 2.9 <= len(trimmed) / SAMPLE_RATE <= 3.5
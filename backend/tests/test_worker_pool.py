@@ -0,0 +1,56 @@
+"""Crashed pool workers fail their jobs and are replaced"""
+import os
+import signal
+import time
+
+import numpy as np
+import pytest
+import torch
+from whisper.model import ModelDimensions, Whisper
+
+import worker_pool
+from worker_pool import WorkerPool
+
+
+@pytest.fixture(scope='module')
+def checkpoint(tmp_path_factory):
+    """A tiny randomly initialised Whisper checkpoint, so no model download is needed"""
+    dims = ModelDimensions(n_mels=80, n_audio_ctx=1500, n_audio_state=64, n_audio_head=1, n_audio_layer=1,
+                           n_vocab=51865, n_text_ctx=448, n_text_state=64, n_text_head=1, n_text_layer=1)
+    path = tmp_path_factory.mktemp('model') / 'tiny.pt'
+    torch.save({'dims': dims.__dict__, 'model_state_dict': Whisper(dims).state_dict()}, path)
+    return str(path)
+
+
+def wait_for(condition, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail('timed out')
+        time.sleep(0.1)
+
+
+def test_crashed_worker_is_respawned_with_backoff(checkpoint, monkeypatch):
+    monkeypatch.setattr(worker_pool, 'RESPAWN_BACKOFF', 0.5)
+    pool = WorkerPool(checkpoint, {'fp16': False}, workers=1, threads_per_worker=1)
+    try:
+        wait_for(lambda: pool.stats()['workers_ready'] == 1)
+        first = pool.workers[0].process
+        killed = time.monotonic()
+        os.kill(first.pid, signal.SIGKILL)
+        wait_for(lambda: pool.stats()['restarts'] == 1)
+        assert time.monotonic() - killed >= 0.5
+        assert pool.workers[0].process is not first
+        wait_for(lambda: pool.stats()['workers_ready'] == 1)
+
+        # The replacement never answered a job either, so its crash waits twice as long
+        stranded = pool.submit(np.zeros(16000, dtype=np.float32))
+        killed = time.monotonic()
+        os.kill(pool.workers[0].process.pid, signal.SIGKILL)
+        with pytest.raises(RuntimeError, match='exited'):
+            stranded.result(timeout=30)
+        wait_for(lambda: pool.stats()['restarts'] == 2)
+        assert time.monotonic() - killed >= 1.0
+        wait_for(lambda: pool.stats()['workers_ready'] == 1)
+    finally:
+        pool.shutdown()
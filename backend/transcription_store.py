@@ -0,0 +1,422 @@
+"""
+Durable transcription history backed by SQLite in WAL mode.
+
+IDs come from an AUTOINCREMENT primary key, so they only ever grow and are
+never reused after deletes or a cleared history. Every insert or update also
+stamps the row with a store-wide revision number, so clients can sync
+incrementally ("everything after revision N") instead of refetching the list.
+Raw and cleaned text are indexed with FTS5 (kept in sync by triggers), so
+search and keyset pagination stay fast however large the history grows.
+
+All writes go through one writer thread that commits whatever has queued up
+in a single transaction (group commit); request threads only wait for their
+own row's ID, and updates and retention pruning don't wait at all. Reads use
+a per-thread connection, which WAL lets run concurrently with the writer.
+The writer starts with the first write in each process, and nothing is
+opened until first use, so a server that forks after import (gunicorn with
+preload_app) never hands a thread or an open connection to its workers, and
+processes that merely import the app (spawned pool workers) never touch the
+database.
+"""
+import datetime
+import os
+import queue
+import re
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS transcriptions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        raw_text TEXT NOT NULL,
+        cleaned_text TEXT NOT NULL,
+        source TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_transcriptions_created_at ON transcriptions(created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_transcriptions_source ON transcriptions(source, created_at)',
+    'CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)',
+    "INSERT OR IGNORE INTO store_meta VALUES ('revision', 0), ('cleared_at', 0)",
+]
+
+# Columns added after the first release, with the DDL that adds them
+MIGRATIONS = [
+    ('revision', 'ALTER TABLE transcriptions ADD COLUMN revision INTEGER NOT NULL DEFAULT 0'),
+    ('client_key', 'ALTER TABLE transcriptions ADD COLUMN client_key TEXT'),
+]
+POST_MIGRATION_SCHEMA = [
+    'CREATE INDEX IF NOT EXISTS idx_transcriptions_revision ON transcriptions(revision)',
+    # Idempotency keys sent by clients; a retried request must not store a second row
+    '''CREATE UNIQUE INDEX IF NOT EXISTS idx_transcriptions_client_key
+        ON transcriptions(client_key) WHERE client_key IS NOT NULL''',
+]
+
+# Full-text index over both texts; external content, so the text isn't stored twice
+FTS_SCHEMA = [
+    '''CREATE VIRTUAL TABLE transcriptions_fts USING fts5(
+        raw_text, cleaned_text, content='transcriptions', content_rowid='id', tokenize='porter unicode61'
+    )''',
+    '''CREATE TRIGGER transcriptions_fts_insert AFTER INSERT ON transcriptions BEGIN
+        INSERT INTO transcriptions_fts(rowid, raw_text, cleaned_text) VALUES (new.id, new.raw_text, new.cleaned_text);
+    END''',
+    '''CREATE TRIGGER transcriptions_fts_delete AFTER DELETE ON transcriptions BEGIN
+        INSERT INTO transcriptions_fts(transcriptions_fts, rowid, raw_text, cleaned_text)
+        VALUES ('delete', old.id, old.raw_text, old.cleaned_text);
+    END''',
+    '''CREATE TRIGGER transcriptions_fts_update AFTER UPDATE OF raw_text, cleaned_text ON transcriptions BEGIN
+        INSERT INTO transcriptions_fts(transcriptions_fts, rowid, raw_text, cleaned_text)
+        VALUES ('delete', old.id, old.raw_text, old.cleaned_text);
+        INSERT INTO transcriptions_fts(rowid, raw_text, cleaned_text) VALUES (new.id, new.raw_text, new.cleaned_text);
+    END''',
+    "INSERT INTO transcriptions_fts(transcriptions_fts) VALUES ('rebuild')",  # Index pre-existing rows
+]
+
+COLUMNS = 'id, raw_text, cleaned_text, source, created_at'
+QUALIFIED_COLUMNS = ', '.join('t.' + column.strip() for column in COLUMNS.split(','))
+
+MAX_BATCH = 256        # Writes committed per transaction at most
+PRUNE_EVERY = 500      # Inserts between retention passes
+
+
+def row_to_transcription(row):
+    """API representation of a stored row"""
+    created_at = datetime.datetime.fromisoformat(row['created_at'])
+    return {
+        'id': str(row['id']),
+        'timestamp': created_at.strftime('%I:%M %p'),
+        'rawText': row['raw_text'],
+        'cleanedText': row['cleaned_text'],
+        'source': row['source'],
+        'created_at': row['created_at']
+    }
+
+
+class TranscriptionStore:
+    """SQLite-backed transcription history with batched writes"""
+
+    def __init__(self, path, retention_days=None, max_entries=None):
+        self.path = path
+        self.retention_days = retention_days
+        self.max_entries = max_entries
+        self.local = threading.local()
+        self.inserts_since_prune = 0
+
+        # The schema is created on first use, so importing a module that builds
+        # a store (as spawned worker processes do) doesn't touch the file
+        self.ready = False
+        self.setup_lock = threading.Lock()
+        self.full_text = False
+
+        # Notified after every commit so push subscribers wake up immediately
+        self.changed = threading.Condition()
+        self.last_revision = 0
+
+        self.writer_pid = None  # Process the writer thread runs in
+        self.writer_lock = threading.Lock()
+
+    def _migrate(self, db):
+        for statement in SCHEMA:
+            db.execute(statement)
+        existing = {row['name'] for row in db.execute('PRAGMA table_info(transcriptions)')}
+        for column, ddl in MIGRATIONS:
+            if column not in existing:
+                db.execute(ddl)
+                if column == 'revision':
+                    # Existing rows were written in id order
+                    db.execute('UPDATE transcriptions SET revision = id')
+                    db.execute("""UPDATE store_meta SET value = (SELECT IFNULL(MAX(id), 0) FROM transcriptions)
+                                  WHERE key = 'revision'""")
+        for statement in POST_MIGRATION_SCHEMA:
+            db.execute(statement)
+        db.commit()
+
+        self.full_text = self._create_fts(db)
+
+    def _create_fts(self, db):
+        """Create the FTS5 index if missing; False if this SQLite build lacks FTS5"""
+        exists = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transcriptions_fts'"
+        ).fetchone()
+        if exists:
+            return True
+        try:
+            with db:
+                for statement in FTS_SCHEMA:
+                    db.execute(statement)
+            return True
+        except sqlite3.OperationalError as e:
+            print(f"SQLite FTS5 unavailable, history search falls back to LIKE: {str(e)}")
+            return False
+
+    def _set_up(self):
+        if self.ready:
+            return
+        with self.setup_lock:
+            if not self.ready:
+                db = self._open()
+                db.execute('PRAGMA journal_mode=WAL')
+                self._migrate(db)
+                self.last_revision = self._read_revision(db)
+                db.close()
+                self.ready = True
+
+    def _connect(self):
+        self._set_up()
+        return self._open()
+
+    def _open(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.row_factory = sqlite3.Row
+        db.execute('PRAGMA synchronous=NORMAL')  # Durable across app crashes; fsync per checkpoint
+        return db
+
+    @property
+    def db(self):
+        """Connection for the calling thread (sqlite3 connections aren't shareable)"""
+        if getattr(self.local, 'db', None) is None:
+            self.local.db = self._connect()
+        return self.local.db
+
+    # ---------------------------------------------------------------- writes
+
+    def _ensure_writer(self):
+        if self.writer_pid == os.getpid():
+            return
+        with self.writer_lock:
+            if self.writer_pid != os.getpid():
+                self.writes = queue.Queue()
+                self.writer = threading.Thread(target=self._write_loop, name='transcription-writer', daemon=True)
+                self.writer.start()
+                self.writer_pid = os.getpid()
+
+    def _submit(self, op, *args):
+        self._ensure_writer()
+        future = Future()
+        self.writes.put((op, args, future))
+        return future
+
+    def add(self, raw_text, cleaned_text, source="web", client_key=None):
+        """Store a transcription and return it once committed.
+
+        With a client_key, storing is idempotent: if an entry with that key
+        already exists it is returned unchanged instead of adding another.
+        """
+        created_at = datetime.datetime.now().isoformat()
+        return self._submit(self._insert, raw_text, cleaned_text, source, created_at, client_key).result()
+
+    def update(self, transcription_id, cleaned_text):
+        """Replace the cleaned text of an entry (queued, returns immediately)"""
+        return self._submit(self._update, int(transcription_id), cleaned_text)
+
+    def clear(self):
+        """Delete all history; IDs keep increasing afterwards"""
+        return self._submit(self._clear).result()
+
+    def flush(self):
+        """Wait until everything queued so far is committed"""
+        return self._submit(lambda db: None).result()
+
+    def _next_revision(self, db):
+        # Runs inside the writer's transaction, so it's atomic even across processes
+        db.execute("UPDATE store_meta SET value = value + 1 WHERE key = 'revision'")
+        return db.execute("SELECT value FROM store_meta WHERE key = 'revision'").fetchone()[0]
+
+    def _insert(self, db, raw_text, cleaned_text, source, created_at, client_key=None):
+        if client_key is not None:
+            existing = self._find_client_key(db, client_key)
+            if existing is not None:
+                return existing
+        try:
+            cursor = db.execute(
+                '''INSERT INTO transcriptions (raw_text, cleaned_text, source, created_at, revision, client_key)
+                   VALUES (?, ?, ?, ?, ?, ?)''',
+                (raw_text, cleaned_text, source, created_at, self._next_revision(db), client_key)
+            )
+        except sqlite3.IntegrityError:
+            # Another process stored the same key between the lookup and the insert
+            existing = self._find_client_key(db, client_key) if client_key is not None else None
+            if existing is None:
+                raise
+            return existing
+        self.inserts_since_prune += 1
+        return row_to_transcription({
+            'id': cursor.lastrowid, 'raw_text': raw_text, 'cleaned_text': cleaned_text,
+            'source': source, 'created_at': created_at
+        })
+
+    @staticmethod
+    def _find_client_key(db, client_key):
+        row = db.execute(f'SELECT {COLUMNS} FROM transcriptions WHERE client_key = ?', (client_key,)).fetchone()
+        return row_to_transcription(row) if row else None
+
+    def _update(self, db, transcription_id, cleaned_text):
+        db.execute('UPDATE transcriptions SET cleaned_text = ?, revision = ? WHERE id = ?',
+                   (cleaned_text, self._next_revision(db), transcription_id))
+
+    def _clear(self, db):
+        db.execute('DELETE FROM transcriptions')
+        self._invalidate_cursors(db)
+
+    def _invalidate_cursors(self, db):
+        # Deletions aren't in the change feed, so clients synced to an older revision must start over
+        db.execute("UPDATE store_meta SET value = ? WHERE key = 'cleared_at'", (self._next_revision(db),))
+
+    def _prune(self, db):
+        self.inserts_since_prune = 0
+        deleted = 0
+        if self.retention_days:
+            cutoff = (datetime.datetime.now() - datetime.timedelta(days=self.retention_days)).isoformat()
+            deleted += db.execute('DELETE FROM transcriptions WHERE created_at < ?', (cutoff,)).rowcount
+        if self.max_entries:
+            deleted += db.execute('''DELETE FROM transcriptions WHERE id <= (
+                SELECT id FROM transcriptions ORDER BY id DESC LIMIT 1 OFFSET ?
+            )''', (self.max_entries,)).rowcount
+        if deleted:
+            self._invalidate_cursors(db)
+
+    def _write_loop(self):
+        db = self._connect()
+        while True:
+            batch = [self.writes.get()]
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self.writes.get_nowait())
+                except queue.Empty:
+                    break
+
+            results = []
+            inserts_before = self.inserts_since_prune
+            try:
+                with db:  # One transaction for the whole batch
+                    for op, args, future in batch:
+                        results.append(op(db, *args))
+                    if self.inserts_since_prune >= PRUNE_EVERY:
+                        self._prune(db)
+            except Exception as e:
+                # Retry one by one so a single bad write doesn't fail the whole batch.
+                # The batch was rolled back, so its inserts are counted again as they're retried
+                print(f"Error writing transcription batch, retrying individually: {str(e)}")
+                self.inserts_since_prune = inserts_before
+                for op, args, future in batch:
+                    try:
+                        with db:
+                            future.set_result(op(db, *args))
+                    except Exception as single_error:
+                        future.set_exception(single_error)
+                self._notify_changed()
+                continue
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
+            self._notify_changed()
+
+    def _notify_changed(self):
+        with self.changed:
+            self.last_revision = self.revision()
+            self.changed.notify_all()
+
+    @staticmethod
+    def _read_revision(db):
+        return db.execute("SELECT value FROM store_meta WHERE key = 'revision'").fetchone()[0]
+
+    # ----------------------------------------------------------------- reads
+
+    def recent(self, limit=50):
+        rows = self.db.execute(
+            f'SELECT {COLUMNS} FROM transcriptions ORDER BY id DESC LIMIT ?', (limit,)
+        ).fetchall()
+        return [row_to_transcription(row) for row in rows]
+
+    def get(self, transcription_id):
+        row = self.db.execute(
+            f'SELECT {COLUMNS} FROM transcriptions WHERE id = ?', (int(transcription_id),)
+        ).fetchone()
+        return row_to_transcription(row) if row else None
+
+    def search(self, query=None, source=None, start=None, end=None, before=None, limit=50):
+        """Newest-first entries matching every filter, one page at a time.
+
+        query matches words (and word prefixes) in the raw or cleaned text;
+        start/end bound created_at (ISO strings); before is the id of the last
+        entry of the previous page. Returns (entries, next_before), where
+        next_before is None on the last page.
+        """
+        db = self.db
+        terms = re.findall(r'\w+', query or '')
+        conditions, params = [], []
+        if terms and self.full_text:
+            table = 'transcriptions_fts f JOIN transcriptions t ON t.id = f.rowid'
+            conditions.append('transcriptions_fts MATCH ?')
+            params.append(' '.join(f'"{term}"*' for term in terms))
+            id_column = 'f.rowid'  # Lets FTS5 walk its doclists in rowid order
+        else:
+            table = 'transcriptions t'
+            id_column = 't.id'
+            for term in terms:
+                conditions.append("(t.raw_text LIKE ? ESCAPE '\\' OR t.cleaned_text LIKE ? ESCAPE '\\')")
+                pattern = '%' + re.sub(r'([%_\\])', r'\\\1', term) + '%'
+                params += [pattern, pattern]
+        if source:
+            conditions.append('t.source = ?')
+            params.append(source)
+        if start:
+            conditions.append('t.created_at >= ?')
+            params.append(start)
+        if end:
+            conditions.append('t.created_at < ?')
+            params.append(end)
+        if before is not None:
+            conditions.append(f'{id_column} < ?')
+            params.append(int(before))
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        rows = db.execute(
+            f'SELECT {QUALIFIED_COLUMNS} FROM {table} {where} ORDER BY {id_column} DESC LIMIT ?',
+            (*params, limit + 1)
+        ).fetchall()
+        entries = [row_to_transcription(row) for row in rows[:limit]]
+        next_before = entries[-1]['id'] if len(rows) > limit else None
+        return entries, next_before
+
+    def get_by_client_key(self, client_key):
+        return self._find_client_key(self.db, client_key)
+
+    def revision(self):
+        """Current store-wide revision (bumped by every insert, update, clear and retention prune)"""
+        return self._read_revision(self.db)
+
+    def changes_since(self, since, limit=500):
+        """Entries inserted or updated after revision `since`.
+
+        Returns (entries, cursor, reset), oldest change first; pass cursor back
+        as `since` to continue. reset is True when the caller's cursor predates
+        a clear (or is from the future), in which case entries holds the most
+        recent history instead of a delta. Retention pruning counts as a clear.
+        """
+        db = self.db
+        # One read transaction, so the cursor and the rows come from the same snapshot
+        db.execute('BEGIN')
+        try:
+            meta = dict(db.execute('SELECT key, value FROM store_meta').fetchall())
+            revision, cleared_at = meta['revision'], meta['cleared_at']
+            if since < cleared_at or since > revision:
+                return self.recent(limit), revision, True
+            rows = db.execute(
+                f'SELECT {COLUMNS}, revision FROM transcriptions WHERE revision > ? ORDER BY revision ASC LIMIT ?',
+                (since, limit)
+            ).fetchall()
+        finally:
+            db.commit()
+        if len(rows) == limit:
+            revision = rows[-1]['revision']  # More to come; resume after the last row sent
+        return [row_to_transcription(row) for row in rows], revision, False
+
+    def wait_for_change(self, since, timeout):
+        """Block until a local commit moves past revision `since` or the timeout expires"""
+        self._set_up()
+        with self.changed:
+            if self.last_revision <= since:
+                self.changed.wait(timeout)
+
+    def count(self):
+        return self.db.execute('SELECT COUNT(*) FROM transcriptions').fetchone()[0]
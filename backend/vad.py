@@ -0,0 +1,93 @@
+"""
+Energy-based voice activity detection.
+
+Push-to-talk clips usually carry leading/trailing pauses, and an accidental
+hotkey tap is pure silence. Trimming those before Whisper saves a full
+encoder pass per 30 s window; fully silent clips are skipped outright.
+"""
+import numpy as np
+
+from audio_io import SAMPLE_RATE
+
+FRAME_MS = 30
+ABSOLUTE_FLOOR_DB = -50.0  # Anything quieter than this is never speech
+NOISE_MARGIN_DB = 12.0     # Speech must be this far above the estimated noise floor
+MIN_SPEECH_MS = 90         # Shorter bursts (clicks, key noise) are ignored
+MERGE_GAP_MS = 300         # Pauses shorter than this don't split a speech region
+
+
+def frame_energies(audio, sample_rate=SAMPLE_RATE):
+    """RMS level in dBFS of each FRAME_MS frame"""
+    frame = int(sample_rate * FRAME_MS / 1000)
+    usable = len(audio) - len(audio) % frame
+    if usable == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[:usable].reshape(-1, frame)
+    power = np.mean(frames * frames, axis=1)
+    return 10.0 * np.log10(power + 1e-10)
+
+
+def detect_speech(audio, sample_rate=SAMPLE_RATE):
+    """Return [(start, end)] sample ranges that contain speech"""
+    energies = frame_energies(audio, sample_rate)
+    if len(energies) == 0:
+        return []
+
+    # Never below noise + margin: a clip whose peak barely clears its own noise is not speech
+    noise_floor = np.percentile(energies, 10)
+    threshold = max(ABSOLUTE_FLOOR_DB, noise_floor + NOISE_MARGIN_DB)
+    active = energies > threshold
+
+    # Collect runs of active frames
+    regions = []
+    start = None
+    for i, is_active in enumerate(active):
+        if is_active and start is None:
+            start = i
+        elif not is_active and start is not None:
+            regions.append([start, i])
+            start = None
+    if start is not None:
+        regions.append([start, len(active)])
+
+    # Merge regions separated by short pauses, then drop blips
+    merge_gap = MERGE_GAP_MS // FRAME_MS
+    merged = []
+    for region in regions:
+        if merged and region[0] - merged[-1][1] <= merge_gap:
+            merged[-1][1] = region[1]
+        else:
+            merged.append(region)
+    min_frames = MIN_SPEECH_MS // FRAME_MS
+    frame = int(sample_rate * FRAME_MS / 1000)
+    return [(s * frame, e * frame) for s, e in merged if e - s >= min_frames]
+
+
+def has_speech(audio, sample_rate=SAMPLE_RATE):
+    return bool(detect_speech(audio, sample_rate))
+
+
+def trim_silence(audio, sample_rate=SAMPLE_RATE, padding_ms=200, max_pause_ms=1000):
+    """Drop leading/trailing silence and shorten long internal pauses.
+
+    Returns an empty array when the clip contains no speech at all.
+    """
+    regions = detect_speech(audio, sample_rate)
+    if not regions:
+        return audio[:0]
+
+    padding = int(sample_rate * padding_ms / 1000)
+    max_pause = int(sample_rate * max_pause_ms / 1000)
+    pieces = []
+    for i, (start, end) in enumerate(regions):
+        start = max(0, start - padding)
+        end = min(len(audio), end + padding)
+        if pieces:
+            # Keep at most max_pause of the gap before this region
+            previous_end = min(len(audio), regions[i - 1][1] + padding)
+            if start - previous_end > max_pause:
+                pieces.append(audio[previous_end:previous_end + max_pause])
+            else:
+                start = previous_end
+        pieces.append(audio[start:end])
+    return np.concatenate(pieces)
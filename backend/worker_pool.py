@@ -0,0 +1,266 @@
+"""
+Multi-process Whisper worker pool.
+
+Each worker is a separate process with its own model replica and a pinned
+torch thread count (and CPU affinity where the OS supports it), so decoding
+scales across cores instead of sharing one interpreter and its GIL with the
+HTTP handlers. Audio is handed over through shared memory; only a small job
+tuple travels over the queue. Jobs go to the worker with the fewest pending
+requests.
+
+A worker that dies (a segfault, the OOM killer) fails the jobs it held and is
+replaced by a fresh process. One that crashes again before answering a job
+is restarted after an exponentially growing delay, so a model that can't load
+doesn't turn into a spawn loop.
+"""
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from inference import RunnerClosed
+
+REAP_INTERVAL = 0.5  # Longest the collector waits for a result before checking worker liveness
+RESPAWN_BACKOFF = 1.0  # Delay before restarting a worker that crashed without answering a job; doubles per crash
+RESPAWN_BACKOFF_MAX = 60.0
+
+
+def _worker_main(index, model_name, device, threads, options, jobs, results, engine='whisper'):
+    """Entry point of a worker process"""
+    import torch
+    from engines import get_engine
+
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    if hasattr(os, 'sched_setaffinity'):
+        cores = list(range(index * threads, (index + 1) * threads))
+        available = os.sched_getaffinity(0)
+        if all(core in available for core in cores):
+            os.sched_setaffinity(0, cores)
+
+    model = get_engine(engine).load(model_name, device=device)
+    results.put(('ready', index, None))
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, shm_name, n_samples, job_options = job
+        # Attach only; the parent owns (and unlinks) the segment
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            audio = np.ndarray((n_samples,), dtype=np.float32, buffer=shm.buf)
+            started = time.perf_counter()
+            result = model.transcribe(audio, **{**options, **job_options})
+            result['timings'] = {'inference': time.perf_counter() - started}
+            del audio
+            results.put((job_id, result, None))
+        except Exception as e:
+            results.put((job_id, None, str(e)))
+        finally:
+            shm.close()
+
+
+class _Worker:
+    def __init__(self, ctx, index, model_name, device, threads, options, results, engine):
+        self.index = index
+        self.jobs = ctx.Queue()
+        self.pending = 0
+        self.completed = 0
+        self.ready = False
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(index, model_name, device, threads, options, self.jobs, results, engine),
+            name=f'whisper-worker-{index}',
+            daemon=True
+        )
+        self.process.start()
+
+
+class WorkerPool:
+    """Dispatches transcription jobs to N model replicas in separate processes"""
+
+    def __init__(self, model_name, options, workers, threads_per_worker=None, device='cpu', engine='whisper'):
+        self.model_name = model_name
+        self.engine = engine
+        self.options = options
+        self.device = device
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+
+        self.ctx = mp.get_context('spawn')
+        self.results = self.ctx.Queue()
+        self.lock = threading.Lock()
+        self.futures = {}  # job_id -> (future, shm, worker, submit time)
+        self.job_ids = itertools.count()
+        self.workers = [self._spawn(i) for i in range(workers)]
+        self.crashes = [0] * workers  # Consecutive crashes per worker slot without a job answered
+        self.restart_at = {}  # index -> time.monotonic() when its dead worker is replaced
+        self.restarts = 0
+
+        self.pid = os.getpid()  # Queues and collector belong to this process only
+        self.running = True
+        self.closed = False
+        self.collector = threading.Thread(target=self._collect, name='whisper-pool-collector', daemon=True)
+        self.collector.start()
+
+    def _spawn(self, index):
+        return _Worker(self.ctx, index, self.model_name, self.device, self.threads_per_worker, self.options,
+                       self.results, self.engine)
+
+    def submit(self, audio, options=None):
+        """Queue a 16 kHz float32 clip on the least-loaded worker; returns a Future"""
+        if os.getpid() != self.pid:
+            raise RuntimeError("WorkerPool can't be shared with a forked process; create it after forking")
+        audio = np.ascontiguousarray(audio, dtype=np.float32)
+        shm = shared_memory.SharedMemory(create=True, size=max(audio.nbytes, 1))
+        np.ndarray(audio.shape, dtype=np.float32, buffer=shm.buf)[:] = audio
+
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self.lock:
+            if self.closed:
+                shm.close()
+                shm.unlink()
+                raise RunnerClosed("Whisper worker pool has been shut down")
+            alive = [w for w in self.workers if w.process.is_alive()]
+            if not alive:
+                shm.close()
+                shm.unlink()
+                raise RuntimeError("No Whisper worker process is running")
+            job_id = next(self.job_ids)
+            worker = min(alive, key=lambda w: (w.pending, w.index))
+            worker.pending += 1
+            self.futures[job_id] = (future, shm, worker, time.perf_counter())
+        worker.jobs.put((job_id, shm.name, len(audio), options or {}))
+        return future
+
+    def _finish(self, job_id, result=None, error=None, answered=True):
+        with self.lock:
+            if job_id not in self.futures:
+                return  # Already failed (worker reaped, or pool shut down)
+            future, shm, worker, submitted = self.futures.pop(job_id)
+            worker.pending -= 1
+            if answered:
+                worker.completed += 1
+        shm.close()
+        shm.unlink()
+        if error is not None:
+            future.set_exception(RuntimeError(error))
+        else:
+            # Whatever wasn't inference was spent queued (or handing the job over)
+            inference = result.get('timings', {}).get('inference', 0.0)
+            result['timings'] = {'queue': max(0.0, time.perf_counter() - submitted - inference), 'inference': inference}
+            future.set_result(result)
+
+    def _handle(self, message):
+        job_id, result, error = message
+        if job_id == 'ready':
+            self.workers[result].ready = True
+            print(f"Whisper worker {result} ready")
+        else:
+            self._finish(job_id, result, error)
+
+    def _drain_results(self):
+        while True:
+            try:
+                self._handle(self.results.get_nowait())
+            except queue.Empty:
+                return
+
+    def _collect(self):
+        while self.running:
+            try:
+                self._handle(self.results.get(timeout=REAP_INTERVAL))
+            except queue.Empty:
+                pass
+            # Checked on every pass, so a crash is noticed under load too
+            self._reap_dead_workers()
+
+    def _reap_dead_workers(self):
+        with self.lock:
+            if self.closed:
+                return  # shutdown() fails what's left
+            dead = [w for w in self.workers if w.process.exitcode is not None]
+        if not dead:
+            return
+        # Fail jobs stranded on a crashed worker instead of hanging the request forever.
+        # Results a worker sent before exiting are already in the queue; take them first
+        self._drain_results()
+        with self.lock:
+            stranded = [job_id for job_id, (_, _, worker, _) in self.futures.items()
+                        if worker.process.exitcode is not None]
+        for job_id in stranded:
+            self._finish(job_id, error='Whisper worker process exited', answered=False)
+
+        now = time.monotonic()
+        for worker in dead:
+            if worker.index in self.restart_at:
+                continue
+            # A worker that answered jobs crashed once: replace it right away. One that
+            # never got that far (model won't load, every job crashes it) backs off
+            crashes = 0 if worker.completed else self.crashes[worker.index] + 1
+            self.crashes[worker.index] = crashes
+            delay = min(RESPAWN_BACKOFF_MAX, RESPAWN_BACKOFF * 2 ** (crashes - 1)) if crashes else 0.0
+            self.restart_at[worker.index] = now + delay
+            print(f"Whisper worker {worker.index} exited with code {worker.process.exitcode}; "
+                  f"restarting in {delay:.0f}s")
+        for index, restart_at in list(self.restart_at.items()):
+            if restart_at <= now:
+                self._respawn(index)
+
+    def _respawn(self, index):
+        del self.restart_at[index]
+        worker = self._spawn(index)
+        with self.lock:
+            replaced = not self.closed
+            if replaced:
+                dead, self.workers[index] = self.workers[index], worker
+                self.restarts += 1
+        if not replaced:
+            worker.process.terminate()  # Shut down while it was starting
+            worker.process.join()
+            return
+        # Nobody reads the dead worker's queue any more; don't block exit flushing it
+        dead.jobs.cancel_join_thread()
+        dead.jobs.close()
+
+    def shutdown(self):
+        """Finish the jobs already queued, then stop the workers; later submits raise RunnerClosed"""
+        with self.lock:
+            self.closed = True
+        for worker in self.workers:
+            worker.jobs.put(None)
+        for worker in self.workers:
+            worker.process.join(timeout=30)
+            if worker.process.is_alive():
+                worker.process.terminate()  # Stuck in a decode; its job is failed below
+                worker.process.join()
+        self.running = False
+        self.collector.join()
+        # Fail whatever never came back, so no caller waits on a result forever
+        self._drain_results()
+        with self.lock:
+            pending = list(self.futures)
+        for job_id in pending:
+            self._finish(job_id, error='Whisper worker pool shut down', answered=False)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'mode': 'pool',
+                'pool_size': len(self.workers),
+                'workers_ready': sum(w.ready for w in self.workers),
+                'threads_per_worker': self.threads_per_worker,
+                'restarts': self.restarts,
+                'queue_depth': sum(w.pending for w in self.workers),
+                'per_worker': [
+                    {'pending': w.pending, 'completed': w.completed, 'alive': w.process.is_alive()}
+                    for w in self.workers
+                ]
+            }
@@ -0,0 +1,249 @@
+"""
+Always-open audio capture for the voice assistant.
+
+Opening a PyAudio device on every hotkey press takes long enough to clip the
+first word. CaptureEngine instead keeps one input stream open and writes it
+continuously into a preallocated ring buffer, so a recording can start ~300 ms
+*before* the keypress (pre-roll) and costs nothing to begin.
+
+The ring is mirrored: every byte is written twice, at pos and pos + capacity,
+so any window of up to `capacity` bytes is contiguous in memory and can be
+handed out as a memoryview slice without copying. A slice stays valid until
+the capture has written another `capacity - len(slice)` bytes, i.e. for
+minutes at the default size.
+
+Sources are pluggable (AudioSource); FakeAudioSource plays back canned PCM so
+the engine can be exercised without a microphone.
+"""
+import threading
+import time
+
+try:
+    import pyaudio
+except ImportError:  # Only needed for the real microphone source
+    pyaudio = None
+
+SAMPLE_WIDTH = 2  # Signed 16-bit PCM throughout
+
+
+class AudioSource:
+    """Blocking source of 16-bit PCM audio"""
+
+    def __init__(self, rate, channels=1):
+        self.rate = rate
+        self.channels = channels
+
+    @property
+    def bytes_per_second(self):
+        return self.rate * self.channels * SAMPLE_WIDTH
+
+    def open(self):
+        pass
+
+    def read(self, frames):
+        """Return the next `frames` frames as bytes, blocking until they're available"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PyAudioSource(AudioSource):
+    """Default input device via PyAudio"""
+
+    def __init__(self, rate, channels=1, frames_per_buffer=512):
+        super().__init__(rate, channels)
+        self.frames_per_buffer = frames_per_buffer
+        self.pyaudio_instance = None
+        self.stream = None
+
+    def open(self):
+        if pyaudio is None:
+            raise RuntimeError("PyAudio is not installed")
+        self.pyaudio_instance = pyaudio.PyAudio()
+        self.stream = self.pyaudio_instance.open(
+            format=pyaudio.paInt16,
+            channels=self.channels,
+            rate=self.rate,
+            input=True,
+            frames_per_buffer=self.frames_per_buffer
+        )
+
+    def read(self, frames):
+        return self.stream.read(frames, exception_on_overflow=False)
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        if self.pyaudio_instance is not None:
+            self.pyaudio_instance.terminate()
+            self.pyaudio_instance = None
+
+
+class FakeAudioSource(AudioSource):
+    """Plays back fixed PCM (then silence), paced like a real device unless realtime=False"""
+
+    def __init__(self, pcm=b'', rate=16000, channels=1, loop=False, realtime=True):
+        super().__init__(rate, channels)
+        self.pcm = bytes(pcm)
+        self.loop = loop
+        self.realtime = realtime
+        self.position = 0
+
+    def read(self, frames):
+        size = frames * self.channels * SAMPLE_WIDTH
+        if self.loop and self.pcm:
+            data = b''
+            while len(data) < size:
+                piece = self.pcm[self.position:self.position + size - len(data)]
+                data += piece
+                self.position = (self.position + len(piece)) % len(self.pcm)
+        else:
+            data = self.pcm[self.position:self.position + size]
+            self.position += len(data)
+            data += b'\x00' * (size - len(data))
+        if self.realtime:
+            time.sleep(frames / self.rate)
+        return data
+
+
+class CaptureEngine:
+    """Keeps a source open and records slices of its ring buffer on demand"""
+
+    def __init__(self, source, chunk_frames=512, preroll_seconds=0.3, max_record_seconds=120):
+        self.source = source
+        self.chunk_frames = chunk_frames
+        self.preroll_bytes = self._align(preroll_seconds * source.bytes_per_second)
+        self.capacity = self._align((max_record_seconds + preroll_seconds) * source.bytes_per_second)
+        self.buffer = bytearray(self.capacity * 2)
+        self.view = memoryview(self.buffer)
+
+        self.written = 0  # Total bytes captured since start()
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+        # Active recording, if any
+        self.recording = False
+        self.record_start = 0
+        self.chunk_start = 0
+        self.chunk_bytes = 0
+        self.on_chunk = None
+
+    def _align(self, size):
+        frame = self.source.channels * SAMPLE_WIDTH
+        return int(size) // frame * frame
+
+    # --------------------------------------------------------------- capture
+
+    def start(self):
+        """Open the source and start filling the ring buffer.
+
+        If the device can't be opened yet, the capture thread keeps retrying.
+        """
+        if self.running:
+            return
+        try:
+            self.source.open()
+            opened = True
+        except Exception as e:
+            print(f"Audio input unavailable, retrying in the background: {e}")
+            opened = False
+        self.running = True
+        self.thread = threading.Thread(target=self._capture_loop, args=(opened,), name='audio-capture', daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            self.thread = None
+        self.source.close()
+
+    def _capture_loop(self, opened=True):
+        if not opened:
+            self._reopen()
+        while self.running:
+            try:
+                data = self.source.read(self.chunk_frames)
+            except Exception as e:
+                print(f"Error reading audio, reopening input: {e}")
+                self._reopen()
+                continue
+            self._write(data)
+
+    def _reopen(self):
+        try:
+            self.source.close()
+        except Exception:
+            pass
+        while self.running:
+            time.sleep(1.0)
+            try:
+                self.source.open()
+                return
+            except Exception as e:
+                print(f"Audio input still unavailable: {e}")
+
+    def _write(self, data):
+        size = len(data)
+        if size > self.capacity:
+            data, size = data[-self.capacity:], self.capacity
+        with self.lock:
+            position = self.written % self.capacity
+            first = min(size, self.capacity - position)
+            # Primary copy, wrapping around, plus the mirror half
+            self.buffer[position:position + first] = data[:first]
+            self.buffer[position + self.capacity:position + self.capacity + first] = data[:first]
+            if first < size:
+                self.buffer[:size - first] = data[first:]
+                self.buffer[self.capacity:self.capacity + size - first] = data[first:]
+            self.written += size
+
+            if self.recording and self.on_chunk is not None and self.written - self.chunk_start >= self.chunk_bytes:
+                self.on_chunk(self._slice(self.chunk_start, self.written))
+                self.chunk_start = self.written
+
+    def _slice(self, start, end):
+        """Zero-copy view of captured bytes [start, end); caller holds self.lock"""
+        if end - start > self.capacity or start < self.written - self.capacity:
+            raise ValueError("Requested audio has already been overwritten")
+        offset = start % self.capacity
+        return self.view[offset:offset + end - start]
+
+    # ------------------------------------------------------------- recording
+
+    def begin(self, on_chunk=None, chunk_seconds=0.5):
+        """Start a recording, including up to preroll_seconds captured before this call.
+
+        on_chunk, if given, is called from the capture thread with each
+        chunk_seconds slice as it fills (and from end() with the remainder,
+        followed by None). It runs under the engine's lock, so keep it quick
+        (e.g. Queue.put).
+        """
+        with self.lock:
+            self.record_start = max(0, self.written - self.preroll_bytes)
+            self.chunk_start = self.record_start
+            self.chunk_bytes = self._align(chunk_seconds * self.source.bytes_per_second)
+            self.on_chunk = on_chunk
+            self.recording = True
+
+    def end(self):
+        """Stop the recording and return its audio as a memoryview into the ring"""
+        with self.lock:
+            if not self.recording:
+                return self.view[:0]
+            self.recording = False
+            start = self.record_start
+            if self.written - start > self.capacity:
+                print("⚠️ Recording exceeded the capture buffer, dropping its beginning")
+                start = self.written - self.capacity
+            if self.on_chunk is not None:
+                chunk_start = max(self.chunk_start, start)
+                if self.written > chunk_start:
+                    self.on_chunk(self._slice(chunk_start, self.written))
+                self.on_chunk(None)
+                self.on_chunk = None
+            return self._slice(start, self.written)
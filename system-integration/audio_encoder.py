@@ -0,0 +1,69 @@
+"""
+Incremental compression of recorded audio for upload.
+
+ChunkedEncoder is fed 16-bit PCM chunks while the user is still speaking and
+compresses them on a background thread, so by the time the hotkey is
+released the compressed upload is (almost) ready. Uses soundfile/libsndfile,
+which is optional: without it only PCM uploads are available.
+"""
+import io
+import queue
+import threading
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+# upload format -> (libsndfile container, subtype, Content-Type)
+ENCODINGS = {
+    'flac': ('FLAC', 'PCM_16', 'audio/flac'),  # Lossless, ~35-50% smaller, encodes almost for free
+    'opus': ('OGG', 'OPUS', 'audio/ogg'),      # Lossy, ~10x smaller, costs a few % of realtime
+}
+
+
+def encoding_available(upload_format):
+    return soundfile is not None and upload_format in ENCODINGS
+
+
+class ChunkedEncoder:
+    """Compresses PCM chunks into an in-memory FLAC or Ogg/Opus file as they arrive"""
+
+    def __init__(self, upload_format, rate, channels=1):
+        if not encoding_available(upload_format):
+            raise ValueError(f"Can't encode {upload_format!r} (is soundfile installed?)")
+        self.container, self.subtype, self.content_type = ENCODINGS[upload_format]
+        self.rate = rate
+        self.channels = channels
+        self.pcm_bytes = 0
+        self.error = None
+
+        self.output = io.BytesIO()
+        self.chunks = queue.Queue()
+        self.thread = threading.Thread(target=self._encode, name='audio-encoder', daemon=True)
+        self.thread.start()
+
+    def feed(self, chunk):
+        """Queue a PCM chunk (bytes-like); None marks the end of the recording"""
+        self.chunks.put(chunk)
+
+    def result(self, timeout=None):
+        """Wait for the encoder to drain and return the compressed bytes (None on failure)"""
+        self.thread.join(timeout)
+        if self.thread.is_alive() or self.error is not None:
+            return None
+        return self.output.getvalue()
+
+    def _encode(self):
+        try:
+            with soundfile.SoundFile(self.output, 'w', self.rate, self.channels, self.subtype,
+                                     format=self.container) as encoded:
+                while True:
+                    chunk = self.chunks.get()
+                    if chunk is None:
+                        break
+                    encoded.buffer_write(chunk, dtype='int16')
+                    self.pcm_bytes += len(chunk)
+        except Exception as e:
+            print(f"Error encoding audio for upload: {e}")
+            self.error = e
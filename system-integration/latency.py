@@ -0,0 +1,92 @@
+"""
+Client-side latency spans for one dictation.
+
+DictationTimer records each stage from hotkey press to insertion: capture
+(holding the hotkey), flushing streamed chunks, waiting for the compressed
+upload, the backend request up to the raw text, waiting for the cleaned
+text, and the paste itself. The backend's own per-stage `timings` are kept
+alongside, so request time splits into server time and network/upload time.
+"""
+import time
+from contextlib import contextmanager
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+class DictationTimer:
+    """Stage durations of a single dictation"""
+
+    def __init__(self):
+        self.pressed = time.perf_counter()
+        self.released = None
+        self.finished = None
+        self.stages = {}          # stage -> seconds, in the order they ran
+        self.running = {}         # stage -> start time, for begin()/end()
+        self.server = {}          # Latest backend `timings` (ms)
+        self.server_at_response_ms = None  # Backend total when the request span ended
+
+    def release(self):
+        """Hotkey released: capture ends, the wait for text begins"""
+        self.released = time.perf_counter()
+        self.stages['capture'] = self.released - self.pressed
+
+    @contextmanager
+    def span(self, stage):
+        self.begin(stage)
+        try:
+            yield
+        finally:
+            self.end(stage)
+
+    def begin(self, stage):
+        self.running[stage] = time.perf_counter()
+
+    def end(self, stage):
+        started = self.running.pop(stage, None)
+        if started is not None:
+            self.stages[stage] = self.stages.get(stage, 0.0) + time.perf_counter() - started
+
+    def server_timings(self, timings, response=False):
+        """Record backend timings; response=True when they arrived with the end of the request span"""
+        if timings:
+            self.server = timings
+            if response:
+                self.server_at_response_ms = timings.get('total_ms')
+
+    def finish(self):
+        self.finished = time.perf_counter()
+        return self.timings()
+
+    def timings(self):
+        """Client stages in ms, plus server time, network/upload time and release-to-insert latency"""
+        report = {f'{stage}_ms': _ms(seconds) for stage, seconds in self.stages.items()}
+        if 'request' in self.stages and self.server_at_response_ms is not None:
+            report['server_ms'] = self.server_at_response_ms
+            report['network_ms'] = round(max(0.0, report['request_ms'] - self.server_at_response_ms), 1)
+        if self.released is not None:
+            report['release_to_insert_ms'] = _ms((self.finished or time.perf_counter()) - self.released)
+        return report
+
+    def summary(self):
+        """One-line human-readable report, with the backend's stages on a second line"""
+        report = self.timings()
+        parts = []
+        for key, value in report.items():
+            label = key[:-3].replace('_', ' ')
+            if key == 'capture_ms':
+                parts.append(f"{label} {value / 1000:.2f}s")
+            elif key not in ('server_ms', 'network_ms'):
+                parts.append(f"{label} {value:.0f} ms")
+            if key == 'request_ms' and 'server_ms' in report:
+                parts[-1] += f" (server {report['server_ms']:.0f} ms, network {report['network_ms']:.0f} ms)"
+        lines = ["⏱️ " + " | ".join(parts)]
+        server_stages = [f"{key[:-3]} {value:.0f}" for key, value in self.server.items()
+                         if key.endswith('_ms') and key != 'total_ms']
+        if server_stages:
+            line = "   server ms: " + ", ".join(server_stages)
+            if 'rtf' in self.server:
+                line += f" (RTF {self.server['rtf']})"
+            lines.append(line)
+        return "\n".join(lines)
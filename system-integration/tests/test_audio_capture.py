@@ -0,0 +1,84 @@
+"""CaptureEngine pre-roll, chunking and ring wrap-around, driven by FakeAudioSource"""
+import array
+import time
+
+import pytest
+
+from audio_capture import CaptureEngine, FakeAudioSource
+
+RATE = 1000  # Small rate so buffer sizes stay readable: 2000 bytes per second
+
+
+def counting_pcm(samples):
+    """16-bit PCM whose sample i has the value i (mod 2**15), so gaps and repeats are visible"""
+    return array.array('h', (i % 32768 for i in range(samples))).tobytes()
+
+
+def samples(data):
+    return list(array.array('h', bytes(data)))
+
+
+def feed(engine, frames):
+    """Run the capture loop by hand: one read of `frames` from the source into the ring"""
+    engine._write(engine.source.read(frames))
+
+
+def make_engine(pcm_samples, **kwargs):
+    source = FakeAudioSource(counting_pcm(pcm_samples), rate=RATE, realtime=False)
+    return CaptureEngine(source, chunk_frames=100, **kwargs)
+
+
+def test_recording_includes_preroll_before_begin():
+    engine = make_engine(10000, preroll_seconds=0.3, max_record_seconds=5)
+    feed(engine, 1000)  # One second before the keypress
+    engine.begin()
+    feed(engine, 500)
+    recording = samples(engine.end())
+    assert recording == list(range(700, 1500))  # 300 ms pre-roll + everything after begin()
+
+
+def test_streamed_chunks_add_up_to_the_recording():
+    engine = make_engine(10000, preroll_seconds=0.1, max_record_seconds=5)
+    feed(engine, 400)
+    chunks = []
+    engine.begin(on_chunk=lambda chunk: chunks.append(None if chunk is None else bytes(chunk)), chunk_seconds=0.25)
+    for _ in range(7):
+        feed(engine, 100)
+    recording = bytes(engine.end())
+    assert chunks[-1] is None
+    assert b''.join(chunks[:-1]) == recording
+    assert all(len(chunk) >= 500 for chunk in chunks[:-2])  # At least 0.25 s each, remainder last
+
+
+def test_slices_stay_contiguous_across_the_ring_wrap():
+    engine = make_engine(100000, preroll_seconds=0, max_record_seconds=1)  # 1000-sample ring
+    feed(engine, 1700)  # Write position now sits mid-ring
+    engine.begin()
+    feed(engine, 800)  # Recording wraps past the end of the ring
+    assert samples(engine.end()) == list(range(1700, 2500))
+
+
+def test_overlong_recording_keeps_its_most_recent_audio():
+    engine = make_engine(100000, preroll_seconds=0, max_record_seconds=1)
+    engine.begin()
+    for _ in range(25):
+        feed(engine, 100)
+    assert samples(engine.end()) == list(range(1500, 2500))
+    with pytest.raises(ValueError):
+        engine._slice(0, 100)
+
+
+def test_capture_thread_records_from_a_paced_source():
+    source = FakeAudioSource(counting_pcm(RATE * 10), rate=RATE, realtime=True)
+    engine = CaptureEngine(source, chunk_frames=50, preroll_seconds=0.2, max_record_seconds=5)
+    engine.start()
+    try:
+        time.sleep(0.5)
+        engine.begin()
+        time.sleep(0.3)
+        recording = samples(engine.end())
+    finally:
+        engine.close()
+    # Pre-roll plus ~0.3 s, with consecutive samples and nothing dropped in between
+    assert len(recording) >= 400
+    assert recording == list(range(recording[0], recording[0] + len(recording)))
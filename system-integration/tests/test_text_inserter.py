@@ -0,0 +1,101 @@
+"""Inserter backends: the recording inserter, and ClipboardInserter with in-memory clipboard and keystrokes"""
+import time
+
+import pytest
+
+pytest.importorskip('pyperclip')  # text_inserter's default clipboard backend
+
+from text_inserter import ClipboardInserter, RecordingInserter, create_inserter
+
+
+class MemoryClipboard:
+    """Clipboard whose writes only become visible after `lag` reads, like a slow pasteboard"""
+    name = "memory"
+
+    def __init__(self, text='', lag=0):
+        self.text = text
+        self.pending = None
+        self.lag = lag
+        self.reads = 0
+
+    def get(self):
+        self.reads += 1
+        if self.pending is not None and self.reads > self.lag:
+            self.text, self.pending = self.pending, None
+        return self.text
+
+    def set(self, text):
+        if self.lag:
+            self.pending = text
+        else:
+            self.text = text
+
+
+class Keystroke:
+    def __init__(self, name, fails=False):
+        self.name = name
+        self.fails = fails
+        self.sent = 0
+
+    def send(self):
+        self.sent += 1
+        if self.fails:
+            raise RuntimeError(f"{self.name} unavailable")
+
+
+def test_recording_inserter_records_instead_of_typing():
+    inserter = create_inserter('recording')
+    assert isinstance(inserter, RecordingInserter)
+    before = time.monotonic()
+    assert inserter.insert('Hello world.') is True
+    assert [text for _, text in inserter.inserted] == ['Hello world.']
+    assert inserter.inserted[0][0] >= before
+
+
+def test_unknown_inserter_is_rejected():
+    with pytest.raises(ValueError):
+        create_inserter('telepathy')
+
+
+def test_clipboard_inserter_falls_back_to_the_next_keystroke():
+    failing, working = Keystroke('quartz', fails=True), Keystroke('pynput')
+    clipboard = MemoryClipboard()
+    inserter = ClipboardInserter(clipboard, [failing, working])
+    assert inserter.insert('Dictated text.') is True
+    assert (failing.sent, working.sent) == (1, 1)
+    assert clipboard.text == 'Dictated text.'
+
+
+def test_clipboard_inserter_waits_for_a_lagging_clipboard():
+    clipboard = MemoryClipboard(lag=3)
+    keystroke = Keystroke('pynput')
+    inserter = ClipboardInserter(clipboard, [keystroke], ready_timeout=1.0)
+    inserter.insert('Slow pasteboard.')
+    assert clipboard.text == 'Slow pasteboard.'
+    assert keystroke.sent == 1
+
+
+def test_clipboard_is_restored_after_the_paste():
+    clipboard = MemoryClipboard('what the user had copied')
+    inserter = ClipboardInserter(clipboard, [Keystroke('pynput')], restore_delay=0.05)
+    inserter.insert('Dictated text.', restore_clipboard='what the user had copied')
+    assert clipboard.text == 'Dictated text.'
+    time.sleep(0.2)
+    assert clipboard.text == 'what the user had copied'
+
+
+def test_clipboard_copied_meanwhile_is_not_overwritten():
+    clipboard = MemoryClipboard('original')
+    inserter = ClipboardInserter(clipboard, [Keystroke('pynput')], restore_delay=0.1)
+    inserter.insert('Dictated text.', restore_clipboard='original')
+    clipboard.set('copied by the user')
+    time.sleep(0.25)
+    assert clipboard.text == 'copied by the user'
+
+
+def test_text_is_left_on_the_clipboard_when_no_keystroke_works():
+    clipboard = MemoryClipboard('original')
+    inserter = ClipboardInserter(clipboard, [Keystroke('quartz', fails=True)], restore_delay=0.05)
+    assert inserter.insert('Paste me manually.', restore_clipboard='original') is False
+    time.sleep(0.15)
+    assert clipboard.text == 'Paste me manually.'
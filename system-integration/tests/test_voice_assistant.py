@@ -0,0 +1,65 @@
+"""Capture and upload format negotiation with the backend"""
+import pytest
+
+pytest.importorskip('pynput')  # voice_assistant's hotkey listener
+pytest.importorskip('pyperclip')
+
+import voice_assistant
+from voice_assistant import VoiceAssistant
+
+CAPTURE_FORMAT = {
+    'success': True,
+    'preferred': {'encoding': 'pcm', 'sample_rate': 16000, 'content_type': 'audio/pcm'},
+    'alternatives': [{'encoding': 'opus', 'container': 'webm', 'sample_rate': 48000}],
+    'slow_link_kbps': 1000
+}
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+class FakeHttp:
+    def __init__(self, body):
+        self.body = body
+
+    def get(self, url, timeout=None):
+        return FakeResponse(self.body)
+
+
+def negotiated(monkeypatch, body, uplink_kbps=None, encodable=True):
+    # Skip __init__: it opens the microphone
+    assistant = VoiceAssistant.__new__(VoiceAssistant)
+    assistant.http = FakeHttp(body)
+    assistant.capture_format_url = 'http://backend/capture-format'
+    assistant.RATE = 16000
+    assistant.UPLOAD_FORMAT = 'pcm'
+    assistant.UPLINK_KBPS = uplink_kbps
+    monkeypatch.setattr(voice_assistant, 'encoding_available', lambda encoding: encodable and encoding == 'opus')
+    assistant._negotiate_capture_format()
+    return assistant.UPLOAD_FORMAT
+
+
+def test_uploads_in_the_preferred_format(monkeypatch):
+    assert negotiated(monkeypatch, CAPTURE_FORMAT) == 'pcm'
+    assert negotiated(monkeypatch, CAPTURE_FORMAT, uplink_kbps=50000) == 'pcm'
+
+
+def test_backend_preferring_opus_gets_opus(monkeypatch):
+    body = dict(CAPTURE_FORMAT, preferred=CAPTURE_FORMAT['alternatives'][0],
+                alternatives=[CAPTURE_FORMAT['preferred']])
+    assert negotiated(monkeypatch, body) == 'opus'
+
+
+def test_slow_link_uses_the_compressed_alternative(monkeypatch):
+    assert negotiated(monkeypatch, CAPTURE_FORMAT, uplink_kbps=300) == 'opus'
+
+
+def test_falls_back_to_pcm_without_an_encoder(monkeypatch):
+    assert negotiated(monkeypatch, CAPTURE_FORMAT, uplink_kbps=300, encodable=False) == 'pcm'
@@ -0,0 +1,233 @@
+"""
+Text insertion backends for the voice assistant.
+
+The default ClipboardInserter puts the text on the clipboard and sends a paste
+keystroke. Both steps run in-process when possible (NSPasteboard and Quartz
+events via PyObjC, or pynput), with osascript only as the last resort, and
+the clipboard is polled with a short backoff instead of fixed sleeps. The
+user's previous clipboard is restored on a background timer once the target
+app has had time to read the paste.
+
+TypingInserter types the text as keystrokes without touching the clipboard,
+and RecordingInserter only records what would have been inserted, so the
+pipeline can be tested and timed on machines without a GUI.
+"""
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    from AppKit import NSPasteboard, NSPasteboardTypeString
+except ImportError:  # PyObjC is optional; pyperclip shells out to pbcopy/pbpaste instead
+    NSPasteboard = None
+
+try:
+    import Quartz
+except ImportError:
+    Quartz = None
+
+import pyperclip
+
+V_KEYCODE = 9  # macOS virtual key code for "v"
+
+
+# ------------------------------------------------------------------ clipboard
+
+class PyperclipClipboard:
+    name = "pyperclip"
+
+    def get(self):
+        return pyperclip.paste()
+
+    def set(self, text):
+        pyperclip.copy(text)
+
+
+class AppKitClipboard:
+    """NSPasteboard in-process: no pbcopy/pbpaste subprocess per access"""
+    name = "appkit"
+
+    def __init__(self):
+        self.pasteboard = NSPasteboard.generalPasteboard()
+
+    def get(self):
+        return self.pasteboard.stringForType_(NSPasteboardTypeString) or ""
+
+    def set(self, text):
+        self.pasteboard.clearContents()
+        self.pasteboard.setString_forType_(text, NSPasteboardTypeString)
+
+
+def default_clipboard():
+    return AppKitClipboard() if NSPasteboard is not None else PyperclipClipboard()
+
+
+# ------------------------------------------------------------ paste keystrokes
+
+class QuartzPaste:
+    """Posts Cmd+V as CoreGraphics events (in-process, macOS)"""
+    name = "quartz"
+
+    def __init__(self):
+        if Quartz is None:
+            raise RuntimeError("Quartz (pyobjc-framework-Quartz) is not installed")
+
+    def send(self):
+        for key_down in (True, False):
+            event = Quartz.CGEventCreateKeyboardEvent(None, V_KEYCODE, key_down)
+            Quartz.CGEventSetFlags(event, Quartz.kCGEventFlagMaskCommand)
+            Quartz.CGEventPost(Quartz.kCGHIDEventTap, event)
+
+
+class PynputPaste:
+    """Sends the platform's paste shortcut through pynput (in-process)"""
+    name = "pynput"
+
+    def __init__(self):
+        from pynput.keyboard import Controller, Key
+        self.keyboard = Controller()
+        self.modifier = Key.cmd if sys.platform == "darwin" else Key.ctrl
+
+    def send(self):
+        with self.keyboard.pressed(self.modifier):
+            self.keyboard.tap('v')
+
+
+class AppleScriptPaste:
+    """Cmd+V through System Events; spawns osascript, so only used as a fallback"""
+    name = "applescript"
+
+    SCRIPT = '''
+    tell application "System Events"
+        keystroke "v" using command down
+    end tell
+    '''
+
+    def send(self):
+        result = subprocess.run(['osascript', '-e', self.SCRIPT], capture_output=True, text=True, timeout=5)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or f"osascript exited with {result.returncode}")
+
+
+def available_paste_keystrokes():
+    """Paste senders usable here, fastest first"""
+    candidates = [QuartzPaste, PynputPaste, AppleScriptPaste] if sys.platform == "darwin" else [PynputPaste]
+    senders = []
+    for candidate in candidates:
+        try:
+            senders.append(candidate())
+        except Exception as e:
+            print(f"Paste via {candidate.name} unavailable: {e}")
+    return senders
+
+
+# ------------------------------------------------------------------ inserters
+
+class TextInserter:
+    """Inserts text into whatever field currently has focus"""
+    name = "base"
+
+    def insert(self, text, restore_clipboard=None):
+        """Insert text; restore_clipboard, if given, is put back on the clipboard afterwards.
+
+        Returns True if the text was inserted (False means it was left on the
+        clipboard for a manual paste).
+        """
+        raise NotImplementedError
+
+
+class ClipboardInserter(TextInserter):
+    """Clipboard + paste keystroke, with adaptive readiness checks"""
+    name = "clipboard"
+
+    def __init__(self, clipboard=None, keystrokes=None, ready_timeout=0.3, restore_delay=0.5):
+        self.clipboard = clipboard or default_clipboard()
+        self.keystrokes = available_paste_keystrokes() if keystrokes is None else keystrokes
+        self.ready_timeout = ready_timeout  # Max time to wait for the clipboard to hold our text
+        self.restore_delay = restore_delay  # Time the target app gets to read the paste
+
+    def _wait_for_clipboard(self, text):
+        """Poll until the clipboard holds text, backing off from 2 ms; False on timeout"""
+        deadline = time.monotonic() + self.ready_timeout
+        delay = 0.002
+        while True:
+            if self.clipboard.get() == text:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+            self.clipboard.set(text)
+
+    def insert(self, text, restore_clipboard=None):
+        self.clipboard.set(text)
+        if not self._wait_for_clipboard(text):
+            print("⚠️ Clipboard verification failed, pasting anyway...")
+
+        for keystroke in self.keystrokes:
+            try:
+                keystroke.send()
+            except Exception as e:
+                print(f"⚠️ Paste via {keystroke.name} failed: {e}")
+                continue
+            print(f"✅ Inserted via {keystroke.name}: {text}")
+            if restore_clipboard is not None:
+                self._restore_later(text, restore_clipboard)
+            return True
+
+        print(f"📋 Copied to clipboard (paste manually with Cmd+V): {text}")
+        print("💡 To enable auto-paste, grant 'Accessibility' permission to Terminal in System Preferences")
+        return False
+
+    def _restore_later(self, text, original):
+        def restore():
+            try:
+                # Leave the clipboard alone if the user copied something else meanwhile
+                if self.clipboard.get() == text:
+                    self.clipboard.set(original)
+            except Exception as e:
+                print(f"Error restoring clipboard: {e}")
+
+        timer = threading.Timer(self.restore_delay, restore)
+        timer.daemon = True
+        timer.start()
+
+
+class TypingInserter(TextInserter):
+    """Types the text as key events (pynput); leaves the clipboard untouched"""
+    name = "type"
+
+    def __init__(self):
+        from pynput.keyboard import Controller
+        self.keyboard = Controller()
+
+    def insert(self, text, restore_clipboard=None):
+        self.keyboard.type(text)
+        print(f"✅ Typed: {text}")
+        return True
+
+
+class RecordingInserter(TextInserter):
+    """Records insertions instead of performing them (tests and benchmarks)"""
+    name = "recording"
+
+    def __init__(self):
+        self.inserted = []  # [(monotonic time, text)]
+
+    def insert(self, text, restore_clipboard=None):
+        self.inserted.append((time.monotonic(), text))
+        return True
+
+
+INSERTERS = {
+    'clipboard': ClipboardInserter,
+    'type': TypingInserter,
+    'recording': RecordingInserter,
+}
+
+
+def create_inserter(name='clipboard'):
+    if name not in INSERTERS:
+        raise ValueError(f"Unknown inserter {name!r}; choose from {', '.join(INSERTERS)}")
+    return INSERTERS[name]()
@@ -5,39 +5,106 @@ Listens for fn key press, records audio, transcribes with Whisper + DeepSeek,
 and injects cleaned text into any focused text field (iMessage, etc.)
 """
 
-import pyaudio
-import wave
-import requests
-import tempfile
 import os
+import requests
 import threading
-import time
 import pyperclip
 from pynput import keyboard
 from pynput.keyboard import Key
-import subprocess
 import uuid
+import queue
+import json
+
+from audio_capture import CaptureEngine, PyAudioSource
+from audio_encoder import ChunkedEncoder, encoding_available
+from latency import DictationTimer
+from text_inserter import create_inserter
 
 class VoiceAssistant:
     def __init__(self):
         self.is_recording = False
-        self.audio_frames = []
-        self.audio_stream = None
-        self.pyaudio_instance = None
+        self.audio_data = None
         self.backend_url = "http://localhost:5001/transcribe"
+        self.stream_url = "http://localhost:5001/transcribe/stream"
+        self.capture_format_url = "http://localhost:5001/capture-format"
+        self.SOURCE = "voice_assistant"  # History label for dictations stored by /transcribe
+        # One keep-alive connection pool for every backend call
+        self.http = requests.Session()
+        # Proves to the backend that dictations may use the hotkey admission class
+        if os.environ.get('ADMISSION_HOTKEY_TOKEN'):
+            self.http.headers['X-Client-Token'] = os.environ['ADMISSION_HOTKEY_TOKEN']
+        self.use_streaming = True  # Upload audio while recording so only the tail is decoded on release
         self.current_session_id = None
         self.transcription_ready = False
         
         # Audio settings optimized for speed
         self.CHUNK = 512  # Smaller chunks for faster processing
-        self.FORMAT = pyaudio.paInt16
         self.CHANNELS = 1
-        self.RATE = 8000  # Lower sample rate for faster processing
+        self.RATE = 16000  # Whisper's input rate, so the backend needn't resample (see _negotiate_capture_format)
+        self.PREROLL_SECONDS = 0.3  # Audio kept from just before the hotkey press
+        self.MAX_RECORDING_SECONDS = 120  # Ring buffer size; longer recordings lose their start
+        self.STREAM_CHUNK_SECONDS = 0.5  # How much audio to batch into each streamed upload
+        self.MIN_RECORDING_SECONDS = 0.3  # Shorter hotkey taps are treated as accidental
+        self.SILENCE_PEAK = 500  # Recordings whose 16-bit peak stays below this are silent
+        # Seconds to wait for DeepSeek after the raw Whisper text arrives before pasting
+        # the raw text instead (None = always wait for the cleaned text)
+        self.CLEANUP_WAIT_SECONDS = 1.5
+        # Whole-recording uploads: pcm, or opus (needs soundfile) to cut upload size on a
+        # slow link; picked by _negotiate_capture_format. Encoding happens while recording.
+        self.UPLOAD_FORMAT = "pcm"
+        # Uplink speed in kbps, compared with the backend's slow_link_kbps (unset = fast)
+        self.UPLINK_KBPS = float(os.environ.get('VOICE_ASSISTANT_UPLINK_KBPS', 0)) or None
+        self.stream_queue = None
+        self.stream_session_id = None
+        self.encoder = None
+        # How text reaches the focused field: "clipboard" (paste), "type" (keystrokes)
+        # or "recording" (no-op, for tests and benchmarks)
+        self.inserter = create_inserter("clipboard")
+        # Per-stage latency of the current dictation (printed after each insert)
+        self.timer = DictationTimer()
+        self.last_timings = None
+        
+        self._negotiate_capture_format()
+        
+        # The microphone stays open so a recording starts instantly (with pre-roll)
+        self.capture = CaptureEngine(
+            PyAudioSource(self.RATE, self.CHANNELS, self.CHUNK),
+            chunk_frames=self.CHUNK,
+            preroll_seconds=self.PREROLL_SECONDS,
+            max_record_seconds=self.MAX_RECORDING_SECONDS
+        )
+        self.capture.start()
         
         print("🎤 Voice Assistant started!")
         print("Press and hold Cmd+Shift+V to record, release to transcribe")
         print("Text will be inserted into any focused text field")
         
+    def _negotiate_capture_format(self):
+        """Record and upload in the format the backend asks for (keeps the defaults if it's unreachable).
+        
+        Records PCM at the backend's sample rate and uploads in its preferred
+        encoding, or in its compressed alternative when UPLINK_KBPS is below
+        slow_link_kbps, like the web app.
+        """
+        try:
+            response = self.http.get(self.capture_format_url, timeout=2)
+            if response.status_code != 200:
+                return
+            result = response.json()
+            formats = [result.get('preferred', {})] + result.get('alternatives', [])
+            pcm = next((fmt for fmt in formats if fmt.get('encoding') == 'pcm'), None)
+            if pcm is not None:
+                self.RATE = int(pcm.get('sample_rate', self.RATE))
+            # The backend sniffs the container, so opus is sent in Ogg (what soundfile writes)
+            usable = [fmt.get('encoding') for fmt in formats
+                      if fmt.get('encoding') == 'pcm' or encoding_available(fmt.get('encoding'))]
+            slow_link = self.UPLINK_KBPS is not None and self.UPLINK_KBPS < result.get('slow_link_kbps', 0)
+            compressed = next((encoding for encoding in usable if encoding != 'pcm'), None)
+            self.UPLOAD_FORMAT = (compressed if slow_link else None) or (usable[0] if usable else 'pcm')
+            print(f"🎚️ Capture format: {self.RATE} Hz mono 16-bit PCM, uploaded as {self.UPLOAD_FORMAT}")
+        except Exception as e:
+            print(f"Capture format negotiation failed, recording at {self.RATE} Hz: {e}")
+    
     def start_recording(self):
         """Start recording audio"""
         if self.is_recording:
@@ -45,7 +112,8 @@ class VoiceAssistant:
             
         try:
             self.is_recording = True
-            self.audio_frames = []
+            self.timer = DictationTimer()
+            self.audio_data = None
             self.transcription_ready = False
             self.current_session_id = str(uuid.uuid4())
             
@@ -56,37 +124,62 @@ class VoiceAssistant:
             print("🧹 Clearing clipboard...")
             pyperclip.copy("")
             
-            # Initialize PyAudio
-            self.pyaudio_instance = pyaudio.PyAudio()
+            # Stream chunks to the backend while recording
+            if self.use_streaming:
+                self.stream_queue = queue.Queue()
+                self.stream_session_id = None
+                self.stream_thread = threading.Thread(target=self._stream_audio, args=(self.stream_queue,))
+                self.stream_thread.start()
+            
+            # Compress in the background as audio comes in, in case the whole recording is uploaded
+            self.encoder = None
+            if self.UPLOAD_FORMAT != "pcm" and encoding_available(self.UPLOAD_FORMAT):
+                self.encoder = ChunkedEncoder(self.UPLOAD_FORMAT, self.RATE, self.CHANNELS)
+            consumers = [q.put for q in (self.stream_queue,) if q is not None]
+            if self.encoder is not None:
+                consumers.append(self.encoder.feed)
             
-            # Start recording stream
-            self.audio_stream = self.pyaudio_instance.open(
-                format=self.FORMAT,
-                channels=self.CHANNELS,
-                rate=self.RATE,
-                input=True,
-                frames_per_buffer=self.CHUNK
+            def on_chunk(chunk):
+                for consume in consumers:
+                    consume(chunk)
+            
+            # The capture engine is already running; just mark where this recording begins
+            self.capture.begin(
+                on_chunk=on_chunk if consumers else None,
+                chunk_seconds=self.STREAM_CHUNK_SECONDS
             )
             
             print("🔴 Recording... (release keys to stop)")
             
-            # Record in a separate thread
-            self.record_thread = threading.Thread(target=self._record_audio)
-            self.record_thread.start()
-            
         except Exception as e:
             print(f"Error starting recording: {e}")
             self.is_recording = False
     
-    def _record_audio(self):
-        """Record audio frames"""
-        while self.is_recording:
-            try:
-                data = self.audio_stream.read(self.CHUNK, exception_on_overflow=False)
-                self.audio_frames.append(data)
-            except Exception as e:
-                print(f"Error recording audio: {e}")
-                break
+    def _stream_audio(self, chunks):
+        """Open a streaming session and upload chunks as they are recorded"""
+        try:
+            response = self.http.post(self.stream_url, params={'source': self.SOURCE}, json={
+                'format': 'pcm',
+                'sample_rate': self.RATE
+            }, timeout=5)
+            if response.status_code != 200:
+                print(f"Streaming unavailable ({response.status_code}), will upload on release")
+                return
+            stream_session_id = response.json()['session_id']
+            
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    break
+                response = self.http.post(f"{self.stream_url}/{stream_session_id}", data=chunk,
+                                          headers={'Content-Type': 'application/octet-stream'}, timeout=5)
+                if response.status_code != 200:
+                    print(f"Streaming chunk rejected ({response.status_code}), will upload on release")
+                    return
+            
+            self.stream_session_id = stream_session_id
+        except Exception as e:
+            print(f"Streaming error, will upload on release: {e}")
     
     def stop_recording(self):
         """Stop recording and process transcription"""
@@ -98,25 +191,28 @@ class VoiceAssistant:
         print("⏹️ Recording stopped, processing...")
         
         try:
-            # Wait for recording thread to finish
-            if hasattr(self, 'record_thread'):
-                self.record_thread.join()
+            # Zero-copy view of the recording (plus pre-roll) in the capture ring buffer
+            self.audio_data = self.capture.end()
+            self.timer.release()
             
-            # Clean up audio stream
-            if self.audio_stream:
-                self.audio_stream.stop_stream()
-                self.audio_stream.close()
-            if self.pyaudio_instance:
-                self.pyaudio_instance.terminate()
+            # Wait for streamed chunks to finish uploading
+            if self.stream_queue is not None:
+                with self.timer.span('flush'):
+                    self.stream_thread.join()
+                self.stream_queue = None
             
-            # Save audio to temporary file
-            if self.audio_frames:
-                temp_file = self._save_audio_to_file()
-                if temp_file:
-                    # Send to backend for transcription
-                    self._transcribe_and_insert(temp_file, session_id)
-                    # Clean up temp file
-                    os.unlink(temp_file)
+            if self.audio_data and not self._has_speech():
+                # Empty tap or silence: don't spend a backend round-trip on it
+                print("🔇 No speech detected, skipping transcription")
+                if hasattr(self, 'original_clipboard'):
+                    pyperclip.copy(self.original_clipboard)
+                    print("📋 Restored original clipboard content")
+            elif self.audio_data and self.stream_session_id:
+                # Backend already has the audio; only the tail needs decoding
+                self._finish_stream_and_insert(self.stream_session_id, session_id)
+            elif self.audio_data:
+                # Upload the whole recording (compressed if an encoder ran, else raw PCM)
+                self._transcribe_and_insert(self.audio_data, session_id)
             else:
                 print("No audio recorded")
                 # Restore original clipboard content
@@ -131,90 +227,151 @@ class VoiceAssistant:
                 pyperclip.copy(self.original_clipboard)
                 print("📋 Restored original clipboard content on error")
     
-    def _save_audio_to_file(self):
-        """Save recorded audio frames to a temporary WAV file"""
-        try:
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-            
-            with wave.open(temp_file.name, 'wb') as wf:
-                wf.setnchannels(self.CHANNELS)
-                wf.setsampwidth(self.pyaudio_instance.get_sample_size(self.FORMAT))
-                wf.setframerate(self.RATE)
-                wf.writeframes(b''.join(self.audio_frames))
-            
-            return temp_file.name
-        except Exception as e:
-            print(f"Error saving audio file: {e}")
-            return None
+    def _has_speech(self):
+        """Cheap check that the recording is long and loud enough to contain speech"""
+        samples = self.audio_data.cast('h')
+        if len(samples) < self.RATE * (self.MIN_RECORDING_SECONDS + self.PREROLL_SECONDS):
+            return False
+        return max(max(samples), -min(samples)) >= self.SILENCE_PEAK
     
-    def _transcribe_and_insert(self, audio_file_path, session_id):
+    def _transcribe_and_insert(self, pcm_data, session_id):
         """Send audio to backend and insert cleaned text"""
         try:
             print("🔄 Transcribing with Whisper + DeepSeek...")
             
-            # Send audio to our backend
-            with open(audio_file_path, 'rb') as audio_file:
-                files = {'audio': audio_file}
-                response = requests.post(self.backend_url, files=files, timeout=30)
+            # Raw 16-bit PCM unless the encoder has a compressed copy ready; the
+            # sample rate travels in a header. The backend stores the result itself,
+            # once per session ID, so a retry after a dropped connection can't
+            # create a duplicate history entry.
+            data, content_type = pcm_data, 'audio/pcm'
+            with self.timer.span('encode'):
+                encoded = self.encoder.result(timeout=5) if self.encoder is not None else None
+            if encoded:
+                print(f"🗜️ {self.UPLOAD_FORMAT}: {len(pcm_data) // 1024} KB -> {len(encoded) // 1024} KB")
+                data, content_type = encoded, self.encoder.content_type
+            headers = {
+                'Content-Type': content_type,
+                'X-Sample-Rate': str(self.RATE),
+                'Accept': 'application/x-ndjson',  # Raw text first, cleaned text when ready
+                'Idempotency-Key': session_id,
+                'X-Request-Timeout': '30'  # Not worth transcribing once we've given up waiting
+            }
+            self.timer.begin('request')
+            try:
+                response = self.http.post(self.backend_url, params={'source': self.SOURCE}, data=data,
+                                          headers=headers, stream=True, timeout=30)
+            except requests.ConnectionError as e:
+                print(f"Connection to backend failed ({e}), retrying once...")
+                response = self.http.post(self.backend_url, params={'source': self.SOURCE}, data=data,
+                                          headers=headers, stream=True, timeout=30)
             
-            if response.status_code == 200:
+            self._handle_transcription_response(response, session_id)
+                
+        except Exception as e:
+            print(f"Error during transcription: {e}")
+            # Restore original clipboard content
+            if hasattr(self, 'original_clipboard'):
+                pyperclip.copy(self.original_clipboard)
+                print("📋 Restored original clipboard content")
+    
+    def _finish_stream_and_insert(self, stream_session_id, session_id):
+        """Finish a streaming session and insert cleaned text"""
+        try:
+            print("🔄 Finishing streamed transcription...")
+            self.timer.begin('request')
+            response = self.http.post(f"{self.stream_url}/{stream_session_id}/finish",
+                                      params={'source': self.SOURCE},
+                                      headers={'Accept': 'application/x-ndjson', 'Idempotency-Key': session_id,
+                                               'X-Request-Timeout': '30'},
+                                      stream=True, timeout=30)
+            self._handle_transcription_response(response, session_id)
+        
+        except Exception as e:
+            print(f"Error during transcription: {e}")
+            # Restore original clipboard content
+            if hasattr(self, 'original_clipboard'):
+                pyperclip.copy(self.original_clipboard)
+                print("📋 Restored original clipboard content")
+    
+    def _wait_for_cleaned(self, response):
+        """Read a two-phase response, falling back to the raw text if cleanup is slow"""
+        events = queue.Queue()
+        
+        def read_events():
+            try:
+                for line in response.iter_lines():
+                    if line:
+                        events.put(json.loads(line))
+            except Exception as e:
+                print(f"Error reading transcription events: {e}")
+            finally:
+                events.put(None)
+        
+        threading.Thread(target=read_events, daemon=True).start()
+        
+        raw_event = events.get()
+        self.timer.end('request')
+        if raw_event is None:
+            return {'success': False, 'error': 'Backend closed the response early'}
+        self.timer.server_timings(raw_event.get('timings'), response=True)
+        raw_text = raw_event.get('raw_text', '')
+        if not raw_text:
+            return raw_event
+        print(f"🎤 Raw (early): {raw_text}")
+        
+        try:
+            with self.timer.span('cleanup_wait'):
+                cleaned_event = events.get(timeout=self.CLEANUP_WAIT_SECONDS)
+        except queue.Empty:
+            print(f"⏱️ Cleanup slower than {self.CLEANUP_WAIT_SECONDS}s, pasting raw Whisper text")
+            return {'success': True, 'raw_text': raw_text, 'cleaned_text': raw_text}
+        
+        if cleaned_event is not None:
+            self.timer.server_timings(cleaned_event.get('timings'))
+        if cleaned_event is None or not cleaned_event.get('success'):
+            return {'success': True, 'raw_text': raw_text, 'cleaned_text': raw_text}
+        return cleaned_event
+    
+    def _handle_transcription_response(self, response, session_id):
+        """Insert cleaned text from a backend transcription response"""
+        if response.status_code == 200:
+            if response.headers.get('Content-Type', '').startswith('application/x-ndjson'):
+                result = self._wait_for_cleaned(response)
+            else:
                 result = response.json()
-                if result.get('success'):
-                    cleaned_text = result.get('cleaned_text', '')
-                    raw_text = result.get('raw_text', '')
-                    
-                    print(f"🎤 Raw: {raw_text}")
-                    print(f"✨ Cleaned: {cleaned_text}")
-                    
-                    # Only proceed if this is still the current session
-                    if session_id == self.current_session_id:
-                        if cleaned_text:
-                            # Store transcription in backend for web interface
-                            self._store_in_backend(raw_text, cleaned_text)
-                            
-                            # Insert text into focused field
-                            self._insert_text(cleaned_text, session_id)
-                        else:
-                            print("No text transcribed")
-                            pyperclip.copy("")  # Clear placeholder
+                self.timer.end('request')
+                self.timer.server_timings(result.get('timings'), response=True)
+            if result.get('success'):
+                cleaned_text = result.get('cleaned_text', '')
+                raw_text = result.get('raw_text', '')
+                
+                print(f"🎤 Raw: {raw_text}")
+                print(f"✨ Cleaned: {cleaned_text}")
+                
+                # Only proceed if this is still the current session
+                if session_id == self.current_session_id:
+                    if cleaned_text:
+                        # Already stored by the backend; insert text into focused field
+                        self._insert_text(cleaned_text, session_id)
+                        self._report_latency()
                     else:
-                        print("🚫 Session outdated, skipping insertion")
+                        print("No text transcribed")
+                        pyperclip.copy("")  # Clear placeholder
                 else:
-                    print(f"Transcription failed: {result.get('error', 'Unknown error')}")
-                    # Restore original clipboard content
-                    if hasattr(self, 'original_clipboard'):
-                        pyperclip.copy(self.original_clipboard)
-                        print("📋 Restored original clipboard content")
+                    print("🚫 Session outdated, skipping insertion")
             else:
-                print(f"Backend error: {response.status_code}")
+                print(f"Transcription failed: {result.get('error', 'Unknown error')}")
                 # Restore original clipboard content
                 if hasattr(self, 'original_clipboard'):
                     pyperclip.copy(self.original_clipboard)
                     print("📋 Restored original clipboard content")
-                
-        except Exception as e:
-            print(f"Error during transcription: {e}")
+        else:
+            print(f"Backend error: {response.status_code}")
             # Restore original clipboard content
             if hasattr(self, 'original_clipboard'):
                 pyperclip.copy(self.original_clipboard)
                 print("📋 Restored original clipboard content")
     
-    def _store_in_backend(self, raw_text, cleaned_text):
-        """Store transcription in backend for web interface"""
-        try:
-            store_url = "http://localhost:5001/store-transcription"
-            data = {
-                'raw_text': raw_text,
-                'cleaned_text': cleaned_text
-            }
-            response = requests.post(store_url, json=data, timeout=5)
-            if response.status_code == 200:
-                print("📱 Stored in web interface")
-            else:
-                print(f"Failed to store in web interface: {response.status_code}")
-        except Exception as e:
-            print(f"Error storing in backend: {e}")
-    
     def _insert_text(self, text, session_id):
         """Insert text into the currently focused text field"""
         try:
@@ -229,77 +386,9 @@ class VoiceAssistant:
                 
             print(f"🔄 Preparing to insert: {text[:50]}{'...' if len(text) > 50 else ''}")
             
-            # Copy the new text to clipboard
-            pyperclip.copy(text)
-            
-            # Verify the clipboard contains our text before pasting
-            max_retries = 3
-            for attempt in range(max_retries):
-                time.sleep(0.1)  # Wait for clipboard to update
-                clipboard_content = pyperclip.paste()
-                if clipboard_content == text:
-                    print(f"✅ Clipboard verified: {text[:30]}{'...' if len(text) > 30 else ''}")
-                    break
-                else:
-                    print(f"🔄 Clipboard mismatch (attempt {attempt + 1}/{max_retries}), retrying...")
-                    pyperclip.copy(text)
-            else:
-                print("⚠️ Clipboard verification failed, pasting anyway...")
-            
-            # Final session check before pasting
-            if session_id != self.current_session_id:
-                print("🚫 Session changed during clipboard setup, aborting paste")
-                return
-            
-            # Brief delay before pasting to ensure clipboard is ready
-            time.sleep(0.2)
-            
-            # Try multiple methods to paste the text
-            paste_success = False
-            
-            # Method 1: AppleScript with better error handling
-            try:
-                applescript = '''
-                tell application "System Events"
-                    keystroke "v" using command down
-                end tell
-                '''
-                result = subprocess.run(['osascript', '-e', applescript], 
-                                      capture_output=True, text=True, timeout=5)
-                if result.returncode == 0:
-                    paste_success = True
-                    print(f"✅ Inserted via AppleScript: {text}")
-                else:
-                    print(f"⚠️ AppleScript failed: {result.stderr}")
-            except subprocess.TimeoutExpired:
-                print("⚠️ AppleScript timed out")
-            except Exception as e:
-                print(f"⚠️ AppleScript error: {e}")
-            
-            # Method 2: Alternative AppleScript approach
-            if not paste_success:
-                try:
-                    applescript2 = '''
-                    tell application "System Events"
-                        tell process (name of first process whose frontmost is true)
-                            keystroke "v" using command down
-                        end tell
-                    end tell
-                    '''
-                    result = subprocess.run(['osascript', '-e', applescript2], 
-                                          capture_output=True, text=True, timeout=5)
-                    if result.returncode == 0:
-                        paste_success = True
-                        print(f"✅ Inserted via AppleScript (method 2): {text}")
-                    else:
-                        print(f"⚠️ AppleScript method 2 failed: {result.stderr}")
-                except Exception as e:
-                    print(f"⚠️ AppleScript method 2 error: {e}")
-            
-            # Method 3: Fallback - just copy to clipboard with instructions
-            if not paste_success:
-                print(f"📋 Copied to clipboard (paste manually with Cmd+V): {text}")
-                print("💡 To enable auto-paste, grant 'Input Monitoring' permission to Terminal in System Preferences")
+            # Put the user's clipboard back once the paste has gone through
+            with self.timer.span('insert'):
+                self.inserter.insert(text, restore_clipboard=getattr(self, 'original_clipboard', None))
             
         except Exception as e:
             print(f"Error inserting text: {e}")
@@ -307,10 +396,15 @@ class VoiceAssistant:
             try:
                 pyperclip.copy(text)
                 print(f"📋 Copied to clipboard (paste manually with Cmd+V): {text}")
-                print("💡 To enable auto-paste, grant 'Input Monitoring' permission to Terminal in System Preferences")
+                print("💡 To enable auto-paste, grant 'Accessibility' permission to Terminal in System Preferences")
             except:
                 print("Failed to copy to clipboard")
 
+    def _report_latency(self):
+        """Print where the time went between the hotkey and the inserted text"""
+        self.last_timings = self.timer.finish()
+        print(self.timer.summary())
+
 def main():
     assistant = VoiceAssistant()
     recording_active = False
@@ -371,8 +465,11 @@ def main():
     print("\nListening for hotkeys...\n")
     
     # Start keyboard listener
-    with keyboard.Listener(on_press=on_key_press, on_release=on_key_release) as listener:
-        listener.join()
+    try:
+        with keyboard.Listener(on_press=on_key_press, on_release=on_key_release) as listener:
+            listener.join()
+    finally:
+        assistant.capture.close()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file